@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Online detection of unusually large expenses, per category.
+
+Each category keeps, in O(1) per insert:
+  * Welford mean / variance of log(amount)  (amounts are roughly log-normal)
+  * an EWMA mean / variance of log(amount), so recent habits count more
+  * a log-bucketed histogram (8 buckets per doubling) as a quantile sketch
+
+An expense is flagged when it is above the category's high quantile AND
+its z-score is high against either the long-run or the recent statistics.
+A category needs `min_count` expenses before anything in it is flagged.
+
+Batches (imports) are scanned in one pass: thresholds are computed once
+from the statistics as they stand before the batch, so each row costs a
+single comparison; the batch is then folded into the statistics per
+category (Chan's merge for Welford, the tail of the batch for the EWMA).
+"""
+from collections import Counter, deque
+import math
+
+STEPS = 8 # Sketch buckets per doubling of the amount (~9% relative error)
+
+
+class CategoryStats:
+    __slots__ = ("count", "mean", "m2", "ewma", "ewm_var", "sketch", "_threshold")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0 # Welford, over log(amount)
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.ewm_var = 0.0
+        self.sketch = Counter() # bucket -> count
+        self._threshold = None # (count when computed, quantile, amount)
+
+    def update(self, amount, alpha):
+        x = math.log(amount)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.count == 1:
+            self.ewma = x
+        else:
+            diff = x - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+        self.sketch[int(math.floor(math.log2(amount) * STEPS))] += 1
+
+    def merge(self, amounts, alpha):
+        """Folds a batch of amounts in (same result as update() per amount,
+        up to the EWMA forgetting anything older than ~300 rows)."""
+        logs = [math.log(amount) for amount in amounts]
+        n = len(logs)
+        if not n:
+            return
+        batch_mean = math.fsum(logs) / n
+        batch_m2 = math.fsum((x - batch_mean) ** 2 for x in logs)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.m2 += batch_m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        # EWMA weights decay by (1 - alpha) per row: only the batch's tail still matters
+        tail = logs[-int(math.log(1e-6) / math.log(1 - alpha)) - 1:]
+        if self.count == 0:
+            self.ewma = tail[0]
+        for x in tail:
+            diff = x - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+        self.count = total
+        log2 = math.log2
+        self.sketch.update(int(math.floor(log2(amount) * STEPS)) for amount in amounts)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def quantile(self, q):
+        """Approximate q-quantile of the amounts (upper edge of its bucket).
+        Cached until the category has grown by ~1/64th."""
+        cached = self._threshold
+        if cached is not None and cached[1] == q and self.count - cached[0] <= cached[0] >> 6:
+            return cached[2]
+        rank = q * self.count
+        seen = 0
+        value = 0.0
+        for bucket in sorted(self.sketch):
+            seen += self.sketch[bucket]
+            if seen >= rank:
+                value = 2 ** ((bucket + 1) / STEPS)
+                break
+        self._threshold = (self.count, q, value)
+        return value
+
+    def median(self):
+        return math.exp(self.mean)
+
+
+class Anomaly:
+    __slots__ = ("expense", "category", "amount", "typical", "z", "recent_z", "quantile")
+
+    def __init__(self, expense, typical, z, recent_z, quantile):
+        self.expense = expense
+        self.category = expense["category"]
+        self.amount = expense["amount"]
+        self.typical = typical # Geometric mean of the category, i.e. a "usual" amount
+        self.z = z
+        self.recent_z = recent_z
+        self.quantile = quantile
+
+    def describe(self):
+        return (f"'{self.expense['name']}' ₹{self.amount:.2f} is {self.amount / self.typical:.1f}x a typical "
+                f"{self.category} expense (₹{self.typical:.2f})")
+
+
+class AnomalyDetector:
+    def __init__(self, z_threshold=3.0, quantile=0.995, min_count=20, alpha=0.05, keep=200):
+        self.z_threshold = z_threshold
+        self.quantile = quantile
+        self.min_count = min_count
+        self.alpha = alpha
+        self.stats = {} # category -> CategoryStats
+        self.flagged = deque(maxlen=keep) # Recent anomalies, newest last
+
+    def score(self, expense):
+        """Returns an Anomaly if `expense` is unusual for its category, else None."""
+        stats = self.stats.get(expense["category"])
+        amount = expense["amount"]
+        if stats is None or stats.count < self.min_count or amount <= 0:
+            return None
+        upper = stats.quantile(self.quantile)
+        if amount <= upper:
+            return None
+        x = math.log(amount)
+        std = stats.std
+        z = (x - stats.mean) / std if std else 0.0
+        recent_std = math.sqrt(stats.ewm_var)
+        recent_z = (x - stats.ewma) / recent_std if recent_std else 0.0
+        if z < self.z_threshold and recent_z < self.z_threshold:
+            return None
+        return Anomaly(expense, stats.median(), z, recent_z, upper)
+
+    def update(self, expense):
+        if expense["amount"] > 0:
+            stats = self.stats.get(expense["category"])
+            if stats is None:
+                stats = self.stats[expense["category"]] = CategoryStats()
+            stats.update(expense["amount"], self.alpha)
+
+    def observe(self, expense):
+        """Scores a new expense, then learns from it. Returns the Anomaly or None."""
+        anomaly = self.score(expense)
+        self.update(expense)
+        if anomaly is not None:
+            self.flagged.append(anomaly)
+        return anomaly
+
+    def threshold(self, category):
+        """Smallest amount that score() could flag in `category` (inf while cold)."""
+        stats = self.stats.get(category)
+        if stats is None or stats.count < self.min_count:
+            return math.inf
+        k = self.z_threshold
+        by_z = min(math.exp(stats.mean + k * stats.std), math.exp(stats.ewma + k * math.sqrt(stats.ewm_var)))
+        return max(stats.quantile(self.quantile), by_z)
+
+    def scan(self, rows):
+        """Flags unusual rows of a batch against the statistics from before
+        the batch, then learns the batch. Returns [(row index, Anomaly)]."""
+        thresholds = {}
+        by_category = {}
+        hits = []
+        for i, row in enumerate(rows):
+            category, amount = row["category"], row["amount"]
+            limit = thresholds.get(category)
+            if limit is None:
+                limit = thresholds[category] = self.threshold(category)
+                by_category[category] = []
+            if amount > 0:
+                by_category[category].append(amount)
+            if amount > limit:
+                hits.append(i)
+        flagged = []
+        for i in hits:
+            anomaly = self.score(rows[i])
+            if anomaly is not None:
+                flagged.append((i, anomaly))
+                self.flagged.append(anomaly)
+        for category, amounts in by_category.items():
+            stats = self.stats.get(category)
+            if stats is None:
+                stats = self.stats[category] = CategoryStats()
+            stats.merge(amounts, self.alpha)
+        return flagged
+
+    def dismiss(self, anomaly):
+        try:
+            self.flagged.remove(anomaly)
+        except ValueError:
+            pass
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""Asyncio HTTP/JSON API over an ExpenseStore (stdlib only).
+
+Endpoints:
+    POST /expenses             bulk insert; body is a JSON array or NDJSON
+                               (Content-Type: application/x-ndjson), may be
+                               gzip'd (Content-Encoding: gzip)
+    GET  /expenses             paginated query: ?q=<query.py syntax>&offset=0&limit=100
+    GET  /expenses/stream      every match as chunked NDJSON: ?q=...
+    GET  /aggregates           ?by=summary|category|month|year|day|tag
+                               [&category=...] [&start=YYYY-MM-DD&end=YYYY-MM-DD]
+
+Dates are ISO strings ("2024-03-05" or "2024-03-05T18:30:00"); one with a
+UTC offset is converted to the server's local time. Responses
+over 1 KB are gzip'd when the client accepts it. Aggregates carry an ETag
+derived from the store version, so unchanged results cost a 304 and are
+only computed once per change.
+
+The store is shared with the UI: every access takes store.lock, on an
+executor thread so a long hold never stalls the event loop. Row dicts
+are never mutated in place (edits store a new dict), so encoding a snapshot
+happens outside the lock.
+
+Standalone:
+    python api.py --port 8080 --rows 100000
+"""
+import argparse
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+import gzip
+import json
+import math
+import threading
+from urllib.parse import parse_qs, urlsplit
+import zlib
+
+from expense_store import ExpenseStore, normalize_tags
+from query import QueryError, run_query
+
+MAX_BODY = 64 * 1024 * 1024
+MAX_PAGE = 10000
+COMPRESS_MIN = 1024
+STREAM_BATCH = 2000
+_STATUS = {200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = parts.path.rstrip("/") or "/"
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    @property
+    def accepts_gzip(self):
+        return "gzip" in self.headers.get("accept-encoding", "")
+
+    def int_param(self, name, default, low=0, high=None):
+        value = self.query.get(name)
+        if value is None:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise ApiError(400, f"{name} must be an integer")
+        if number < low:
+            raise ApiError(400, f"{name} must be >= {low}")
+        return min(number, high) if high is not None else number
+
+
+def expense_to_json(expense):
+    return {"id": expense["id"], "name": expense["name"], "amount": expense["amount"],
+            "category": expense["category"], "date": expense["date"].isoformat(), "tags": list(expense.get("tags", ()))}
+
+
+def _parse_date(value, what="date"):
+    """A naive local datetime, like every date in the store (a UTC offset is converted)."""
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"Invalid {what}: {value!r} (use YYYY-MM-DD or ISO datetime)")
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    return date
+
+
+def expense_from_json(row, index):
+    """Validates one incoming row and converts it to a store row."""
+    try:
+        name = str(row["name"]).strip()
+        amount = float(row["amount"])
+        category = str(row.get("category") or "Others").strip()
+        date = _parse_date(row["date"])
+        tags = row.get("tags") or []
+        if not isinstance(tags, (str, list)) or not all(isinstance(tag, str) for tag in tags):
+            raise ValueError("tags must be a string or a list of strings")
+        tags = normalize_tags(tags)
+    except (KeyError, TypeError, ValueError) as err:
+        raise ApiError(400, f"Row {index}: missing or bad field ({err})")
+    except ApiError as err:
+        raise ApiError(400, f"Row {index}: {err}")
+    if not name or not math.isfinite(amount) or amount <= 0:
+        raise ApiError(400, f"Row {index}: name must be non-empty and amount a positive number")
+    return {"name": name, "amount": amount, "category": category, "date": date, "tags": tags}
+
+
+def _json(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+class ExpenseAPI:
+    def __init__(self, store, on_change=None):
+        self.store = store
+        self.on_change = on_change # Called (in an executor) after writes, e.g. to refresh the UI
+        self._query_cache = OrderedDict() # (q, store version) -> matching rows, so paging doesn't re-run queries
+        self._aggregate_cache = {} # request key -> (store version, etag, body)
+        self._server = None
+        self._loop = None
+
+    # --- Plumbing ---
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    await self.send(writer, None, 413, _json({"error": "Body too large"}), keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                request = Request(method.upper(), target, headers, body)
+                try:
+                    await self.dispatch(request, writer, keep_alive)
+                except ApiError as err:
+                    await self.send(writer, request, err.status, _json({"error": str(err)}), keep_alive=keep_alive)
+                except Exception as err: # Keep serving other requests
+                    print(f"API error on {method} {target}: {err!r}")
+                    await self.send(writer, request, 500, _json({"error": "Internal error"}), keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass # Client went away or sent garbage
+        finally:
+            writer.close()
+
+    async def send(self, writer, request, status, body=b"", content_type="application/json",
+                   headers=None, keep_alive=True):
+        lines = [f"HTTP/1.1 {status} {_STATUS.get(status, '')}"]
+        if body and request is not None and request.accepts_gzip and len(body) >= COMPRESS_MIN:
+            body = gzip.compress(body, compresslevel=5)
+            lines.append("Content-Encoding: gzip")
+        if status != 304:
+            lines.append(f"Content-Type: {content_type}")
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, request, writer, keep_alive):
+        routes = {
+            ("POST", "/expenses"): self.bulk_insert,
+            ("GET", "/expenses"): self.list_expenses,
+            ("GET", "/expenses/stream"): self.stream_expenses,
+            ("GET", "/aggregates"): self.aggregates,
+        }
+        handler = routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in routes):
+                raise ApiError(405, f"{request.method} not allowed on {request.path}")
+            raise ApiError(404, f"No such endpoint: {request.path}")
+        await handler(request, writer, keep_alive)
+
+    async def _locked(self, fn, *args):
+        """fn(*args) under store.lock, on an executor thread: the lock may be held
+        for a while (a big load, the UI), and the loop must keep serving meanwhile."""
+        def run():
+            with self.store.lock:
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+    # --- Handlers ---
+    def _decode_rows(self, request):
+        body = request.body
+        if request.headers.get("content-encoding", "") == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error):
+                raise ApiError(400, "Body is not valid gzip")
+        try:
+            if "ndjson" in request.headers.get("content-type", ""):
+                rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+            else:
+                rows = json.loads(body or b"[]")
+        except ValueError as err:
+            raise ApiError(400, f"Invalid JSON: {err}")
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not isinstance(rows, list):
+            raise ApiError(400, "Expected a JSON array of expenses")
+        return [expense_from_json(row, i) for i, row in enumerate(rows)]
+
+    async def bulk_insert(self, request, writer, keep_alive):
+        rows = self._decode_rows(request) # Everything is validated before anything is stored
+        await self._locked(self._insert, rows)
+        if rows and self.on_change is not None:
+            asyncio.get_running_loop().run_in_executor(None, self.on_change)
+        await self.send(writer, request, 201, _json({"inserted": len(rows), "ids": [row["id"] for row in rows]}),
+                        keep_alive=keep_alive)
+
+    def _insert(self, rows):
+        store = self.store
+        for row in rows:
+            row["id"] = store.new_id()
+        store.load(rows)
+
+    def _matches(self, q):
+        """All rows matching q (newest first), cached per store version."""
+        store = self.store
+        if not q:
+            return list(store)
+        key = (q, store.version)
+        rows = self._query_cache.get(key)
+        if rows is None:
+            try:
+                rows = run_query(store, q)
+            except QueryError as err:
+                raise ApiError(400, str(err))
+            self._query_cache[key] = rows
+            if len(self._query_cache) > 32:
+                self._query_cache.popitem(last=False)
+        else:
+            self._query_cache.move_to_end(key)
+        return rows
+
+    async def list_expenses(self, request, writer, keep_alive):
+        offset = request.int_param("offset", 0)
+        limit = request.int_param("limit", 100, low=1, high=MAX_PAGE)
+        q = request.query.get("q", "").strip()
+        store = self.store
+
+        def read():
+            if q:
+                rows = self._matches(q)
+                return len(rows), rows[offset:offset + limit], store.version
+            return len(store), store[offset:offset + limit], store.version # Sliced straight off the date index
+
+        total, page, version = await self._locked(read)
+        next_offset = offset + len(page) if offset + len(page) < total else None
+        body = _json({"total": total, "offset": offset, "limit": limit, "next_offset": next_offset,
+                      "version": version, "items": [expense_to_json(expense) for expense in page]})
+        await self.send(writer, request, 200, body, keep_alive=keep_alive)
+
+    async def stream_expenses(self, request, writer, keep_alive):
+        q = request.query.get("q", "").strip()
+        rows = await self._locked(self._matches, q)
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 31) if request.accepts_gzip else None # 31: gzip framing
+        headers = ["HTTP/1.1 200 OK", "Content-Type: application/x-ndjson", "Transfer-Encoding: chunked",
+                   "Connection: " + ("keep-alive" if keep_alive else "close")]
+        if compressor is not None:
+            headers.append("Content-Encoding: gzip")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+
+        def write_chunk(data):
+            if data:
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        for start in range(0, len(rows), STREAM_BATCH):
+            batch = rows[start:start + STREAM_BATCH]
+            data = "".join(json.dumps(expense_to_json(expense), separators=(",", ":")) + "\n" for expense in batch).encode("utf-8")
+            write_chunk(compressor.compress(data) if compressor is not None else data)
+            await writer.drain() # Back-pressure: don't buffer the whole result for slow clients
+        if compressor is not None:
+            write_chunk(compressor.flush())
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _compute_aggregate(self, request):
+        store = self.store
+        by = request.query.get("by", "summary")
+        category = request.query.get("category") or None
+        if by == "summary":
+            return {"count": len(store), "total": store.total, "first_day": store.first_day and store.first_day.isoformat(),
+                    "last_day": store.last_day and store.last_day.isoformat()}
+        if by == "category":
+            return store.category_totals()
+        if by in ("month", "year"):
+            series = store.period_series(by, category)
+            return {"-".join(f"{part:02d}" for part in key): value for key, value in sorted(series.items())}
+        if by == "day":
+            if store.first_day is None:
+                return {}
+            start = _parse_date(request.query["start"], "start").date() if "start" in request.query else store.first_day
+            end = _parse_date(request.query["end"], "end").date() if "end" in request.query else store.last_day
+            result = {}
+            for day, categories in store.daily_totals(start, end):
+                value = categories.get(category, 0) if category else sum(categories.values())
+                if value:
+                    result[day.isoformat()] = value
+            return result
+        if by == "tag":
+            return {tag: {"total": total, "count": count} for tag, (total, count) in store.tag_totals().items()}
+        raise ApiError(400, f"Unknown aggregate: {by!r} (use summary, category, month, year, day or tag)")
+
+    async def aggregates(self, request, writer, keep_alive):
+        key = (request.path, tuple(sorted(request.query.items())))
+        store = self.store
+
+        def read():
+            version = store.version
+            cached = self._aggregate_cache.get(key)
+            if cached is None or cached[0] != version:
+                body = _json(self._compute_aggregate(request))
+                etag = f'"{version:x}-{zlib.crc32(body):08x}"'
+                cached = self._aggregate_cache[key] = (version, etag, body)
+            return cached
+
+        _, etag, body = await self._locked(read)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            await self.send(writer, request, 304, headers=headers, keep_alive=keep_alive)
+        else:
+            await self.send(writer, request, 200, body, headers=headers, keep_alive=keep_alive)
+
+    # --- Lifecycle ---
+    async def start(self, host="127.0.0.1", port=8080):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    def start_in_thread(self, host="127.0.0.1", port=8080):
+        """Runs the API on its own event loop in a daemon thread (for use next
+        to the Flet UI). Returns the bound port."""
+        started = threading.Event()
+        bound = {}
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            bound["port"] = loop.run_until_complete(self.start(host, port))
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="expense-api", daemon=True).start()
+        started.wait()
+        return bound["port"]
+
+    def stop(self):
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API over an in-memory expense store.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rows", type=int, default=0, help="Preload this many synthetic expenses (ledger_gen)")
+    args = parser.parse_args(argv)
+    store = ExpenseStore()
+    if args.rows:
+        from ledger_gen import generate_expenses
+        store.load(generate_expenses(args.rows))
+    api = ExpenseAPI(store)
+
+    async def serve():
+        port = await api.start(args.host, args.port)
+        print(f"Expense API listening on http://{args.host}:{port} ({len(store)} expenses)")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""On-device category suggestions: multinomial naive Bayes over hashed features.
+
+Features are the words of the expense name, character trigrams of those
+words (so "swiggy" still helps with "swiggyy") and a log2 amount bucket,
+hashed into a fixed number of buckets. Learning a new expense only bumps a
+handful of counters, so the model updates on every save without retraining.
+"""
+from functools import lru_cache
+import math
+import re
+import zlib
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=4096)
+def _name_features(name, n_features):
+    """Hashed feature ids for an expense name (cached, names repeat a lot)."""
+    features = []
+    for word in _WORD.findall(name.lower()):
+        features.append("w:" + word)
+        padded = f"^{word}$"
+        features.extend("c:" + padded[i:i + 3] for i in range(len(padded) - 2))
+    # crc32 rather than hash() so feature ids are stable across runs
+    return tuple(zlib.crc32(feature.encode("utf-8")) % n_features for feature in features)
+
+
+def _amount_feature(amount, n_features):
+    bucket = int(math.log2(amount)) if amount and amount > 0 else -1
+    return zlib.crc32(f"a:{bucket}".encode("utf-8")) % n_features
+
+
+class Categorizer:
+    """Incremental naive Bayes category classifier."""
+
+    def __init__(self, n_features=2 ** 18, alpha=0.1, min_confidence=0.5):
+        self.n_features = n_features
+        self.alpha = alpha # Additive smoothing
+        self.min_confidence = min_confidence
+        self.doc_counts = {}     # category -> expenses learned
+        self.feature_counts = {} # category -> {feature id: count}
+        self.feature_totals = {} # category -> sum of feature counts
+
+    def features(self, name, amount=None):
+        features = _name_features(name, self.n_features)
+        if amount is not None:
+            features += (_amount_feature(amount, self.n_features),)
+        return features
+
+    # --- Learning ---
+    def learn(self, name, amount, category, weight=1):
+        """Adds one labelled expense (weight=-1 forgets it again)."""
+        counts = self.feature_counts.setdefault(category, {})
+        features = self.features(name, amount)
+        for feature in features:
+            value = counts.get(feature, 0) + weight
+            if value > 0:
+                counts[feature] = value
+            else:
+                counts.pop(feature, None)
+        self.feature_totals[category] = self.feature_totals.get(category, 0) + weight * len(features)
+        self.doc_counts[category] = self.doc_counts.get(category, 0) + weight
+        if self.doc_counts[category] <= 0:
+            del self.doc_counts[category], self.feature_counts[category], self.feature_totals[category]
+
+    def forget(self, name, amount, category):
+        if category in self.doc_counts:
+            self.learn(name, amount, category, weight=-1)
+
+    def fit(self, expenses):
+        """Learns from an iterable of expense dicts in one pass."""
+        for expense in expenses:
+            self.learn(expense["name"], expense["amount"], expense["category"])
+
+    def reset(self):
+        self.doc_counts, self.feature_counts, self.feature_totals = {}, {}, {}
+
+    def watch(self, store):
+        """Keeps the model in step with `store`: every row it holds is learned,
+        and rows leaving it (deletes, edits, undo/redo, remote changes) are
+        forgotten again."""
+        self.fit(store)
+        store.subscribe(self._on_change)
+
+    def _on_change(self, event, *args):
+        if event == "insert":
+            expense, = args
+            self.learn(expense["name"], expense["amount"], expense["category"])
+        elif event == "delete":
+            expense, = args
+            self.forget(expense["name"], expense["amount"], expense["category"])
+        elif event == "replace":
+            old, new = args
+            self.forget(old["name"], old["amount"], old["category"])
+            self.learn(new["name"], new["amount"], new["category"])
+        elif event == "reset": # Clear-all or its undo: the counts go with the generation swapped out
+            store, outgoing, incoming = args
+            outgoing[self] = (self.doc_counts, self.feature_counts, self.feature_totals)
+            saved = incoming.pop(self, None)
+            if saved is not None: # Undo/redo of a clear: back to the counts we had for those rows
+                self.doc_counts, self.feature_counts, self.feature_totals = saved
+            else: # A fresh generation (empty after a clear)
+                self.reset()
+                self.fit(store)
+
+    # --- Prediction ---
+    def scores(self, features):
+        """Returns {category: log probability} (unnormalized)."""
+        total_docs = sum(self.doc_counts.values())
+        smoothing = self.alpha * self.n_features
+        scores = {}
+        for category, docs in self.doc_counts.items():
+            counts = self.feature_counts[category]
+            denominator = math.log(self.feature_totals[category] + smoothing)
+            score = math.log(docs / total_docs)
+            for feature in features:
+                score += math.log(counts.get(feature, 0) + self.alpha) - denominator
+            scores[category] = score
+        return scores
+
+    def predict(self, name, amount=None):
+        """Returns (category, confidence), or (None, 0.0) when there's nothing to go on."""
+        if not self.doc_counts or not name.strip():
+            return None, 0.0
+        features = self.features(name, amount)
+        if not features:
+            return None, 0.0
+        scores = self.scores(features)
+        best = max(scores, key=scores.get)
+        # Softmax of the best score for a confidence in [0, 1]
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best, confidence
+
+    def suggest(self, name, amount=None):
+        """The predicted category if confident enough, else None."""
+        category, confidence = self.predict(name, amount)
+        return category if confidence >= self.min_confidence else None
+
+    def predict_many(self, rows):
+        """Fills in a missing "category" on each row dict (in place) and returns
+        how many were categorized. Identical (name, amount bucket) pairs are
+        scored once."""
+        seen = {}
+        filled = 0
+        for row in rows:
+            if row.get("category"):
+                continue
+            features = self.features(row["name"], row.get("amount"))
+            if features not in seen:
+                seen[features] = self._best(features)
+            row["category"] = seen[features]
+            filled += 1
+        return filled
+
+    def _best(self, features):
+        if not self.doc_counts or not features:
+            return "Others"
+        scores = self.scores(features)
+        return max(scores, key=scores.get)
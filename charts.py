@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Chart series for the Analytics tab.
+
+Series are built from the store's daily rollup (never from raw rows) and
+downsampled so a chart never gets more points than it has pixels.
+"""
+from datetime import timedelta
+
+
+def min_max(points, buckets):
+    """Keeps the min and max point of each of `buckets` equal-width buckets.
+
+    Cheap (one pass) and preserves spikes; used to pre-select candidates
+    before LTTB on very long series.
+    """
+    n = len(points)
+    if buckets <= 0 or n <= 2 * buckets:
+        return list(points)
+    size = n / buckets
+    kept = []
+    for b in range(buckets):
+        chunk = points[int(b * size):int((b + 1) * size)]
+        if not chunk:
+            continue
+        low = min(chunk, key=lambda p: p[1])
+        high = max(chunk, key=lambda p: p[1])
+        kept.extend(sorted({low, high}))
+    return kept
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) points sorted by x."""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_bucket = points[next_start:next_end]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        ax, ay = points[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def downsample(points, max_points):
+    """Min-max preselection followed by LTTB, capped at `max_points`."""
+    if len(points) <= max_points:
+        return list(points)
+    if len(points) > 4 * max_points:
+        points = min_max(points, 2 * max_points)
+    return lttb(points, max_points)
+
+
+def daily_series(store, start, end):
+    """Returns [(day_offset, total)] for every day in [start, end], zero-filled,
+    where day_offset counts days from `start`."""
+    totals = [0.0] * ((end - start).days + 1)
+    for day, categories in store.daily_totals(start, end):
+        totals[(day - start).days] = sum(categories.values())
+    return list(enumerate(totals))
+
+
+def category_totals(store, start, end):
+    """Returns {category: total} for the days in [start, end]."""
+    totals = {}
+    for _, categories in store.daily_totals(start, end):
+        for category, amount in categories.items():
+            totals[category] = totals.get(category, 0) + amount
+    return totals
+
+
+class ChartWindow:
+    """The visible date range of the time-series chart, with zoom and pan."""
+
+    MIN_DAYS = 7
+
+    def __init__(self, first_day, last_day):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.start, self.end = first_day, last_day
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def reset(self, first_day=None, last_day=None):
+        if first_day is not None:
+            self.first_day, self.last_day = first_day, last_day
+        self.start, self.end = self.first_day, self.last_day
+
+    def zoom(self, factor):
+        """factor < 1 zooms in, > 1 zooms out, around the window centre."""
+        span = max(self.MIN_DAYS, int(self.days * factor))
+        centre = self.start + timedelta(days=self.days // 2)
+        self.start = centre - timedelta(days=span // 2)
+        self.end = self.start + timedelta(days=span - 1)
+        self._clamp()
+
+    def pan(self, fraction):
+        """Moves the window by a fraction of its width (negative = back in time)."""
+        shift = timedelta(days=int(self.days * fraction) or (1 if fraction > 0 else -1))
+        self.start += shift
+        self.end += shift
+        self._clamp()
+
+    def _clamp(self):
+        span = self.end - self.start
+        if self.start < self.first_day:
+            self.start = self.first_day
+            self.end = self.start + span
+        if self.end > self.last_day:
+            self.end = self.last_day
+            self.start = max(self.first_day, self.end - span)
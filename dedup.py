@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Duplicate detection for typed and imported expenses.
+
+Two indexes:
+  * exact: normalized (day, amount in paise, name) -> ids; a match that also
+    has the same timestamp, name and category is reported as "identical"
+  * near: MinHash signatures of the name's character shingles, split into LSH
+    bands. A band bucket is keyed by (band, band values, amount in paise),
+    so candidates already share the amount; they then only need a date
+    window and signature-similarity check. No pairwise comparison of the
+    ledger is ever done.
+"""
+from functools import lru_cache
+import random
+import re
+import zlib
+
+NUM_PERM = 16
+BANDS = 8 # 2 rows per band: names with ~0.6 similarity collide with probability > 0.95
+ROWS_PER_BAND = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(4242) # Fixed so signatures are stable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    return _NON_WORD.sub(" ", name.lower()).strip()
+
+
+def _day(expense):
+    return expense["date"].toordinal()
+
+
+def _cents(amount):
+    return int(round(amount * 100))
+
+
+def _stamp(expense):
+    return (expense["date"], expense["name"], expense.get("category"))
+
+
+def exact_key(expense, normalized_name=None):
+    if normalized_name is None:
+        normalized_name = normalize_name(expense["name"])
+    return (_day(expense), _cents(expense["amount"]), normalized_name)
+
+
+@lru_cache(maxsize=65536)
+def minhash(normalized_name):
+    """MinHash signature of the name's character 3-shingles."""
+    text = f" {normalized_name} "
+    shingles = {text[i:i + 3] for i in range(len(text) - 2)} or {text}
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / NUM_PERM
+
+
+@lru_cache(maxsize=65536)
+def _bands(signature):
+    """The signature split into LSH bands, each prefixed with its band number."""
+    return tuple((band,) + signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND] for band in range(BANDS))
+
+
+class DedupIndex:
+    """Exact + near-duplicate index over expenses, updated one row at a time."""
+
+    def __init__(self, window_days=3, threshold=0.6):
+        self.window_days = window_days
+        self.threshold = threshold
+        self.exact = {}      # exact key -> list of ids
+        self.buckets = {}    # band key -> list of ids (nearly always one or two)
+        self.signatures = {} # id -> (signature, day)
+        self.stamps = {}     # id -> (timestamp, name, category), tells "identical" from "exact"
+
+    def add(self, expense):
+        expense_id = expense["id"]
+        name = normalize_name(expense["name"])
+        self.exact.setdefault(exact_key(expense, name), []).append(expense_id)
+        signature = minhash(name)
+        self.signatures[expense_id] = (signature, _day(expense))
+        self.stamps[expense_id] = _stamp(expense)
+        cents = _cents(expense["amount"])
+        buckets = self.buckets
+        for band in _bands(signature):
+            buckets.setdefault((band, cents), []).append(expense_id)
+
+    def remove(self, expense):
+        expense_id = expense["id"]
+        key = exact_key(expense)
+        ids = self.exact.get(key)
+        if ids is not None and expense_id in ids:
+            ids.remove(expense_id)
+            if not ids:
+                del self.exact[key]
+        signature, _ = self.signatures.pop(expense_id)
+        del self.stamps[expense_id]
+        cents = _cents(expense["amount"])
+        for band in _bands(signature):
+            band_key = (band, cents)
+            bucket = self.buckets.get(band_key)
+            if bucket is not None and expense_id in bucket:
+                bucket.remove(expense_id)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def check(self, expense):
+        """Returns ("identical", id, 1.0), ("exact", id, 1.0), ("near", id, similarity) or None.
+
+        "identical" means the same timestamp, name, amount and category; "exact"
+        the same day, amount and normalized name. `expense` needs name, amount
+        and date (and category to ever be identical); an "id" of its own is
+        ignored in the results (so checking a stored row doesn't match itself).
+        """
+        own_id = expense.get("id")
+        name = normalize_name(expense["name"])
+        stamp = _stamp(expense)
+        exact = None
+        for expense_id in self.exact.get(exact_key(expense, name), ()):
+            if expense_id == own_id:
+                continue
+            if self.stamps[expense_id] == stamp:
+                return ("identical", expense_id, 1.0)
+            if exact is None:
+                exact = expense_id
+        if exact is not None:
+            return ("exact", exact, 1.0)
+
+        signature = minhash(name)
+        day = _day(expense)
+        cents = _cents(expense["amount"])
+        best, best_similarity = None, self.threshold
+        seen = set()
+        for band in _bands(signature):
+            for expense_id in self.buckets.get((band, cents), ()):
+                if expense_id == own_id or expense_id in seen:
+                    continue
+                seen.add(expense_id)
+                other_signature, other_day = self.signatures[expense_id]
+                if abs(other_day - day) > self.window_days:
+                    continue
+                score = similarity(signature, other_signature)
+                if score >= best_similarity:
+                    best, best_similarity = expense_id, score
+        return ("near", best, best_similarity) if best is not None else None
+
+    def check_batch(self, rows):
+        """Checks incoming rows against the index and against earlier rows of
+        the same batch. Returns one result per row (see check()); batch
+        matches report the row's position as ("batch", index, score).
+        Only "identical" results are safe to drop unseen: recurring expenses
+        (a daily metro ticket) come out as "near" or "batch"."""
+        batch = DedupIndex(self.window_days, self.threshold)
+        results = []
+        for i, row in enumerate(rows):
+            result = self.check(row)
+            if result is None:
+                match = batch.check(row)
+                if match is not None:
+                    result = ("batch", match[1], match[2])
+            results.append(result)
+            batch.add(dict(row, id=i))
+        return results
@@ -1,20 +1,58 @@
 # -*- coding: utf-8 -*-
+import time
+STARTED = time.perf_counter() # Reference point for startup timings
+
 import flet as ft
-from datetime import datetime
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from expense_store import Budget, BudgetBook, PERIODS, PERIOD_LABELS, normalize_tags
+# query, categorizer, anomaly, forecast, charts (and csv) are imported lazily where used,
+# they aren't needed for the first frame
+
+ALL_LEDGERS = "*" # Ledger picker key of the combined view
 
 class ExpenseTracker:
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, fast_start=False, ledger_path=None, sync_url=None, device_id=None, api_port=None,
+                 ledger_names=None):
         self.page = page
-        self.expenses = []
+        self.device_id = device_id or uuid.uuid4().hex[:8]
+        self.sync_site = None # This run's sync site id, also the prefix of the ids it hands out
+        if sync_url:
+            from sync import session_site
+            self.sync_site = session_site(self.device_id) # Seqs and ids restart every run, so the site does too
+        # One store per ledger (personal, business...); combined views fan out over all of them
+        # With sync on, ids carry the sync site so no two devices (or runs) hand out the same one
+        # Only the latest year stays hot; older years are sealed into compressed segments
+        # Combined views run on shard processes, leaving a core for the UI (none on a single core)
+        from ledgers import Ledgers
+        self.ledgers = Ledgers(ledger_names or ("Personal",), id_prefix=f"{self.sync_site}-" if sync_url else None, hot_years=1,
+                               workers=min(4, (os.cpu_count() or 1) - 1))
+        self.ledger_state = {} # ledger name -> (BudgetBook, AnomalyDetector, Forecaster, Categorizer), made on first use
+        self.all_ledgers = False # True while the home list/total show every ledger merged (read-only)
+        self.use_ledger(self.ledgers.names()[0]) # Sets self.store / self.expenses and the per-ledger helpers
         self.current_tab = 0
+        self.fast_start = fast_start # Paint a skeleton first, load + build home in the background
+        self.ledger_path = ledger_path # Optional CSV (ledger_gen format) loaded at startup
+        self.startup_timings = {}
+        self.analytics_ready = False # Analytics-only controls are built on first visit
+        self.category_suggested = False # True while the dropdown holds a suggestion, not a user choice
+        self.sync_client = None
+        if sync_url: # Sync (and the HTTP API) serve the first ledger
+            from sync import SyncClient, SyncReplica
+            self.sync_client = SyncClient(SyncReplica(self.store, self.sync_site), sync_url)
+        self.api_port = api_port # Serve the HTTP API (api.py) on this port next to the UI
 
         # --- UI Elements ---
         self.expense_name = ft.TextField(
-            label="Expense Name", prefix_icon=ft.icons.TITLE, width=300, border_radius=10
+            label="Expense Name", prefix_icon=ft.icons.TITLE, width=300, border_radius=10,
+            on_change=self.suggest_category
         )
         self.expense_amount = ft.TextField(
             label="Expense Amount", prefix_icon=ft.icons.ATTACH_MONEY, width=300, border_radius=10,
-            keyboard_type=ft.KeyboardType.NUMBER
+            keyboard_type=ft.KeyboardType.NUMBER, on_change=self.suggest_category
         )
         self.expense_category = ft.Dropdown(
             label="Category",
@@ -26,7 +64,12 @@ class ExpenseTracker:
                 ft.dropdown.Option("Others")
             ],
             width=300,
-            border_radius=10
+            border_radius=10,
+            on_change=self.category_picked
+        )
+        self.expense_tags = ft.TextField(
+            label="Tags (comma separated)", prefix_icon=ft.icons.SELL, width=300, border_radius=10,
+            hint_text="e.g. work, travel"
         )
 
         # --- Date Picker Setup ---
@@ -51,8 +94,16 @@ class ExpenseTracker:
         # Add DatePicker to overlay ONCE during initialization
         # It's safe to do this here.
         self.page.overlay.append(self.expense_date_picker)
+        self.import_picker = ft.FilePicker(on_result=self.handle_import_result)
+        self.page.overlay.append(self.import_picker)
+        self.statements_picker = ft.FilePicker(on_result=self.handle_statements_dir)
+        self.page.overlay.append(self.statements_picker)
 
         # --- Other UI Elements ---
+        self.expense_rows = {} # expense id -> row Container currently shown
+        self.list_limit = self.LIST_PAGE # Rows shown before "Show more"; grows a page per click
+        self.list_query = "" # Search the current limit belongs to
+        self.show_more_button = ft.TextButton("Show more", icon=ft.icons.EXPAND_MORE, on_click=self.show_more_expenses)
         self.expense_list = ft.Column(
             scroll=ft.ScrollMode.AUTO,
             # height=300, # Let container control height
@@ -65,24 +116,28 @@ class ExpenseTracker:
             weight=ft.FontWeight.BOLD,
             color="#2196F3"
         )
-        self.chart_bars = ft.Row(
-            [],
-            alignment=ft.MainAxisAlignment.CENTER,
-            spacing=5,
-            vertical_alignment=ft.CrossAxisAlignment.END
-         )
         self.search_expense = ft.TextField(
             label="Search Expenses",
             prefix_icon=ft.icons.SEARCH,
+            hint_text='e.g. category:food amount>500 date:2024-03..2024-06 "coffee"',
             width=300,
             border_radius=10,
             on_change=self.filter_expenses
         )
+        self.ledger_picker = ft.Dropdown(
+            label="Ledger",
+            options=self.ledger_options(),
+            value=self.ledger,
+            width=250,
+            border_radius=10,
+            on_change=self.switch_ledger
+        )
         self.navbar = ft.NavigationBar(
             destinations=[
                 ft.NavigationBarDestination(icon=ft.icons.HOME, label="Home"),
                 ft.NavigationBarDestination(icon=ft.icons.ADD, label="Add Expense"),
-                ft.NavigationBarDestination(icon=ft.icons.ANALYTICS, label="Analytics")
+                ft.NavigationBarDestination(icon=ft.icons.ANALYTICS, label="Analytics"),
+                ft.NavigationBarDestination(icon=ft.icons.WARNING_AMBER, label="Unusual"),
             ],
             selected_index=self.current_tab,
             on_change=self.switch_tab,
@@ -95,6 +150,52 @@ class ExpenseTracker:
             scroll=ft.ScrollMode.ADAPTIVE
         )
 
+    def build_analytics_controls(self):
+        """Creates the Analytics-only controls the first time the tab is opened."""
+        if self.analytics_ready:
+            return
+        # --- Budget Controls ---
+        self.budget_category = ft.Dropdown(
+            label="Budget Category",
+            options=[ft.dropdown.Option("All")] + [ft.dropdown.Option(opt.key) for opt in self.expense_category.options],
+            value="All",
+            width=200,
+            border_radius=10
+        )
+        self.budget_period = ft.Dropdown(
+            label="Period",
+            options=[ft.dropdown.Option(key=period, text=PERIOD_LABELS[period]) for period in PERIODS],
+            value="month",
+            width=150,
+            border_radius=10
+        )
+        self.budget_limit = ft.TextField(
+            label="Limit", prefix_icon=ft.icons.SAVINGS, width=150, border_radius=10,
+            keyboard_type=ft.KeyboardType.NUMBER
+        )
+        self.budget_list = ft.Column(spacing=5)
+
+        # --- Charts fed from the store's daily rollup ---
+        self.chart_window = None # charts.ChartWindow, created once there is data
+        self.chart_range_text = ft.Text("", size=13, color="#757575")
+        self.timeseries_chart = ft.LineChart(
+            left_axis=ft.ChartAxis(labels_size=50),
+            bottom_axis=ft.ChartAxis(labels_size=30),
+            horizontal_grid_lines=ft.ChartGridLines(interval=1, color=ft.colors.with_opacity(0.1, ft.colors.BLUE_GREY), width=1),
+            tooltip_bgcolor=ft.colors.with_opacity(0.9, ft.colors.BLUE_GREY_50),
+            height=250,
+            expand=True
+        )
+        self.category_chart = ft.BarChart(
+            left_axis=ft.ChartAxis(labels_size=50),
+            bottom_axis=ft.ChartAxis(labels_size=30),
+            tooltip_bgcolor=ft.colors.with_opacity(0.9, ft.colors.BLUE_GREY_50),
+            interactive=True,
+            height=250,
+            expand=True
+        )
+        self.analytics_ready = True
+
     # --- Methods for Date Picker ---
     def open_date_picker(self, e):
         self.expense_date_picker.pick_date()
@@ -116,7 +217,9 @@ class ExpenseTracker:
 
 
     # --- Core Logic Methods ---
-    def add_expense(self, e):
+    def add_expense(self, e, allow_duplicate=False):
+        if self.needs_ledger():
+            return
         # Get values
         name = self.expense_name.value.strip()
         amount_str = self.expense_amount.value.strip()
@@ -142,36 +245,107 @@ class ExpenseTracker:
             self.show_snackbar("Enter a valid number for the amount!")
             return
 
-        # Add data
-        self.expenses.append({"name": name, "amount": amount, "category": category, "date": date_value})
-        self.expenses.sort(key=lambda x: x['date'], reverse=True) # Keep expenses sorted by date desc
+        # Same entry typed twice? Ask before adding (exact or near-duplicate within a few days)
+        if not allow_duplicate:
+            with self.store.lock: # Sealed years are checked too, not just the hot rows
+                match = self.store.check_duplicates([{"name": name, "amount": amount, "date": date_value}])[0]
+                duplicate = self.store.get(match[1]) if match is not None else None
+            if match is not None:
+                self.confirm_duplicate(e, duplicate, match[0] != "near")
+                return
+
+        # Add data (store keeps date order and running totals)
+        with self.store.lock: # The API thread may be writing too
+            expense = self.store.add(name, amount, category, date_value, tags=self.expense_tags.value or "")
+            alerts = self.budgets.check(self.store, expense) # O(1) against maintained totals
+            anomaly = self.anomalies.observe(expense)
 
         # Update UI (safe to update here)
-        self.update_expense_list_display(self.expenses) # Update list display immediately
+        self.update_expense_list_display(self.snapshot_expenses()) # Update list display immediately
         self.calculate_total() # Update total immediately
 
         # Reset fields
         self.expense_name.value = ""
         self.expense_amount.value = ""
         self.expense_category.value = None
+        self.expense_category.helper_text = None
+        self.category_suggested = False
+        self.expense_tags.value = ""
         self.expense_date_picker.value = None # Reset picker value
         self.date_display.value = datetime.today().strftime('%Y-%m-%d')
 
         # Update input fields visually
-        self.expense_name.update()
-        self.expense_amount.update()
-        self.expense_category.update()
-        self.date_display.update()
+        self.update_if_attached(self.expense_name, self.expense_amount, self.expense_category, self.expense_tags, self.date_display)
 
-        self.show_snackbar("Expense Added Successfully!")
+        if alerts:
+            self.show_snackbar("Expense Added. " + "\n".join(alerts), ft.colors.RED_700)
+        elif anomaly is not None:
+            self.show_snackbar(f"Expense Added. Unusual: {anomaly.describe()}", ft.colors.ORANGE_800)
+        else:
+            self.show_snackbar("Expense Added Successfully!")
         # No page.update() needed here, individual updates handled it.
 
+    def confirm_duplicate(self, e, existing, exact):
+        def close_dialog(e):
+            self.page.dialog.open = False
+            self.page.update()
+
+        def add_anyway(e):
+            close_dialog(e)
+            self.add_expense(e, allow_duplicate=True)
+
+        kind = "the same as" if exact else "very similar to"
+        self.page.dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Possible Duplicate"),
+            content=ft.Text(f"This looks {kind} '{existing['name']}' (₹{existing['amount']:.2f}) added for {existing['date']:%Y-%m-%d}. Add it anyway?"),
+            actions=[
+                ft.TextButton("Cancel", on_click=close_dialog),
+                ft.TextButton("Add Anyway", on_click=add_anyway),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+            open=True,
+        )
+        self.page.update()
+
+    # --- Category Suggestions ---
+    def suggest_category(self, e):
+        """Pre-selects the predicted category while the user hasn't picked one."""
+        if self.expense_category.value and not self.category_suggested:
+            return # Respect an explicit choice
+        try:
+            amount = float(self.expense_amount.value.strip())
+        except ValueError:
+            amount = None
+        with self.store.lock: # The model follows store changes, which the API thread makes too
+            suggestion = self.categorizer.suggest(self.expense_name.value or "", amount)
+        if suggestion == self.expense_category.value:
+            return
+        self.expense_category.value = suggestion
+        self.expense_category.helper_text = "Suggested" if suggestion else None
+        self.category_suggested = bool(suggestion)
+        self.update_if_attached(self.expense_category)
+
+    def category_picked(self, e):
+        self.category_suggested = False
+        if self.expense_category.helper_text:
+            self.expense_category.helper_text = None
+            self.update_if_attached(self.expense_category)
+
+    def update_if_attached(self, *controls):
+        """Updates controls that are on the page (skips ones not mounted yet)."""
+        for control in controls:
+            if control.page:
+                control.update()
+
     def calculate_total(self, update_control=True):
         """Calculates and updates the total expenses text.
            Avoids calling update() if update_control is False or control not on page.
         """
-        total = sum(expense["amount"] for expense in self.expenses)
-        self.total_expense_text.value = f"Total Expense: ₹{total:.2f}"
+        if self.all_ledgers:
+            self.total_expense_text.value = f"Total Expense (all ledgers): ₹{self.ledgers.total():.2f}"
+        else:
+            self.total_expense_text.value = f"Total Expense: ₹{self.store.total:.2f}"
 
         # Only update the control if requested AND it's actually part of the page structure
         if update_control and self.total_expense_text.page:
@@ -181,21 +355,24 @@ class ExpenseTracker:
                  print(f"Error updating total_expense_text: {e}") # Log potential update errors
 
     def delete_last_expense(self, e):
-        if not self.expenses:
+        if self.needs_ledger():
+            return
+        # Find the most recent expense (the store is sorted newest first)
+        with self.store.lock:
+            expense_to_delete = self.store[0] if len(self.store) else None
+        if not expense_to_delete:
             self.show_snackbar("No expenses to delete!")
             return
 
-        # Find the most recent expense (assuming list is sorted desc)
-        expense_to_delete = self.expenses[0] if self.expenses else None
-        if not expense_to_delete: return # Should not happen if expenses list is not empty
-
         def close_dialog(e):
             self.page.dialog.open = False
             self.page.update()
 
         def delete_confirmed(e):
-            self.expenses.pop(0) # Remove the first item (most recent)
-            self.update_expense_list_display(self.expenses) # Update list (safe here)
+            with self.store.lock:
+                if self.store.get(expense_to_delete["id"]) is not None: # May be gone already (API, sync)
+                    self.store.remove(expense_to_delete["id"]) # Remove the most recent
+            self.update_expense_list_display(self.snapshot_expenses()) # Update list (safe here)
             self.calculate_total() # Update total (safe here)
             self.show_snackbar("Most Recent Expense Deleted")
             close_dialog(e)
@@ -214,6 +391,8 @@ class ExpenseTracker:
         self.page.update()
 
     def clear_all_expenses(self, e):
+        if self.needs_ledger():
+            return
         if not self.expenses:
              self.show_snackbar("No expenses to clear!")
              return
@@ -223,8 +402,9 @@ class ExpenseTracker:
             self.page.update()
 
         def clear_confirmed(e):
-            self.expenses.clear()
-            self.update_expense_list_display(self.expenses) # Update list (safe here)
+            with self.store.lock:
+                self.store.clear()
+            self.update_expense_list_display(self.snapshot_expenses()) # Update list (safe here)
             self.calculate_total() # Update total (safe here)
             self.show_snackbar("All Expenses Cleared")
             close_dialog(e)
@@ -232,7 +412,7 @@ class ExpenseTracker:
         self.page.dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text("Clear All Expenses?"),
-            content=ft.Text("Are you sure you want to clear ALL expenses? This cannot be undone."),
+            content=ft.Text("Are you sure you want to clear ALL expenses? You can bring them back with Undo."),
             actions=[
                 ft.TextButton("Cancel", on_click=close_dialog),
                 ft.TextButton("Clear All", on_click=clear_confirmed, style=ft.ButtonStyle(color=ft.colors.RED)),
@@ -242,46 +422,259 @@ class ExpenseTracker:
         )
         self.page.update()
 
+    # --- Undo / Redo ---
+    LIST_PAGE = 500 # Expense rows rendered per "Show more"
+
+    _OPERATION_LABELS = {"add": "Add", "remove": "Delete", "update": "Edit", "clear": "Clear All"}
+
+    def undo_last(self, e):
+        if self.needs_ledger():
+            return
+        with self.store.lock:
+            op = self.store.undo()
+        if op is None:
+            self.show_snackbar("Nothing to undo!")
+            return
+        self.refresh_expense_views()
+        self.show_snackbar(f"Undid {self._OPERATION_LABELS.get(op, op)}")
+
+    def redo_last(self, e):
+        if self.needs_ledger():
+            return
+        with self.store.lock:
+            op = self.store.redo()
+        if op is None:
+            self.show_snackbar("Nothing to redo!")
+            return
+        self.refresh_expense_views()
+        self.show_snackbar(f"Redid {self._OPERATION_LABELS.get(op, op)}")
+
+    def snapshot_expenses(self):
+        """The current ledger's newest rows (one more than the list shows, so it
+           knows whether to offer "Show more"), copied under the store lock so other
+           threads can keep writing while the list is built. Slicing only walks the
+           hot rows and the segments the page reaches, not the whole tiered store."""
+        with self.store.lock:
+            return self.store[:self.list_limit + 1]
+
+    def show_more_expenses(self, e):
+        self.list_limit += self.LIST_PAGE
+        self.filter_expenses(None)
+
+    def refresh_expense_views(self):
+        """Re-renders the list (keeping the current search) and the total."""
+        self.filter_expenses(None)
+        self.calculate_total()
+
+    # --- Chart Methods ---
+    def chart_max_points(self):
+        """One point per horizontal pixel of the chart, at most."""
+        return max(50, int(self.page.width or 800) - 120)
+
+    def update_charts(self, update_control=True):
+        """Redraws both charts for the current window from the daily rollup."""
+        import charts
+        if self.chart_window is None:
+            self.chart_window = charts.ChartWindow(self.store.first_day, self.store.last_day)
+        elif (self.chart_window.first_day, self.chart_window.last_day) != (self.store.first_day, self.store.last_day):
+            self.chart_window.first_day, self.chart_window.last_day = self.store.first_day, self.store.last_day
+            self.chart_window.zoom(1) # Re-clamp to the new data range
+        window = self.chart_window
+        self.chart_range_text.value = f"{window.start:%d %b %Y} – {window.end:%d %b %Y} ({window.days} days)"
+
+        # Daily spend line, downsampled to the pixel width
+        points = charts.downsample(charts.daily_series(self.store, window.start, window.end), self.chart_max_points())
+        max_y = max((y for _, y in points), default=0) or 1
+        self.timeseries_chart.data_series = [
+            ft.LineChartData(
+                data_points=[
+                    ft.LineChartDataPoint(x, y, tooltip=f"{window.start + timedelta(days=x):%d %b %Y}\n₹{y:.2f}")
+                    for x, y in points
+                ],
+                stroke_width=2,
+                color="#5c9ced",
+                below_line_bgcolor=ft.colors.with_opacity(0.2, "#5c9ced"),
+            )
+        ]
+        self.timeseries_chart.min_x, self.timeseries_chart.max_x = 0, window.days - 1
+        self.timeseries_chart.min_y, self.timeseries_chart.max_y = 0, max_y * 1.1
+        self.timeseries_chart.horizontal_grid_lines.interval = max_y / 4
+        label_step = max(1, window.days // 5)
+        self.timeseries_chart.bottom_axis.labels = [
+            ft.ChartAxisLabel(value=x, label=ft.Text(f"{window.start + timedelta(days=x):%d %b %y}", size=11))
+            for x in range(0, window.days, label_step)
+        ]
+
+        # Category totals for the same window
+        category_totals = sorted(charts.category_totals(self.store, window.start, window.end).items(),
+                                 key=lambda item: item[1], reverse=True)
+        self.category_chart.bar_groups = [
+            ft.BarChartGroup(x=i, bar_rods=[
+                ft.BarChartRod(from_y=0, to_y=amount, width=30, color="#4CAF50", tooltip=f"{category}\n₹{amount:.2f}", border_radius=0)
+            ])
+            for i, (category, amount) in enumerate(category_totals)
+        ]
+        self.category_chart.bottom_axis.labels = [
+            ft.ChartAxisLabel(value=i, label=ft.Text(category, size=11))
+            for i, (category, _) in enumerate(category_totals)
+        ]
+        self.category_chart.max_y = (category_totals[0][1] * 1.1) if category_totals else 1
+
+        if update_control:
+            for control in (self.chart_range_text, self.timeseries_chart, self.category_chart):
+                if control.page:
+                    try:
+                        control.update()
+                    except Exception as e:
+                        print(f"Error updating chart: {e}")
+
+    def zoom_chart(self, factor):
+        if self.chart_window:
+            self.chart_window.zoom(factor)
+            self.update_charts()
+
+    def pan_chart(self, fraction):
+        if self.chart_window:
+            self.chart_window.pan(fraction)
+            self.update_charts()
+
+    def reset_chart(self, e):
+        if self.chart_window:
+            self.chart_window.reset()
+            self.update_charts()
+
+    # --- Budget Methods ---
+    def set_budget(self, e):
+        limit_str = self.budget_limit.value.strip()
+        try:
+            limit = float(limit_str)
+            if limit <= 0:
+                self.show_snackbar("Budget limit must be positive!")
+                return
+        except ValueError:
+            self.show_snackbar("Enter a valid number for the budget limit!")
+            return
+
+        category = None if self.budget_category.value == "All" else self.budget_category.value
+        budget = Budget(limit, category=category, period=self.budget_period.value)
+        self.budgets.set(budget) # Replaces any budget with the same category/period
+
+        self.budget_limit.value = ""
+        if self.budget_limit.page:
+            self.budget_limit.update()
+        self.update_budget_list_display()
+        self.show_snackbar(f"{budget.label} budget set to ₹{limit:.2f}")
+
+    def remove_budget(self, budget):
+        self.budgets.remove(budget)
+        self.update_budget_list_display()
+
+    def update_budget_list_display(self, update_control=True):
+        """Rebuilds the budget rows from the maintained period totals (no history scan)."""
+        today = datetime.today()
+        self.budget_list.controls.clear()
+        if not len(self.budgets):
+            self.budget_list.controls.append(ft.Text("No budgets set.", italic=True, color=ft.colors.GREY))
+        for budget in sorted(self.budgets, key=lambda b: (PERIODS.index(b.period), b.category or "")):
+            spent = self.budgets.spent(self.store, budget, today)
+            ratio = spent / budget.limit
+            self.budget_list.controls.append(
+                ft.Row([
+                    ft.Text(budget.label, weight=ft.FontWeight.BOLD, expand=True),
+                    ft.Text(f"₹{spent:.2f} / ₹{budget.limit:.2f}", color=ft.colors.RED_700 if ratio >= 1 else None),
+                    ft.ProgressBar(value=min(ratio, 1), width=100, color=ft.colors.RED_700 if ratio >= 1 else "#4CAF50"),
+                    ft.IconButton(icon=ft.icons.DELETE_OUTLINE, tooltip="Remove Budget",
+                                  on_click=lambda _, b=budget: self.remove_budget(b)),
+                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+            )
+        if update_control and self.budget_list.page:
+            try:
+                self.budget_list.update()
+            except Exception as e:
+                print(f"Error updating budget_list: {e}")
+
     def filter_expenses(self, e):
-        query = self.search_expense.value.strip().lower()
-        if not query:
-             filtered_expenses = self.expenses
-        else:
-            filtered_expenses = [
-                expense for expense in self.expenses
-                if query in expense["name"].lower() or \
-                   query in expense["category"].lower() or \
-                   query in expense["date"].strftime('%Y-%m-%d')
-            ]
+        from query import QueryError, run_query
+        query = self.search_expense.value.strip()
+        if query != self.list_query: # New search: back to the first page
+            self.list_query, self.list_limit = query, self.LIST_PAGE
+        # Query language (see query.py) planned against the store's indexes
+        try:
+            if self.all_ledgers: # Every ledger runs it (on the shards, if any), merged newest first
+                filtered_expenses = self.ledgers.search(query, limit=self.list_limit + 1)
+            elif query:
+                with self.store.lock:
+                    filtered_expenses = run_query(self.store, query)
+            else:
+                filtered_expenses = self.snapshot_expenses()
+        except QueryError as err:
+            self.search_expense.error_text = str(err)
+            self.update_if_attached(self.search_expense)
+            return
+        if self.search_expense.error_text:
+            self.search_expense.error_text = None
+            self.update_if_attached(self.search_expense)
         # Update display with filtered list (safe to update here as user typed)
         self.update_expense_list_display(filtered_expenses)
 
+    def matches_search(self, expense):
+        from query import QueryError, parse_query
+        query = self.search_expense.value.strip()
+        try:
+            return all(term.resolve(self.store).matches(expense) for term in parse_query(query))
+        except QueryError:
+            return False
+
+    def build_expense_row(self, expense, ledger=None):
+        """Builds one clickable list row; `data` carries the expense id.
+           `ledger` is set for rows of the combined view."""
+        if ledger is None:
+            on_click = lambda _, expense_id=expense["id"]: self.edit_expense_dialog(expense_id)
+        else:
+            on_click = lambda _, expense_id=expense["id"]: self.open_in_ledger(ledger, expense_id)
+        return ft.Container(
+            content=self.build_expense_row_content(expense, ledger),
+            padding=ft.padding.symmetric(vertical=8, horizontal=12),
+            margin=ft.margin.only(bottom=5),
+            bgcolor=ft.colors.with_opacity(0.05, ft.colors.BLUE_GREY),
+            border_radius=8,
+            ink=True,
+            data=expense["id"],
+            on_click=on_click,
+        )
+
+    def build_expense_row_content(self, expense, ledger=None):
+        return ft.Row([
+            ft.Icon(ft.icons.LABEL_OUTLINE, color="#4CAF50", tooltip=expense['category']),
+            ft.Column([
+                ft.Text(expense["name"], size=15, weight=ft.FontWeight.W_500),
+                ft.Text(" ".join(f"#{tag}" for tag in expense["tags"]), size=12, color="#7E57C2", visible=bool(expense["tags"])),
+                ft.Text(ledger or "", size=12, color="#607D8B", visible=ledger is not None),
+            ], spacing=0, expand=True),
+            ft.Text(f"₹{expense['amount']:.2f}", size=15, weight=ft.FontWeight.BOLD, color="#2196F3", text_align=ft.TextAlign.RIGHT),
+            ft.Text(expense['date'].strftime('%d %b %Y'), size=13, color="#757575", text_align=ft.TextAlign.RIGHT),
+        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN, vertical_alignment=ft.CrossAxisAlignment.CENTER)
 
     def update_expense_list_display(self, expenses_to_display, update_control=True):
-        """Rebuilds the expense list view.
+        """Rebuilds the expense list view: the first `list_limit` rows, then a
+           "Show more" button if there are more.
            Avoids calling update() if update_control is False or control not on page.
         """
         self.expense_list.controls.clear()
+        self.expense_rows = {} # expense id -> row Container currently shown
         if not expenses_to_display:
             self.expense_list.controls.append(ft.Text("No expenses found.", italic=True, color=ft.colors.GREY))
         else:
-            for expense in expenses_to_display: # Assumes sorted already
-                self.expense_list.controls.append(
-                     ft.Container(
-                         content=ft.Row([
-                             ft.Icon(ft.icons.LABEL_OUTLINE, color="#4CAF50", tooltip=expense['category']),
-                             ft.Text(expense["name"], size=15, weight=ft.FontWeight.W_500, expand=True),
-                             ft.Text(f"₹{expense['amount']:.2f}", size=15, weight=ft.FontWeight.BOLD, color="#2196F3", text_align=ft.TextAlign.RIGHT),
-                             ft.Text(expense['date'].strftime('%d %b %Y'), size=13, color="#757575", text_align=ft.TextAlign.RIGHT),
-                         ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN, vertical_alignment=ft.CrossAxisAlignment.CENTER),
-                         padding=ft.padding.symmetric(vertical=8, horizontal=12),
-                         margin=ft.margin.only(bottom=5),
-                         bgcolor=ft.colors.with_opacity(0.05, ft.colors.BLUE_GREY),
-                         border_radius=8,
-                         ink=True,
-                         # on_click=lambda _, exp=expense: self.edit_expense_dialog(exp), # Future edit
-                     )
-                 )
+            for expense in expenses_to_display[:self.list_limit]: # Assumes sorted already
+                if self.all_ledgers: # (ledger, expense) pairs; ids are only unique within a ledger
+                    ledger, expense = expense
+                    self.expense_list.controls.append(self.build_expense_row(expense, ledger))
+                    continue
+                row = self.build_expense_row(expense)
+                self.expense_rows[expense["id"]] = row
+                self.expense_list.controls.append(row)
+            if len(expenses_to_display) > self.list_limit:
+                self.expense_list.controls.append(self.show_more_button)
         # Only update the control if requested AND it's part of the page structure
         if update_control and self.expense_list.page:
              try:
@@ -289,6 +682,108 @@ class ExpenseTracker:
              except Exception as e:
                  print(f"Error updating expense_list: {e}")
 
+    def refresh_expense_row(self, expense):
+        """Re-renders a single edited row, moving it only if its date order changed.
+           Falls back to a full rebuild when the row appears in/disappears from the search.
+        """
+        row = self.expense_rows.get(expense["id"])
+        if row is None or not self.matches_search(expense):
+            self.filter_expenses(None)
+            return
+
+        row.content = self.build_expense_row_content(expense)
+        controls = self.expense_list.controls
+        index = controls.index(row)
+        key = self.store.sort_key(expense["id"])
+        # Rows are newest first; binary search the new slot among the other rows
+        del controls[index]
+        more = bool(controls) and controls[-1] is self.show_more_button
+        lo, hi = 0, len(controls) - more
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.store.sort_key(controls[mid].data) > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if more and lo == len(controls) - 1: # Moved past the page; it may belong on a later one
+            self.filter_expenses(None)
+            return
+        controls.insert(lo, row)
+
+        target = row if lo == index else self.expense_list
+        if target.page:
+            try:
+                target.update()
+            except Exception as e:
+                print(f"Error updating edited row: {e}")
+
+    def edit_expense_dialog(self, expense_id):
+        expense = self.store.get(expense_id)
+        if expense is None:
+            self.show_snackbar("Expense no longer exists!")
+            return
+
+        name_field = ft.TextField(label="Expense Name", value=expense["name"], width=300, border_radius=10)
+        amount_field = ft.TextField(label="Expense Amount", value=f"{expense['amount']:.2f}", width=300, border_radius=10,
+                                    keyboard_type=ft.KeyboardType.NUMBER)
+        category_field = ft.Dropdown(
+            label="Category", value=expense["category"], width=300, border_radius=10,
+            options=[ft.dropdown.Option(opt.key) for opt in self.expense_category.options]
+        )
+        date_field = ft.TextField(label="Expense Date (YYYY-MM-DD)", value=expense["date"].strftime('%Y-%m-%d'),
+                                  width=300, border_radius=10)
+        tags_field = ft.TextField(label="Tags (comma separated)", value=", ".join(expense["tags"]), width=300, border_radius=10)
+
+        def close_dialog(e):
+            self.page.dialog.open = False
+            self.page.update()
+
+        def save_edit(e):
+            name = name_field.value.strip()
+            if not name:
+                self.show_snackbar("Please enter an expense name!")
+                return
+            try:
+                amount = float(amount_field.value.strip())
+                if amount <= 0:
+                    self.show_snackbar("Amount must be positive!")
+                    return
+            except ValueError:
+                self.show_snackbar("Enter a valid number for the amount!")
+                return
+            try:
+                date_value = datetime.strptime(date_field.value.strip(), '%Y-%m-%d')
+            except ValueError:
+                self.show_snackbar("Enter the date as YYYY-MM-DD!")
+                return
+
+            changes = {"name": name, "amount": amount, "category": category_field.value, "date": date_value,
+                       "tags": normalize_tags(tags_field.value or "")}
+            if date_value.date() == expense["date"].date():
+                changes["date"] = expense["date"] # Keep the original time of day
+            changes = {field: value for field, value in changes.items() if value != expense[field]}
+            close_dialog(e)
+            if not changes:
+                return
+            with self.store.lock:
+                updated = self.store.update(expense_id, **changes) # The categorizer relearns via the store event
+            self.refresh_expense_row(updated)
+            self.calculate_total()
+            self.show_snackbar("Expense Updated")
+
+        self.page.dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Edit Expense"),
+            content=ft.Column([name_field, amount_field, category_field, date_field, tags_field], tight=True, spacing=10),
+            actions=[
+                ft.TextButton("Cancel", on_click=close_dialog),
+                ft.TextButton("Save", on_click=save_edit),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+            open=True,
+        )
+        self.page.update()
+
     def show_snackbar(self, message: str, color: str = ft.colors.BLACK):
         """Helper to show snackbar."""
         if not self.page: return # Guard against page not being available
@@ -307,7 +802,9 @@ class ExpenseTracker:
         # Set the state of controls based on current data, but DON'T update them individually here.
         self.calculate_total(update_control=False)
         # Pass the current expenses to be displayed initially. Don't update the list control itself here.
-        self.update_expense_list_display(self.expenses, update_control=False)
+        self.update_expense_list_display(self.ledgers.search("", limit=self.list_limit + 1) if self.all_ledgers
+                                         else self.snapshot_expenses(),
+                                         update_control=False)
 
         date_input_row = ft.Row(
             [self.date_display, self.date_picker_button],
@@ -318,6 +815,10 @@ class ExpenseTracker:
                 ft.ElevatedButton("Add Expense", icon=ft.icons.ADD, on_click=self.add_expense, bgcolor=ft.colors.GREEN_700, color=ft.colors.WHITE),
                 ft.ElevatedButton("Delete Recent", icon=ft.icons.DELETE_SWEEP, on_click=self.delete_last_expense, bgcolor=ft.colors.ORANGE_700, color=ft.colors.WHITE), # Renamed button
                 ft.ElevatedButton("Clear All", icon=ft.icons.CLEAR_ALL, on_click=self.clear_all_expenses, bgcolor=ft.colors.RED_700, color=ft.colors.WHITE),
+                ft.IconButton(icon=ft.icons.UNDO, tooltip="Undo", on_click=self.undo_last),
+                ft.IconButton(icon=ft.icons.REDO, tooltip="Redo", on_click=self.redo_last),
+                ft.IconButton(icon=ft.icons.UPLOAD_FILE, tooltip="Import CSV", on_click=self.pick_import_file),
+                ft.IconButton(icon=ft.icons.SYNC, tooltip="Sync", on_click=self.sync_now, visible=self.sync_client is not None),
             ],
             alignment=ft.MainAxisAlignment.SPACE_EVENLY # Changed alignment
         )
@@ -325,12 +826,17 @@ class ExpenseTracker:
         return ft.Column(
             controls=[
                 ft.Text("Expense Tracker", size=30, weight=ft.FontWeight.BOLD, color="#2196F3"),
+                ft.Row([
+                    self.ledger_picker,
+                    ft.IconButton(icon=ft.icons.CREATE_NEW_FOLDER, tooltip="New Ledger", on_click=self.new_ledger_dialog),
+                ], spacing=5),
                 ft.Divider(height=10, color=ft.colors.TRANSPARENT),
                 ft.Container(
                     content=ft.Column([
                         self.expense_name,
                         self.expense_amount,
                         self.expense_category,
+                        self.expense_tags,
                         date_input_row,
                         ft.Divider(height=15, color=ft.colors.TRANSPARENT),
                         action_buttons_row,
@@ -373,6 +879,7 @@ class ExpenseTracker:
                 self.expense_name,
                 self.expense_amount,
                 self.expense_category,
+                self.expense_tags,
                 date_input_row,
                 ft.Divider(height=25, color=ft.colors.TRANSPARENT),
                 ft.ElevatedButton(
@@ -383,59 +890,167 @@ class ExpenseTracker:
             horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=20, expand=True
         )
 
+    def build_tag_section(self):
+        """Per-tag totals (maintained by the store's tag index); empty if no tags are used."""
+        tag_totals = self.store.tag_totals()
+        if not tag_totals:
+            return []
+        rows = [
+            ft.Row([ft.Text(f"#{tag}:", weight=ft.FontWeight.BOLD, color="#7E57C2"), ft.Text(f"₹{total:.2f} ({count})")],
+                   alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+            for tag, (total, count) in sorted(tag_totals.items(), key=lambda item: item[1][0], reverse=True)
+        ]
+        return [
+            ft.Divider(height=15),
+            ft.Container(
+                content=ft.Column([
+                    ft.Text("Spending by Tag", style=ft.TextThemeStyle.TITLE_MEDIUM, weight=ft.FontWeight.BOLD),
+                    ft.Text("Filter with tag:work, tag:work|travel or -tag:cash in the search box.", size=12, color="#757575"),
+                    ft.Divider(height=5),
+                    *rows
+                ], spacing=8),
+                padding=20, bgcolor="#ede7f6", border_radius=10
+            ),
+        ]
+
+    def build_forecast_section(self):
+        """Next months' spend per category, forecast from the monthly rollups."""
+        forecasts = self.forecaster.forecast_all()
+        if not forecasts:
+            return []
+        overall = forecasts.pop(None)
+        months = [datetime(year, month, 1).strftime("%b %Y") for year, month in overall.months]
+
+        def forecast_row(label, forecast, bold=False):
+            weight = ft.FontWeight.BOLD if bold else None
+            return ft.Row(
+                [ft.Text(label, weight=ft.FontWeight.BOLD, width=120),
+                 ft.Text(f"₹{forecast.last_value:.0f}", width=90, weight=weight)]
+                + [ft.Text(f"₹{value:.0f}", width=90, weight=weight) for value in forecast.values],
+                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+            )
+
+        last_month = datetime(overall.last_month[0], overall.last_month[1], 1).strftime("%b %Y")
+        header = ft.Row([ft.Text("", width=120), ft.Text(last_month, width=90, color="#757575")]
+                        + [ft.Text(f"{month} (est.)", width=90, color="#757575") for month in months],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+        return [
+            ft.Divider(height=15),
+            ft.Container(
+                content=ft.Column([
+                    ft.Text("Forecast", style=ft.TextThemeStyle.TITLE_MEDIUM, weight=ft.FontWeight.BOLD),
+                    ft.Text("Fitted on complete months; the current month is forecast too, as an estimate.",
+                            size=12, color="#757575"),
+                    ft.Divider(height=5),
+                    header,
+                    forecast_row("All", overall, bold=True),
+                    *[forecast_row(category, forecast) for category, forecast in
+                      sorted(forecasts.items(), key=lambda item: item[1].values[0], reverse=True)],
+                ], spacing=8),
+                padding=20, bgcolor="#e3f2fd", border_radius=10
+            ),
+        ]
+
+    def build_anomalies(self):
+        """Builds the view listing recently flagged unusual expenses (newest first)."""
+        with self.store.lock: # The loader scans imports into the detector on its own thread
+            flagged = list(reversed(self.anomalies.flagged))
+        rows = []
+        for anomaly in flagged:
+            expense = anomaly.expense
+            rows.append(ft.Container(
+                content=ft.Row([
+                    ft.Icon(ft.icons.WARNING_AMBER, color=ft.colors.ORANGE_800),
+                    ft.Column([
+                        ft.Text(f"{expense['name']} - ₹{anomaly.amount:.2f}", weight=ft.FontWeight.BOLD),
+                        ft.Text(f"{anomaly.category} | {expense['date']:%Y-%m-%d} | typical ₹{anomaly.typical:.2f}, "
+                                f"{anomaly.amount / anomaly.typical:.1f}x", size=12, color="#757575"),
+                    ], spacing=2, expand=True),
+                    ft.IconButton(icon=ft.icons.CHECK, tooltip="Looks fine",
+                                  on_click=lambda e, a=anomaly: self.dismiss_anomaly(a)),
+                ]),
+                padding=10, bgcolor="#fff3e0", border_radius=8,
+            ))
+        return ft.Column(
+            controls=[
+                ft.Text("Unusual Expenses", size=28, weight=ft.FontWeight.BOLD, color="#2196F3"),
+                ft.Text("Amounts far above what's usual for their category (recent habits weigh more).",
+                        size=12, color="#757575"),
+                ft.Divider(height=15),
+                *(rows or [ft.Text("Nothing unusual so far.", italic=True, color=ft.colors.GREY, size=16)]),
+            ],
+            horizontal_alignment=ft.CrossAxisAlignment.STRETCH, spacing=10, expand=True,
+        )
+
+    def dismiss_anomaly(self, anomaly):
+        self.anomalies.dismiss(anomaly)
+        if self.current_tab == 3:
+            self.main_content_area.controls.clear()
+            self.main_content_area.controls.append(self.build_anomalies())
+            self.page.update()
+
+    def build_budget_section(self):
+        """Builds the budget form and list shown on the Analytics screen."""
+        self.update_budget_list_display(update_control=False)
+        return ft.Container(
+            content=ft.Column([
+                ft.Text("Budgets", style=ft.TextThemeStyle.TITLE_MEDIUM, weight=ft.FontWeight.BOLD), ft.Divider(height=5),
+                ft.Row([
+                    self.budget_category,
+                    self.budget_period,
+                    self.budget_limit,
+                    ft.ElevatedButton("Set Budget", icon=ft.icons.SAVINGS, on_click=self.set_budget, bgcolor=ft.colors.GREEN_700, color=ft.colors.WHITE),
+                ], wrap=True, spacing=10),
+                self.budget_list,
+            ], spacing=8),
+            padding=20, bgcolor="#fff8e1", border_radius=10
+        )
+
     def build_analytics(self):
         """Builds the Analytics screen UI structure."""
+        self.build_analytics_controls()
         # Calculate stats, but don't update controls here
         self.calculate_total(update_control=False)
 
-        if not self.expenses:
+        with self.store.lock: # Read the stats together; the API thread may be writing
+            count = len(self.store)
+            if count:
+                total = self.store.total
+                lowest_exp, highest_exp = self.store.amount_extremes() # Amount index + zone maps, no full scan
+                category_totals = self.store.category_totals()
+
+        if not count:
              return ft.Column(
                   controls=[
                        ft.Text("Expense Analytics", size=28, weight=ft.FontWeight.BOLD, color="#2196F3"),
-                       ft.Text("No expense data available to analyze.", italic=True, color=ft.colors.GREY, size=16)
+                       ft.Text("No expense data available to analyze.", italic=True, color=ft.colors.GREY, size=16),
+                       self.build_budget_section()
                   ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=20, expand=True
              )
 
-        total = sum(exp["amount"] for exp in self.expenses)
-        highest_exp = max(self.expenses, key=lambda x: x["amount"], default={"amount": 0, "name": "N/A"})
-        lowest_exp = min(self.expenses, key=lambda x: x["amount"], default={"amount": 0, "name": "N/A"})
-        avg = total / len(self.expenses) if self.expenses else 0
+        avg = total / count
 
-        category_totals = {}
-        for exp in self.expenses:
-            category_totals[exp["category"]] = category_totals.get(exp["category"], 0) + exp["amount"]
         category_summary = [
             ft.Row([ft.Text(f"{cat}:", weight=ft.FontWeight.BOLD), ft.Text(f"₹{amount:.2f}")], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
             for cat, amount in sorted(category_totals.items(), key=lambda item: item[1], reverse=True)
         ]
 
-        # Build chart bars data (don't update self.chart_bars here)
-        chart_bars_controls = []
-        recent_expenses = self.expenses[:10] # Assumes sorted desc
-        max_chart_amount = max(exp["amount"] for exp in recent_expenses) if recent_expenses else 1
-        max_bar_height = 150
-
-        for exp in recent_expenses:
-            bar_height = (exp["amount"] / max_chart_amount) * max_bar_height if max_chart_amount > 0 else 0
-            bar = ft.Container(
-                height=max(bar_height, 5), width=25, bgcolor="#5c9ced",
-                border_radius=ft.border_radius.only(topLeft=5, topRight=5),
-                tooltip=f"{exp['name']} ({exp['category']})\n₹{exp['amount']:.2f}\n{exp['date']:%d-%b-%Y}"
-            )
-            chart_bars_controls.append(bar)
-        # Assign the calculated bars to the Row control *after* calculation
-        self.chart_bars.controls = chart_bars_controls
+        # Build chart data from the rollup (don't update the chart controls here)
+        self.update_charts(update_control=False)
 
         # Return the Column structure for analytics
         return ft.Column(
             controls=[
                 ft.Text("Expense Analytics", size=28, weight=ft.FontWeight.BOLD, color="#2196F3"),
                 ft.Divider(height=15),
+                *self.build_ledger_section(),
                 ft.Container(
                     content=ft.Column([
                          ft.Text("Summary Statistics", style=ft.TextThemeStyle.TITLE_MEDIUM, weight=ft.FontWeight.BOLD), ft.Divider(height=5),
-                        ft.Row([ft.Text("Total Expenses:", weight=ft.FontWeight.BOLD), self.total_expense_text]), # Embed total_expense_text here
-                        ft.Row([ft.Text("Number of Expenses:", weight=ft.FontWeight.BOLD), ft.Text(f"{len(self.expenses)}")]),
+                        ft.Row([ft.Text("Total Expenses:", weight=ft.FontWeight.BOLD),
+                                # Embed total_expense_text here, unless it holds the combined total
+                                ft.Text(f"₹{total:.2f}") if self.all_ledgers else self.total_expense_text]),
+                        ft.Row([ft.Text("Number of Expenses:", weight=ft.FontWeight.BOLD), ft.Text(f"{count}")]),
                         ft.Row([ft.Text("Average Expense:", weight=ft.FontWeight.BOLD), ft.Text(f"₹{avg:.2f}")]),
                         ft.Row([ft.Text("Highest Expense:", weight=ft.FontWeight.BOLD), ft.Text(f"₹{highest_exp['amount']:.2f} ({highest_exp['name']})")]),
                         ft.Row([ft.Text("Lowest Expense:", weight=ft.FontWeight.BOLD), ft.Text(f"₹{lowest_exp['amount']:.2f} ({lowest_exp['name']})")]),
@@ -450,13 +1065,33 @@ class ExpenseTracker:
                     ], spacing=8),
                     padding=20, bgcolor="#e8f5e9", border_radius=10
                 ),
+                *self.build_tag_section(),
+                *self.build_forecast_section(),
                 ft.Divider(height=15),
-                ft.Text("Recent Expense Chart (Last 10)", size=20, weight=ft.FontWeight.BOLD, color="#4CAF50"),
+                self.build_budget_section(),
+                ft.Row([
+                    ft.ElevatedButton("Export Monthly Statements", icon=ft.icons.PICTURE_AS_PDF, on_click=self.pick_statements_dir),
+                ], alignment=ft.MainAxisAlignment.CENTER),
+                ft.Divider(height=15),
+                ft.Text("Daily Spending", size=20, weight=ft.FontWeight.BOLD, color="#4CAF50"),
+                ft.Row([
+                    ft.IconButton(icon=ft.icons.CHEVRON_LEFT, tooltip="Pan Back", on_click=lambda _: self.pan_chart(-0.5)),
+                    ft.IconButton(icon=ft.icons.ZOOM_IN, tooltip="Zoom In", on_click=lambda _: self.zoom_chart(0.5)),
+                    ft.IconButton(icon=ft.icons.ZOOM_OUT, tooltip="Zoom Out", on_click=lambda _: self.zoom_chart(2)),
+                    ft.IconButton(icon=ft.icons.ZOOM_OUT_MAP, tooltip="Full History", on_click=self.reset_chart),
+                    ft.IconButton(icon=ft.icons.CHEVRON_RIGHT, tooltip="Pan Forward", on_click=lambda _: self.pan_chart(0.5)),
+                    self.chart_range_text,
+                ], alignment=ft.MainAxisAlignment.CENTER, wrap=True),
                 ft.Container(
-                    content=self.chart_bars, # The Row containing the pre-calculated bars
-                    padding=ft.padding.only(top=10, bottom=10), alignment=ft.alignment.center,
+                    content=self.timeseries_chart,
+                    padding=ft.padding.only(top=10, bottom=10, right=20),
+                    bgcolor="#ffffff", border=ft.border.all(1, "#e0e0e0"), border_radius=8,
+                ),
+                ft.Text("Spending by Category (Selected Range)", size=20, weight=ft.FontWeight.BOLD, color="#4CAF50"),
+                ft.Container(
+                    content=self.category_chart,
+                    padding=ft.padding.only(top=10, bottom=10, right=20),
                     bgcolor="#ffffff", border=ft.border.all(1, "#e0e0e0"), border_radius=8,
-                    height=max_bar_height + 30
                 )
             ],
             horizontal_alignment=ft.CrossAxisAlignment.STRETCH, spacing=20, expand=True,
@@ -465,20 +1100,24 @@ class ExpenseTracker:
 
     def switch_tab(self, e):
         """Switches the content displayed based on the selected navbar index."""
-        self.current_tab = e.control.selected_index
-        self.main_content_area.controls.clear() # Clear previous tab content
+        # The startup loader and the API thread write to the store; build every tab under its lock
+        with self.store.lock:
+            self.current_tab = e.control.selected_index
+            self.main_content_area.controls.clear() # Clear previous tab content
 
-        new_content = None
-        if self.current_tab == 0:
-            new_content = self.build_home()
-        elif self.current_tab == 1:
-            new_content = self.build_add_expense()
-        elif self.current_tab == 2:
-            new_content = self.build_analytics()
+            new_content = None
+            if self.current_tab == 0:
+                new_content = self.build_home()
+            elif self.current_tab == 1:
+                new_content = self.build_add_expense()
+            elif self.current_tab == 2:
+                new_content = self.build_analytics()
+            elif self.current_tab == 3:
+                new_content = self.build_anomalies()
 
-        if new_content:
-             # Add the newly built structure to the content area
-             self.main_content_area.controls.append(new_content)
+            if new_content:
+                 # Add the newly built structure to the content area
+                 self.main_content_area.controls.append(new_content)
 
         # Ensure navbar visually reflects the change (might be handled automatically by NavigationBar)
         # self.navbar.selected_index = self.current_tab # Usually not needed if triggered by on_change
@@ -493,6 +1132,338 @@ class ExpenseTracker:
             self.navbar             # Add the navbar
         )
 
+    def read_ledger_csv(self, path):
+        """Yields expense rows from a CSV (name,amount,date[,category][,tags])."""
+        import csv
+
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                date_str = row["date"].strip()
+                date_format = '%Y-%m-%d %H:%M:%S' if len(date_str) > 10 else '%Y-%m-%d'
+                yield {"name": row["name"].strip(), "amount": float(row["amount"]),
+                       "category": (row.get("category") or "").strip() or None,
+                       "date": datetime.strptime(date_str, date_format), "tags": row.get("tags") or ""}
+
+    def import_expenses(self, rows, skip_duplicates=True, ledger=None):
+        """Bulk-adds rows to `ledger` (default: the current one), auto-categorizing
+           the ones without a category.
+           With skip_duplicates, rows identical to a ledger row (same time, name,
+           amount and category) are skipped, and possible duplicates (same day or
+           similar name, or repeats within the file) are held back for review.
+           Unusual amounts are flagged in the same pass over the batch.
+           Returns (imported, auto_categorized, skipped, flagged, held back [(row, match)])."""
+        rows = list(rows)
+        store = self.ledgers[ledger or self.ledger]
+        _, anomalies, _, categorizer = self.ledger_helpers(ledger)
+        skipped = 0
+        held_back = []
+        if skip_duplicates and rows:
+            with store.lock:
+                results = store.check_duplicates(rows) # Hot index plus the sealed years the rows fall in
+            unique = []
+            for row, match in zip(rows, results):
+                if match is None:
+                    unique.append(row)
+                elif match[0] == "identical":
+                    skipped += 1
+                else: # Recurring expenses look like this too: let the user decide
+                    held_back.append((row, match))
+            rows = unique
+        labelled = [row for row in rows if row["category"]]
+        unlabelled = [row for row in rows if not row["category"]]
+        with store.lock:
+            imported = store.load(labelled) # The categorizer learns these through the store's events,
+            auto_categorized = categorizer.predict_many(unlabelled) # so predictions already use them
+            flagged = anomalies.scan(rows) # Against the stats from before the batch
+            imported += store.load(unlabelled)
+            return imported, auto_categorized, skipped, len(flagged), held_back
+
+    def load_ledger(self, path, chunk_size=20000):
+        """Bulk-loads a CSV ledger into the first ledger at startup (trusted, no dedup pass).
+           Goes in chunks, each under the store lock on its own, so typing and
+           tab switches during a long background load wait for a chunk at most."""
+        from itertools import islice
+        ledger = self.ledgers.names()[0]
+        rows = self.read_ledger_csv(path)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            self.import_expenses(chunk, skip_duplicates=False, ledger=ledger)
+
+    def pick_import_file(self, e):
+        if self.needs_ledger():
+            return
+        self.import_picker.pick_files(dialog_title="Import expenses (CSV)", allowed_extensions=["csv"])
+
+    def handle_import_result(self, e):
+        if not e.files:
+            return
+        path = e.files[0].path
+        try:
+            rows = list(self.read_ledger_csv(path))
+            imported, auto_categorized, skipped, flagged, held_back = self.import_expenses(rows)
+        except (OSError, KeyError, ValueError) as err:
+            self.show_snackbar(f"Import failed: {err}", ft.colors.RED_700)
+            return
+        self.refresh_expense_views()
+        message = f"Imported {imported} expenses ({auto_categorized} auto-categorized, {skipped} identical ones skipped)"
+        if held_back:
+            self.review_duplicates(rows, held_back)
+            message += f". {len(held_back)} possible duplicates need a look"
+        if flagged:
+            self.show_snackbar(f"{message}. {flagged} look unusual, see the Unusual tab.", ft.colors.ORANGE_800)
+        else:
+            self.show_snackbar(message)
+
+    def review_duplicates(self, rows, held_back):
+        """Lets the user pick which possible duplicates of an import to add after all.
+           `rows` is the whole file (batch matches point into it)."""
+        def describe(row):
+            return f"'{row['name']}' ₹{row['amount']:.2f} on {row['date']:%Y-%m-%d %H:%M}"
+
+        checkboxes = []
+        for row, (kind, match, _) in held_back:
+            if kind == "batch":
+                reason = f"repeats {describe(rows[match])} earlier in the file"
+            else:
+                existing = self.store.get(match)
+                reason = f"{'same day as' if kind == 'exact' else 'similar to'} {describe(existing)}" if existing else "matches a ledger row"
+            checkboxes.append(ft.Checkbox(label=f"{describe(row)} - {reason}", value=True, data=row))
+
+        def close_dialog(e):
+            self.page.dialog.open = False
+            self.page.update()
+
+        def import_selected(e):
+            selected = [checkbox.data for checkbox in checkboxes if checkbox.value]
+            close_dialog(e)
+            if not selected:
+                return
+            imported = self.import_expenses(selected, skip_duplicates=False)[0]
+            self.refresh_expense_views()
+            self.show_snackbar(f"Imported {imported} more expenses")
+
+        self.page.dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Possible Duplicates"),
+            content=ft.Column([
+                ft.Text("These look like expenses you already have. Recurring ones (tickets, subscriptions) are "
+                        "often real: untick the ones that are duplicates.", size=12, color="#757575"),
+                *checkboxes,
+            ], tight=True, spacing=5, scroll=ft.ScrollMode.AUTO, height=400),
+            actions=[
+                ft.TextButton("Skip All", on_click=close_dialog),
+                ft.TextButton("Import Selected", on_click=import_selected),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+            open=True,
+        )
+        self.page.update()
+
+    # --- Ledgers ---
+    def use_ledger(self, name):
+        """Points the app (store, budgets, anomaly stats, forecasts, category model) at ledger `name`."""
+        self.ledger = name
+        self.store = self.ledgers[name]
+        self.expenses = self.store # Sorted view (newest first) over the store
+        self.chart_window = None # The new ledger spans other dates
+
+    def ledger_helpers(self, name=None):
+        """(BudgetBook, AnomalyDetector, Forecaster, Categorizer) of ledger `name`
+           (default: the current one). Made on first use, so their modules load
+           after the first frame."""
+        name = name or self.ledger
+        store = self.ledgers[name]
+        with store.lock: # The startup loader may get here first
+            state = self.ledger_state.get(name)
+            if state is None:
+                from anomaly import AnomalyDetector
+                from categorizer import Categorizer
+                from forecast import Forecaster
+                categorizer = Categorizer()
+                categorizer.watch(store) # Learns/forgets with every change to the ledger, undo included
+                state = self.ledger_state[name] = (BudgetBook(), AnomalyDetector(), Forecaster(store), categorizer)
+            return state
+
+    @property
+    def budgets(self):
+        return self.ledger_helpers()[0]
+
+    @property
+    def anomalies(self):
+        return self.ledger_helpers()[1]
+
+    @property
+    def forecaster(self):
+        return self.ledger_helpers()[2]
+
+    @property
+    def categorizer(self):
+        return self.ledger_helpers()[3]
+
+    def ledger_options(self):
+        options = [ft.dropdown.Option(key=name, text=name) for name in self.ledgers.names()]
+        if len(options) > 1:
+            options.append(ft.dropdown.Option(key=ALL_LEDGERS, text="All ledgers"))
+        return options
+
+    def needs_ledger(self):
+        """True (after telling the user) while the combined view is shown; changes go to one ledger."""
+        if not self.all_ledgers:
+            return False
+        self.show_snackbar("Pick a ledger first, the combined view is read-only")
+        return True
+
+    def switch_ledger(self, e):
+        if self.ledger_picker.value == ALL_LEDGERS:
+            self.all_ledgers = True
+        else:
+            self.all_ledgers = False
+            self.use_ledger(self.ledger_picker.value)
+        self.refresh_expense_views()
+
+    def open_in_ledger(self, ledger, expense_id):
+        """Row click in the combined view: switch to the row's ledger, then edit it there."""
+        self.ledger_picker.value = ledger
+        self.update_if_attached(self.ledger_picker)
+        self.switch_ledger(None)
+        self.edit_expense_dialog(expense_id)
+
+    def new_ledger_dialog(self, e):
+        name_field = ft.TextField(label="Ledger Name", hint_text="e.g. Business, Household", width=300, border_radius=10)
+
+        def close_dialog(e):
+            self.page.dialog.open = False
+            self.page.update()
+
+        def create(e):
+            name = name_field.value.strip()
+            if name == ALL_LEDGERS:
+                self.show_snackbar("Pick another name!")
+                return
+            try:
+                self.ledgers.add(name)
+            except ValueError as err:
+                self.show_snackbar(str(err))
+                return
+            threading.Thread(target=self.ledgers.start, daemon=True).start() # Now there's a combined view
+            close_dialog(e)
+            self.ledger_picker.options = self.ledger_options()
+            self.ledger_picker.value = name.strip()
+            self.update_if_attached(self.ledger_picker)
+            self.switch_ledger(None)
+            self.show_snackbar(f"Ledger '{name.strip()}' created")
+
+        self.page.dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("New Ledger"),
+            content=name_field,
+            actions=[
+                ft.TextButton("Cancel", on_click=close_dialog),
+                ft.TextButton("Create", on_click=create),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+            open=True,
+        )
+        self.page.update()
+
+    def build_ledger_section(self):
+        """Count and total per ledger, asked of every ledger at once; empty with a single ledger."""
+        if len(self.ledgers) < 2:
+            return []
+        summary = self.ledgers.summary()
+        rows = [
+            ft.Row([ft.Text(f"{name}:", weight=ft.FontWeight.BOLD), ft.Text(f"₹{total:.2f} ({count})")],
+                   alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+            for name, (count, total) in summary.items()
+        ]
+        rows.append(ft.Row([ft.Text("All ledgers:", weight=ft.FontWeight.BOLD),
+                            ft.Text(f"₹{sum(total for _, total in summary.values()):.2f} "
+                                    f"({sum(count for count, _ in summary.values())})", weight=ft.FontWeight.BOLD)],
+                           alignment=ft.MainAxisAlignment.SPACE_BETWEEN))
+        return [
+            ft.Container(
+                content=ft.Column([
+                    ft.Text("Ledgers", style=ft.TextThemeStyle.TITLE_MEDIUM, weight=ft.FontWeight.BOLD),
+                    ft.Text(f"The rest of this page covers '{self.ledger}'.", size=12, color="#757575"),
+                    ft.Divider(height=5),
+                    *rows
+                ], spacing=8),
+                padding=20, bgcolor="#eceff1", border_radius=10
+            ),
+            ft.Divider(height=15),
+        ]
+
+    # --- Statements ---
+    def pick_statements_dir(self, e):
+        self.statements_picker.get_directory_path(dialog_title="Folder for monthly statements")
+
+    def handle_statements_dir(self, e):
+        if not e.path:
+            return
+        self.show_snackbar("Rendering statements...")
+        # Rendering runs on a process pool; keep the handler (and the UI) free meanwhile
+        threading.Thread(target=self.export_statements, args=(e.path,), daemon=True).start()
+
+    def export_statements(self, out_dir):
+        import reports
+
+        try:
+            result = reports.generate_statements(self.store, out_dir)
+        except (OSError, ValueError) as err:
+            self.show_snackbar(f"Export failed: {err}", ft.colors.RED_700)
+            return
+        self.show_snackbar(f"Statements: {len(result['rendered'])} months rendered, "
+                           f"{len(result['cached'])} unchanged ({out_dir})")
+
+    # --- Sync ---
+    def sync_now(self, e):
+        if self.sync_client is None:
+            return
+        try:
+            result = self.sync_client.sync() # Takes the synced ledger's lock itself, not during the round trip
+        except (OSError, ValueError) as err: # URLError is an OSError
+            self.show_snackbar(f"Sync failed: {err}", ft.colors.RED_700)
+            return
+        if result["pulled"]:
+            self.refresh_expense_views()
+        self.show_snackbar(f"Synced: sent {result['pushed']}, received {result['pulled']} changes")
+
+    def build_skeleton(self):
+        """A cheap placeholder shown as the first frame while the app loads."""
+        return ft.Column(
+            controls=[
+                ft.Text("Expense Tracker", size=30, weight=ft.FontWeight.BOLD, color="#2196F3"),
+                ft.Divider(height=40, color=ft.colors.TRANSPARENT),
+                ft.ProgressRing(),
+                ft.Text("Loading your expenses...", italic=True, color=ft.colors.GREY),
+            ],
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=15, expand=True
+        )
+
+    def mark_startup(self, stage):
+        self.startup_timings[stage] = time.perf_counter() - STARTED
+        if os.environ.get("EXPENSE_DEBUG"):
+            print(f"Startup: {stage} after {self.startup_timings[stage] * 1000:.1f} ms")
+
+    def finish_startup(self):
+        """Loads data and builds the home tab, then swaps it in for the skeleton."""
+        if self.ledger_path:
+            try:
+                self.load_ledger(self.ledger_path)
+                self.mark_startup("data loaded")
+            except Exception as e:
+                print(f"Error loading ledger {self.ledger_path}: {e}")
+        with self.store.lock: # switch_tab swaps the content under the same lock
+            if self.current_tab == 0: # User may have switched tabs meanwhile
+                self.main_content_area.controls.clear()
+                self.main_content_area.controls.append(self.build_home())
+        self.page.update()
+        self.mark_startup("interactive")
+        if len(self.ledgers) > 1: # Copy the ledgers into the shards now, not on the first combined view
+            self.ledgers.start()
+
     def main(self):
         """Sets up the initial page configuration and loads the first view."""
         self.page.title = "Expense Tracker Pro"
@@ -505,17 +1476,51 @@ class ExpenseTracker:
         # Build the page structure (content area + navbar)
         self.build_page_structure()
 
+        if self.api_port is not None:
+            from api import ExpenseAPI
+            api_store = self.ledgers[self.ledgers.names()[0]] # Same ledger as sync
+            port = ExpenseAPI(api_store, on_change=self.refresh_expense_views).start_in_thread(port=self.api_port)
+            print(f"Expense API listening on http://127.0.0.1:{port}")
+
+        if self.fast_start:
+            # Paint the skeleton right away; everything else happens off the event handler
+            self.main_content_area.controls.append(self.build_skeleton())
+            self.page.update()
+            self.mark_startup("first paint")
+            threading.Thread(target=self.finish_startup, daemon=True).start()
+            return
+
+        if self.ledger_path:
+            self.load_ledger(self.ledger_path)
+
         # Build and load the initial content (Home tab)
         initial_content = self.build_home()
         self.main_content_area.controls.append(initial_content)
 
         # Perform the initial page render
         self.page.update()
+        self.mark_startup("first paint")
+        if len(self.ledgers) > 1:
+            threading.Thread(target=self.ledgers.start, daemon=True).start()
 
 # --- App Entry Point ---
 def main(page: ft.Page):
-    app = ExpenseTracker(page)
+    # EXPENSE_LEDGER=path.csv preloads a ledger; EXPENSE_FAST_START=0 restores the blocking startup
+    # EXPENSE_SYNC_URL=http://127.0.0.1:8765 (see sync_server.py) enables sync, EXPENSE_DEVICE_ID names this device
+    # EXPENSE_API_PORT=8080 serves the HTTP API (see api.py) on the same store
+    # EXPENSE_DEBUG=1 prints startup timings
+    # EXPENSE_LEDGERS=Personal,Business,Household sets up several ledgers (EXPENSE_LEDGER loads into the first)
+    app = ExpenseTracker(
+        page,
+        fast_start=os.environ.get("EXPENSE_FAST_START", "1") != "0",
+        ledger_path=os.environ.get("EXPENSE_LEDGER") or None,
+        sync_url=os.environ.get("EXPENSE_SYNC_URL") or None,
+        device_id=os.environ.get("EXPENSE_DEVICE_ID") or None,
+        api_port=int(os.environ["EXPENSE_API_PORT"]) if os.environ.get("EXPENSE_API_PORT") else None,
+        ledger_names=[name.strip() for name in os.environ.get("EXPENSE_LEDGERS", "").split(",") if name.strip()] or None,
+    )
     app.main() # Run the app's setup
 
 # Run the Flet app
-ft.app(target=main)
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,996 @@
+# -*- coding: utf-8 -*-
+"""In-memory expense store with running aggregates, plus budget tracking.
+
+The store keeps expenses ordered by date (newest first when iterated) and
+maintains per-period / per-category totals on every insert and removal, so
+totals and budget checks never have to rescan the history. Every mutation is
+recorded as an inverse operation so it can be undone and redone. A trigram
+index over the searchable text lets substring search skip non-matching rows,
+and category / amount indexes back the structured queries in query.py.
+Tags are indexed as one bitmap per tag over row slots, so tag filters are
+plain bitwise operations.
+
+Old years can be sealed into a cold tier (tiers.py): their rows leave the
+per-row indexes for compressed columnar segments, while the compact
+aggregates (period totals, daily rollup) keep covering every row. The
+index lookups used by query plans cover the hot tier; query.py handles
+segments through their zone maps.
+"""
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+import gc
+from heapq import heappop, heappush, merge
+import itertools
+import threading
+
+# Periods that aggregates (and budgets) are maintained for.
+PERIODS = ("month", "year", "all")
+PERIOD_LABELS = {"month": "Monthly", "year": "Yearly", "all": "Overall"}
+EDITABLE_FIELDS = ("name", "amount", "category", "date", "tags")
+
+# Byte value -> positions of its set bits, for walking bitmaps a byte at a time
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def normalize_tags(tags):
+    """Returns tags as a sorted tuple of unique, lowercase, trimmed strings.
+    Accepts an iterable or a comma separated string."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return tuple(sorted({tag.strip().lower() for tag in tags if tag and tag.strip()}))
+
+
+def search_fields(expense):
+    """The lowercase strings the search box matches against."""
+    return (expense["name"].lower(), expense["category"].lower(), expense["date"].strftime('%Y-%m-%d'))
+
+
+def text_matches(expense, query):
+    """Same as `any(query in field for field in search_fields(expense))`, but
+    cheap checks first and the date is only formatted if it could match."""
+    if query in expense["name"].lower() or query in expense["category"].lower():
+        return True
+    if query.strip("0123456789-"):
+        return False
+    return query in expense["date"].strftime('%Y-%m-%d')
+
+
+class _Newest:
+    """Heap entry ordering rows newest first (ids may be str or int, so no negation)."""
+    __slots__ = ("key", "stream", "expense")
+
+    def __init__(self, key, stream, expense):
+        self.key, self.stream, self.expense = key, stream, expense
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+@lru_cache(maxsize=65536)
+def trigrams(text):
+    # Cached: names, categories and dates repeat a lot across a ledger
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def period_key(period, date):
+    """Returns the bucket key of `date` for the given period."""
+    if period == "month":
+        return (date.year, date.month)
+    if period == "year":
+        return (date.year,)
+    return ()
+
+
+@contextmanager
+def _gc_paused():
+    """Bulk index builds allocate millions of small containers; pausing the
+    cyclic GC stops it from rescanning them over and over (none are cyclic)."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class TagBitmaps:
+    """One bitmap per tag over row slots, plus a bitmap of live slots.
+
+    Bitmaps are mutable bytearrays so setting/clearing a bit is O(1); queries
+    turn them into Python ints and combine them with &, | and ~, which run
+    over machine words in C. Slots of removed rows are reused.
+    """
+
+    def __init__(self):
+        self.slot_of = {}  # expense id -> slot
+        self.slot_ids = [] # slot -> expense id (None when free)
+        self.slot_amounts = array('d')
+        self.free = []
+        self.live = bytearray()
+        self.bits = {}     # tag -> bytearray
+        self.totals = {}   # tag -> running total amount
+        self.counts = {}   # tag -> number of rows
+
+    @staticmethod
+    def _set(bitmap, slot, on):
+        byte = slot >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte - len(bitmap) + 1))
+        if on:
+            bitmap[byte] |= 1 << (slot & 7)
+        else:
+            bitmap[byte] &= ~(1 << (slot & 7)) & 0xFF
+
+    def add(self, expense):
+        if self.free:
+            slot = self.free.pop()
+            self.slot_ids[slot] = expense["id"]
+            self.slot_amounts[slot] = expense["amount"]
+        else:
+            slot = len(self.slot_ids)
+            self.slot_ids.append(expense["id"])
+            self.slot_amounts.append(expense["amount"])
+        self.slot_of[expense["id"]] = slot
+        self._set(self.live, slot, True)
+        self._tag(slot, expense.get("tags", ()), expense["amount"], True)
+
+    def remove(self, expense):
+        slot = self.slot_of.pop(expense["id"])
+        self._tag(slot, expense.get("tags", ()), expense["amount"], False)
+        self._set(self.live, slot, False)
+        self.slot_ids[slot] = None
+        self.free.append(slot)
+
+    def replace(self, old, new):
+        slot = self.slot_of[old["id"]]
+        self._tag(slot, old.get("tags", ()), old["amount"], False)
+        self._tag(slot, new.get("tags", ()), new["amount"], True)
+        self.slot_amounts[slot] = new["amount"]
+
+    def _tag(self, slot, tags, amount, on):
+        sign = 1 if on else -1
+        for tag in tags:
+            bitmap = self.bits.get(tag)
+            if bitmap is None:
+                bitmap = self.bits[tag] = bytearray()
+            self._set(bitmap, slot, on)
+            self.totals[tag] = self.totals.get(tag, 0) + sign * amount
+            self.counts[tag] = self.counts.get(tag, 0) + sign
+            if not self.counts[tag]:
+                del self.bits[tag], self.totals[tag], self.counts[tag]
+
+    # --- Bitmap algebra helpers ---
+    def bitmap(self, tag):
+        return int.from_bytes(self.bits.get(tag, b""), "little")
+
+    def live_bitmap(self):
+        return int.from_bytes(self.live, "little")
+
+    def _slots(self, bitmap):
+        data = (bitmap & self.live_bitmap()).to_bytes(len(self.live), "little")
+        for byte_index, value in enumerate(data):
+            if value:
+                base = byte_index << 3
+                for bit in _BYTE_BITS[value]:
+                    yield base + bit
+
+    def ids(self, bitmap):
+        slot_ids = self.slot_ids
+        return {slot_ids[slot] for slot in self._slots(bitmap)}
+
+    def total(self, bitmap):
+        amounts = self.slot_amounts
+        return sum(amounts[slot] for slot in self._slots(bitmap))
+
+
+class _Generation:
+    """All row data and derived indexes. Clearing swaps in a fresh generation,
+    so clear-all (and undoing it) is O(1) whatever the ledger size."""
+
+    def __init__(self):
+        self.rows = {}   # id -> expense dict
+        self.keys = []   # ascending (date, id); iterate reversed for newest first
+        # (period, category or None, period key) -> running total
+        self.period_totals = {}
+        self.trigrams = {} # trigram -> set of ids whose search fields contain it
+        self.by_category = {} # category -> set of ids
+        self.amounts = [] # ascending (amount, id)
+        self.daily = {} # date -> {category: total}, the rollup charts are drawn from
+        self.days = []  # sorted dates present in `daily`
+        self.tags = TagBitmaps()
+        self.dedup = None # dedup.DedupIndex, built on first use then kept current
+        self.cold = None # tiers.ColdTier, once anything has been sealed
+        self.stash = {} # listener -> its derived state for these rows, kept while the generation is swapped out
+
+
+class ExpenseStore:
+    """Holds expense dicts ({"id", "name", "amount", "category", "date", "tags"}).
+
+    Behaves like a read-only list sorted by date descending (len, iteration,
+    indexing and slicing), so UI code can keep treating it as `self.expenses`.
+    """
+
+    def __init__(self, history_limit=500, id_prefix=None, hot_years=None):
+        self._gen = _Generation()
+        self._ids = itertools.count(1)
+        self.id_prefix = id_prefix # e.g. a device id, so ids stay unique across synced replicas
+        self.hot_years = hot_years # Years kept hot by auto_tier() (None = never seal automatically)
+        self._sealed_before = datetime.min
+        self.history_limit = history_limit
+        self._undo = deque(maxlen=history_limit) # Operation log: (op, payload) entries, newest last; oldest fall off
+        self._redo = []
+        self._bulk = False
+        self._listeners = [] # Called with row-level change events (see subscribe)
+        self.version = 0 # Bumped on every change; cheap validator for cached results
+        self.lock = threading.RLock() # Held by code that shares the store across threads (api.py, the UI)
+
+    # Short-hands so the index code reads naturally
+    @property
+    def _rows(self):
+        return self._gen.rows
+
+    @property
+    def _keys(self):
+        return self._gen.keys
+
+    @property
+    def _period_totals(self):
+        return self._gen.period_totals
+
+    def new_id(self):
+        n = next(self._ids)
+        return n if self.id_prefix is None else f"{self.id_prefix}{n}"
+
+    # --- Change events ---
+    def subscribe(self, callback):
+        """Registers callback(event, *args) for every row-level change, whatever
+        caused it (user edit, undo/redo, bulk load or remote apply):
+            ("insert", expense), ("delete", expense), ("replace", old, new),
+            ("reset", store, outgoing, incoming) when the whole generation is
+            swapped (clear / undo of clear); iterate the store for the rows it
+            holds now. `outgoing` and `incoming` are the two generations'
+            stash dicts: a listener with costly derived state can park it in
+            `outgoing` (keyed by itself) and take back what it parked in
+            `incoming`, so undoing a clear doesn't rebuild it from the rows."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        self._listeners.remove(callback)
+
+    def _notify(self, event, *args):
+        self.version += 1 # Every change goes through here
+        for callback in self._listeners:
+            callback(event, *args)
+
+    # --- Mutations (recorded in the operation log) ---
+    def add(self, name, amount, category, date, expense_id=None, tags=()):
+        """Inserts an expense and returns the stored dict."""
+        if expense_id is None:
+            expense_id = self.new_id()
+        expense = {"id": expense_id, "name": name, "amount": amount, "category": category, "date": date,
+                   "tags": normalize_tags(tags)}
+        self._insert(expense)
+        self._record("add", expense)
+        self._retier()
+        return expense
+
+    def remove(self, expense_id):
+        """Removes an expense by id and returns it."""
+        expense = self._delete(expense_id)
+        self._record("remove", expense)
+        return expense
+
+    def load(self, expenses):
+        """Bulk-inserts initial data ({"name", "amount", "category", "date"[, "tags"]} dicts).
+
+        Not recorded in the undo log. Rows arriving in date order (as ledger
+        files are written) append to the date index instead of shifting it.
+        Every row is checked before anything is inserted: a bad one raises
+        KeyError/ValueError and leaves the store as it was.
+        """
+        with _gc_paused():
+            rows = []
+            for row in expenses:
+                date = row["date"]
+                if not isinstance(date, datetime) or date.tzinfo is not None:
+                    raise ValueError(f"Expense dates must be naive datetimes, got {date!r}")
+                rows.append({"id": row.get("id"), "name": row["name"], "amount": row["amount"],
+                             "category": row["category"], "date": date, "tags": normalize_tags(row.get("tags", ()))})
+        count = 0
+        self._bulk = True # Sorted indexes are appended to and sorted once at the end
+        try:
+            with _gc_paused():
+                for expense in rows:
+                    if not expense["id"]:
+                        expense["id"] = self.new_id()
+                    self._insert(expense)
+                    count += 1
+        finally:
+            self._bulk = False
+            self._keys.sort()
+            self._gen.amounts.sort()
+        if self.hot_years is not None:
+            self.auto_tier()
+        return count
+
+    def update(self, expense_id, **changes):
+        """Edits name/amount/category/date/tags of an expense in place of the old
+        record and returns the new dict. Indexes and totals are adjusted only
+        for this row."""
+        unknown = set(changes) - set(EDITABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot edit fields: {', '.join(sorted(unknown))}")
+        if "tags" in changes:
+            changes["tags"] = normalize_tags(changes["tags"])
+        self._ensure_hot(expense_id)
+        before = self._rows[expense_id]
+        after = dict(before, **changes)
+        self._replace(before, after)
+        self._record("update", (before, after))
+        self._retier()
+        return after
+
+    def clear(self):
+        """Drops every expense by switching to an empty generation."""
+        previous, self._gen = self._gen, _Generation()
+        self._record("clear", previous)
+        self._notify("reset", self, previous.stash, self._gen.stash)
+
+    # --- Unlogged mutations (remote changes; not undoable) ---
+    def put(self, expense):
+        """Inserts or replaces a complete expense dict by id without logging it."""
+        expense = dict(expense, tags=normalize_tags(expense.get("tags", ())))
+        self._ensure_hot(expense["id"])
+        current = self._rows.get(expense["id"])
+        if current is None:
+            self._insert(expense)
+        else:
+            self._replace(current, expense)
+        self._retier()
+        return expense
+
+    def discard(self, expense_id):
+        """Removes an expense if present, without logging it."""
+        self._ensure_hot(expense_id)
+        if expense_id in self._rows:
+            return self._delete(expense_id)
+        return None
+
+    def reset(self):
+        """Drops every expense without logging it."""
+        previous, self._gen = self._gen, _Generation()
+        self._notify("reset", self, previous.stash, self._gen.stash)
+
+    def clear_history(self):
+        """Forgets undo/redo state (e.g. after remote changes made it stale)."""
+        self._undo.clear()
+        self._redo.clear()
+
+    # --- Undo / Redo ---
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        """Reverts the latest operation. Returns its name, or None if there was nothing to undo."""
+        if not self._undo:
+            return None
+        op, payload = self._undo.pop()
+        self._redo.append((op, self._invert(op, payload)))
+        self._retier()
+        return op
+
+    def redo(self):
+        """Re-applies the latest undone operation. Returns its name, or None."""
+        if not self._redo:
+            return None
+        op, payload = self._redo.pop()
+        self._undo.append((op, self._invert(op, payload, forward=True)))
+        self._retier()
+        return op
+
+    def _record(self, op, payload):
+        self._undo.append((op, payload))
+        self._redo.clear()
+
+    def _invert(self, op, payload, forward=False):
+        """Applies the inverse of `op` (or `op` itself when forward) and returns
+        the payload needed to flip it back again."""
+        if op == "add":
+            if forward:
+                self._insert(payload)
+            else:
+                self._delete(payload["id"])
+            return payload
+        if op == "remove":
+            if forward:
+                self._delete(payload["id"])
+            else:
+                self._insert(payload)
+            return payload
+        if op == "update":
+            before, after = payload
+            if forward:
+                self._replace(before, after)
+            else:
+                self._replace(after, before)
+            return payload
+        if op == "clear":
+            # Swap generations: the payload is always the "other" state
+            payload, self._gen = self._gen, payload
+            self._notify("reset", self, payload.stash, self._gen.stash)
+            return payload
+        raise ValueError(f"Unknown operation: {op}")
+
+    # --- Hot / cold tiering ---
+    @property
+    def cold(self):
+        return self._gen.cold
+
+    def _hot_cutoff(self):
+        """Start of the oldest hot year; rows dated before it get sealed.
+
+        Counted back from the newest expense that isn't in the future: a
+        mistyped 2030 date must not seal the real current year."""
+        now = datetime.now()
+        _, end = self._date_bounds(None, now)
+        last = self._keys[end - 1][0] if end else None
+        if self.cold:
+            cold_last = self.cold.segments[-1].max_date
+            if cold_last <= now and (last is None or cold_last > last):
+                last = cold_last
+        if last is None:
+            return datetime.max
+        return datetime(last.year - self.hot_years + 1, 1, 1)
+
+    def auto_tier(self):
+        """Seals every year older than the `hot_years` most recent ones."""
+        if self.hot_years is None:
+            return 0
+        cutoff = self._hot_cutoff()
+        if cutoff == datetime.max:
+            return 0
+        self._sealed_before = max(self._sealed_before, cutoff)
+        return self.seal(cutoff)
+
+    def _retier(self):
+        """After a change: seals the oldest hot year once a new one has started,
+        and puts back-dated hot rows (late entries, edited or restored sealed
+        rows) straight into their year's segment."""
+        if self.hot_years is None:
+            return
+        keys = self._keys
+        if self._hot_cutoff() > self._sealed_before or (keys and keys[0][0] < self._sealed_before):
+            self.auto_tier()
+
+    def seal(self, before):
+        """Moves hot rows dated before `before` into compressed segments, one
+        per year (merged into the year's segment if it has one). They stay
+        visible everywhere; totals don't change. Returns how many rows were
+        sealed."""
+        from tiers import ColdTier
+
+        gen = self._gen
+        _, end = self._date_bounds(None, before)
+        if not end:
+            return 0
+        sealed_keys, gen.keys = gen.keys[:end], gen.keys[end:]
+        if gen.cold is None:
+            gen.cold = ColdTier()
+        # A few rows come out of the hot indexes one by one; a big seal rebuilds
+        # them instead, which is cheaper and gives the memory back
+        reindex = len(sealed_keys) * 8 > len(gen.rows)
+        with _gc_paused():
+            year_rows = []
+            for date, expense_id in sealed_keys:
+                if year_rows and year_rows[-1]["date"].year != date.year:
+                    gen.cold.seal(year_rows)
+                    year_rows = []
+                expense = gen.rows.pop(expense_id)
+                if not reindex:
+                    self._unindex_hot(expense)
+                year_rows.append(expense)
+            gen.cold.seal(year_rows)
+            if reindex:
+                self._reindex_hot()
+        return len(sealed_keys)
+
+    def _unindex_hot(self, expense):
+        """Drops a row that is leaving the hot tier from the per-row indexes
+        (not from the totals: those cover both tiers)."""
+        self._index_text(expense, add=False)
+        self._index_fields(expense, add=False)
+        self._gen.tags.remove(expense)
+        if self._gen.dedup is not None:
+            self._gen.dedup.remove(expense)
+
+    def _reindex_hot(self):
+        """Rebuilds the per-row indexes over the hot rows. Cheaper than
+        discarding sealed ids one by one, and dicts/sets never shrink on
+        removal, so this is what actually gives the memory back."""
+        gen = self._gen
+        gen.rows = dict(gen.rows)
+        gen.trigrams, gen.by_category, gen.tags, gen.dedup = {}, {}, TagBitmaps(), None
+        for expense in gen.rows.values():
+            self._index_text(expense, add=True)
+            gen.by_category.setdefault(expense["category"], set()).add(expense["id"])
+            gen.tags.add(expense)
+        gen.amounts = sorted((expense["amount"], expense["id"]) for expense in gen.rows.values())
+
+    def _ensure_hot(self, expense_id):
+        """Moves sealed row `expense_id` into the hot tier so it can be changed.
+        Segments are immutable: only that row's segment is rebuilt without it
+        (at column level), and _retier() seals the row again after the change."""
+        gen = self._gen
+        if gen.cold and expense_id not in gen.rows and expense_id in gen.cold.where:
+            expense = gen.cold.thaw(expense_id)
+            gen.rows[expense_id] = expense # Totals never left, only the per-row indexes are added
+            insort(gen.keys, (expense["date"], expense_id))
+            self._index_text(expense, add=True)
+            self._index_fields(expense, add=True)
+            gen.tags.add(expense)
+            if gen.dedup is not None:
+                gen.dedup.add(expense)
+
+    def iter_hot(self):
+        """Hot rows, newest first."""
+        rows = self._rows
+        for _, expense_id in reversed(self._keys):
+            yield rows[expense_id]
+
+    def ids(self):
+        """Every expense id, hot and cold."""
+        yield from self._rows
+        if self._gen.cold:
+            yield from self._gen.cold.ids()
+
+    def rows_between(self, low, high):
+        """Rows with low <= date < high from both tiers, oldest first."""
+        rows = [self._rows[expense_id] for expense_id in self.date_range_ids(low, high)]
+        if self._gen.cold:
+            rows = list(merge(self._gen.cold.rows_between(low, high), rows, key=lambda e: (e["date"], e["id"])))
+        return rows
+
+    def amount_extremes(self):
+        """(lowest, highest) expense by amount across both tiers, or (None, None).
+        Cold segments are only decoded if their zone map could win."""
+        amounts, rows = self._gen.amounts, self._rows
+        lowest = rows[amounts[0][1]] if amounts else None
+        highest = rows[amounts[-1][1]] if amounts else None
+        cold = self._gen.cold
+        if cold:
+            low = cold.amount_extreme(False, lowest["amount"] if lowest else None)
+            high = cold.amount_extreme(True, highest["amount"] if highest else None)
+            lowest, highest = low or lowest, high or highest
+        return lowest, highest
+
+    # --- Row + index maintenance ---
+    def _insert(self, expense):
+        self._rows[expense["id"]] = expense
+        if self._bulk:
+            self._keys.append((expense["date"], expense["id"]))
+        else:
+            insort(self._keys, (expense["date"], expense["id"]))
+        self._apply_totals(expense, expense["amount"])
+        self._index_text(expense, add=True)
+        self._index_fields(expense, add=True)
+        self._gen.tags.add(expense)
+        if self._gen.dedup is not None:
+            self._gen.dedup.add(expense)
+        self._notify("insert", expense)
+
+    def _delete(self, expense_id):
+        self._ensure_hot(expense_id)
+        expense = self._rows.pop(expense_id)
+        key = (expense["date"], expense_id)
+        del self._keys[bisect_left(self._keys, key)]
+        self._apply_totals(expense, -expense["amount"])
+        self._index_text(expense, add=False)
+        self._index_fields(expense, add=False)
+        self._gen.tags.remove(expense)
+        if self._gen.dedup is not None:
+            self._gen.dedup.remove(expense)
+        self._notify("delete", expense)
+        return expense
+
+    def _replace(self, old, new):
+        """Swaps `old` for `new` (same id), touching only what changed."""
+        expense_id = old["id"]
+        self._ensure_hot(expense_id)
+        self._rows[expense_id] = new
+        if old["date"] != new["date"]:
+            del self._keys[bisect_left(self._keys, (old["date"], expense_id))]
+            insort(self._keys, (new["date"], expense_id))
+        self._apply_totals(old, -old["amount"])
+        self._apply_totals(new, new["amount"])
+        if search_fields(old) != search_fields(new):
+            self._index_text(old, add=False)
+            self._index_text(new, add=True)
+        if old["category"] != new["category"] or old["amount"] != new["amount"]:
+            self._index_fields(old, add=False)
+            self._index_fields(new, add=True)
+        if old.get("tags", ()) != new.get("tags", ()) or old["amount"] != new["amount"]:
+            self._gen.tags.replace(old, new)
+        if self._gen.dedup is not None:
+            self._gen.dedup.remove(old)
+            self._gen.dedup.add(new)
+        self._notify("replace", old, new)
+
+    def _index_fields(self, expense, add):
+        gen = self._gen
+        expense_id = expense["id"]
+        if add:
+            gen.by_category.setdefault(expense["category"], set()).add(expense_id)
+            if self._bulk:
+                gen.amounts.append((expense["amount"], expense_id))
+            else:
+                insort(gen.amounts, (expense["amount"], expense_id))
+        else:
+            ids = gen.by_category.get(expense["category"])
+            if ids is not None:
+                ids.discard(expense_id)
+                if not ids:
+                    del gen.by_category[expense["category"]]
+            del gen.amounts[bisect_left(gen.amounts, (expense["amount"], expense_id))]
+
+    def _apply_daily(self, expense, delta):
+        day = expense["date"].date()
+        daily = self._gen.daily
+        categories = daily.get(day)
+        if categories is None:
+            categories = daily[day] = {}
+            insort(self._gen.days, day)
+        value = categories.get(expense["category"], 0) + delta
+        if abs(value) < 1e-9:
+            categories.pop(expense["category"], None)
+            if not categories:
+                del daily[day]
+                del self._gen.days[bisect_left(self._gen.days, day)]
+        else:
+            categories[expense["category"]] = value
+
+    def _index_text(self, expense, add):
+        index = self._gen.trigrams
+        expense_id = expense["id"]
+        name, category, date = search_fields(expense)
+        grams = trigrams(name) | trigrams(category) | trigrams(date)
+        if add:
+            for gram in grams:
+                index.setdefault(gram, set()).add(expense_id)
+        else:
+            for gram in grams:
+                ids = index.get(gram)
+                if ids is not None:
+                    ids.discard(expense_id)
+                    if not ids:
+                        del index[gram]
+
+    def _apply_totals(self, expense, delta):
+        self._apply_daily(expense, delta)
+        totals = self._period_totals
+        for period in PERIODS:
+            key = period_key(period, expense["date"])
+            for category in (expense["category"], None):
+                bucket = (period, category, key)
+                value = totals.get(bucket, 0) + delta
+                if abs(value) < 1e-9:
+                    totals.pop(bucket, None) # Keep empty buckets from piling up
+                else:
+                    totals[bucket] = value
+
+    # --- Aggregates (all O(1)) ---
+    def period_total(self, period, category=None, date=None):
+        """Total spent in the period containing `date` (category=None means all)."""
+        key = period_key(period, date) if date is not None else ()
+        return self._period_totals.get((period, category, key), 0)
+
+    @property
+    def total(self):
+        return self._period_totals.get(("all", None, ()), 0)
+
+    def category_totals(self):
+        """Returns {category: total} over the whole history."""
+        return {
+            category: value for (period, category, _), value in self._period_totals.items()
+            if period == "all" and category is not None
+        }
+
+    def period_series(self, period, category=None):
+        """Returns {period key: total} for every bucket of `period` with spending."""
+        return {
+            key: value for (p, c, key), value in self._period_totals.items()
+            if p == period and c == category
+        }
+
+    # --- Rollups ---
+    @property
+    def first_day(self):
+        return self._gen.days[0] if self._gen.days else None
+
+    @property
+    def last_day(self):
+        return self._gen.days[-1] if self._gen.days else None
+
+    def daily_totals(self, start, end):
+        """Yields (date, {category: total}) for days with spending in [start, end]."""
+        days, daily = self._gen.days, self._gen.daily
+        for i in range(bisect_left(days, start), len(days)):
+            day = days[i]
+            if day > end:
+                break
+            yield day, daily[day]
+
+    # --- Lookup ---
+    def get(self, expense_id):
+        expense = self._rows.get(expense_id)
+        if expense is None and self._gen.cold:
+            expense = self._gen.cold.get(expense_id)
+        return expense
+
+    def sort_key(self, expense_id):
+        expense = self.get(expense_id)
+        return (expense["date"], expense_id)
+
+    def categories(self):
+        if self._gen.cold:
+            return sorted(set(self._gen.by_category) | self._gen.cold.categories())
+        return list(self._gen.by_category)
+
+    # --- Index access (used by query plans; hot tier only) ---
+
+    def category_ids(self, category):
+        return self._gen.by_category.get(category, set())
+
+    def dedup_index(self):
+        """The duplicate index for this store, built from all hot rows on first call."""
+        if self._gen.dedup is None:
+            from dedup import DedupIndex
+            index = DedupIndex()
+            with _gc_paused():
+                for expense in self._rows.values():
+                    index.add(expense)
+            self._gen.dedup = index
+        return self._gen.dedup
+
+    def check_duplicates(self, rows):
+        """dedup_index().check_batch(rows), plus the cold tier: that index only
+        covers hot rows, so rows dated in sealed years are also checked
+        against the sealed rows within the dedup window of their day (only
+        those days are decoded). A cold match wins when it's a stronger kind."""
+        index = self.dedup_index()
+        results = index.check_batch(rows)
+        cold = self._gen.cold
+        if not cold:
+            return results
+        from dedup import DedupIndex
+
+        first, last = cold.segments[0].min_date.toordinal(), max(s.max_date for s in cold.segments).toordinal()
+        window = index.window_days
+        pending = [i for i, result in enumerate(results) if result is None or result[0] not in ("identical", "exact")]
+        days = sorted({rows[i]["date"].toordinal() for i in pending
+                       if first - window <= rows[i]["date"].toordinal() <= last + window})
+        if not days:
+            return results
+        nearby = DedupIndex(window, index.threshold)
+        low = high = None
+        for day in days + [None]: # Merge overlapping windows so each sealed row is decoded once
+            if day is not None and high is not None and day - window <= high:
+                high = day + window + 1
+                continue
+            if low is not None:
+                for expense in cold.rows_between(datetime.fromordinal(low), datetime.fromordinal(high)):
+                    nearby.add(expense)
+            if day is not None:
+                low, high = day - window, day + window + 1
+        rank = ("identical", "exact", "near", "batch")
+        for i in pending:
+            match = nearby.check(rows[i])
+            result = results[i]
+            if match is not None and (result is None or rank.index(match[0]) < rank.index(result[0])
+                                      or (match[0] == result[0] and match[2] > result[2])):
+                results[i] = match
+        return results
+
+    @property
+    def tag_index(self):
+        return self._gen.tags
+
+    def tag_totals(self):
+        """Returns {tag: (total, count)}, maintained on every change."""
+        index = self._gen.tags
+        totals = {tag: (index.totals[tag], index.counts[tag]) for tag in index.bits}
+        if self._gen.cold:
+            for tag, (total, count) in self._gen.cold.tag_totals().items():
+                hot_total, hot_count = totals.get(tag, (0, 0))
+                totals[tag] = (hot_total + total, hot_count + count)
+        return totals
+
+    def trigram_ids(self, gram):
+        return self._gen.trigrams.get(gram, set())
+
+    def _date_bounds(self, low, high):
+        """Slice bounds in the date index for low <= date < high (None = open)."""
+        keys = self._keys
+        lo = bisect_left(keys, (low,)) if low is not None else 0
+        hi = bisect_left(keys, (high,)) if high is not None else len(keys)
+        return lo, max(lo, hi)
+
+    def date_range_count(self, low, high):
+        lo, hi = self._date_bounds(low, high)
+        return hi - lo
+
+    def date_range_ids(self, low, high):
+        lo, hi = self._date_bounds(low, high)
+        return [expense_id for _, expense_id in self._keys[lo:hi]]
+
+    def _amount_bounds(self, low, high, low_inclusive=True, high_inclusive=True):
+        amounts = self._gen.amounts
+        n = len(amounts)
+        if low is None:
+            lo = 0
+        else:
+            lo = bisect_left(amounts, (low,))
+            if not low_inclusive:
+                while lo < n and amounts[lo][0] == low:
+                    lo += 1
+        if high is None:
+            hi = n
+        else:
+            hi = bisect_left(amounts, (high,))
+            if high_inclusive:
+                while hi < n and amounts[hi][0] == high:
+                    hi += 1
+        return lo, max(lo, hi)
+
+    def amount_range_count(self, low, high, low_inclusive=True, high_inclusive=True):
+        lo, hi = self._amount_bounds(low, high, low_inclusive, high_inclusive)
+        return hi - lo
+
+    def amount_range_ids(self, low, high, low_inclusive=True, high_inclusive=True):
+        lo, hi = self._amount_bounds(low, high, low_inclusive, high_inclusive)
+        return [expense_id for _, expense_id in self._gen.amounts[lo:hi]]
+
+    def __contains__(self, expense_id):
+        return expense_id in self._rows or bool(self._gen.cold and expense_id in self._gen.cold.where)
+
+    # --- Sequence protocol (newest first) ---
+    def __len__(self):
+        return len(self._keys) + (len(self._gen.cold) if self._gen.cold else 0)
+
+    def __bool__(self):
+        return bool(self._keys) or bool(self._gen.cold)
+
+    def __iter__(self):
+        cold = self._gen.cold
+        if not cold:
+            yield from self.iter_hot()
+            return
+        # Merge hot rows with the segments, opening a segment only once the
+        # merge reaches its newest row
+        pending = sorted(cold.segments, key=lambda segment: segment.max_key)
+        heap = []
+        streams = []
+
+        def push(index):
+            for expense in streams[index]: # Next row of that stream, if any
+                heappush(heap, _Newest((expense["date"], expense["id"]), index, expense))
+                return
+
+        def open_stream(stream):
+            streams.append(stream)
+            push(len(streams) - 1)
+
+        open_stream(self.iter_hot())
+        while heap or pending:
+            while pending and (not heap or pending[-1].max_key > heap[0].key):
+                open_stream(cold.iter_newest_first(pending.pop()))
+            item = heappop(heap)
+            yield item.expense
+            push(item.stream)
+
+    def __getitem__(self, index):
+        n = len(self._keys)
+        if not self._gen.cold: # Straight off the date index
+            if isinstance(index, slice):
+                return [self._rows[self._keys[n - 1 - i][1]] for i in range(*index.indices(n))]
+            if index < 0:
+                index += n
+            if not 0 <= index < n:
+                raise IndexError("expense index out of range")
+            return self._rows[self._keys[n - 1 - index][1]]
+        n = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(n)
+            if step < 0:
+                return list(self)[index]
+            return list(itertools.islice(self, start, stop, step))
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("expense index out of range")
+        return next(itertools.islice(self, index, None))
+
+
+class Budget:
+    """A spending limit for one category (or all, when category is None) per period."""
+
+    def __init__(self, limit, category=None, period="month", thresholds=(0.8, 1.0)):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown budget period: {period}")
+        if limit <= 0:
+            raise ValueError("Budget limit must be positive")
+        self.limit = limit
+        self.category = category
+        self.period = period
+        self.thresholds = tuple(sorted(thresholds))
+
+    @property
+    def label(self):
+        return f"{PERIOD_LABELS[self.period]} {self.category or 'All categories'}"
+
+    def crossed(self, before, after):
+        """Returns the highest threshold passed when spending moves from before to after."""
+        hit = None
+        for threshold in self.thresholds:
+            mark = threshold * self.limit
+            if before < mark <= after:
+                hit = threshold
+        return hit
+
+
+class BudgetBook:
+    """Budgets indexed by (period, category) so an insert only looks at the
+    handful of scopes it can affect, no matter how many budgets exist."""
+
+    def __init__(self):
+        self._by_scope = {} # (period, category) -> Budget; one budget per scope
+
+    def __iter__(self):
+        return iter(list(self._by_scope.values()))
+
+    def __len__(self):
+        return len(self._by_scope)
+
+    def set(self, budget):
+        """Adds a budget, replacing any existing one for the same scope."""
+        self._by_scope[(budget.period, budget.category)] = budget
+
+    def remove(self, budget):
+        scope = (budget.period, budget.category)
+        if self._by_scope.get(scope) is budget:
+            del self._by_scope[scope]
+
+    def spent(self, store, budget, date):
+        return store.period_total(budget.period, budget.category, date)
+
+    def check(self, store, expense):
+        """Returns alert messages for budgets crossed by `expense`.
+
+        Must be called right after the expense was added to `store`; reads the
+        maintained period totals instead of recomputing anything.
+        """
+        alerts = []
+        amount = expense["amount"]
+        for period in PERIODS:
+            for category in (expense["category"], None):
+                budget = self._by_scope.get((period, category))
+                if budget is None:
+                    continue
+                after = store.period_total(period, category, expense["date"])
+                threshold = budget.crossed(after - amount, after)
+                if threshold is None:
+                    continue
+                if threshold >= 1:
+                    alerts.append(f"{budget.label} budget exceeded: ₹{after:.2f} of ₹{budget.limit:.2f}")
+                else:
+                    alerts.append(f"{budget.label} budget at {threshold:.0%}: ₹{after:.2f} of ₹{budget.limit:.2f}")
+        return alerts
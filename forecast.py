@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Monthly spend forecasts from the store's month rollups.
+
+Forecasts never touch raw rows: the input is store.period_series("month",
+category), one total per month. With two years or more of complete months
+the series is fitted with additive Holt-Winters (12-month season), else
+with Holt's linear trend, picking smoothing parameters from a small grid
+by one-step-ahead error. The month in progress is not fitted (its total
+is still growing); it is the first forecast month instead.
+
+Forecaster listens to the store's change events and only refits the
+categories (and the overall series) that something changed in a fitted
+month; everything else comes from its cache.
+"""
+from itertools import product
+
+SEASON = 12
+_GRID = {
+    "alpha": (0.1, 0.3, 0.5),
+    "beta": (0.0, 0.05, 0.15),
+    "gamma": (0.05, 0.2, 0.4),
+}
+
+
+def month_add(month, n):
+    index = month[0] * 12 + month[1] - 1 + n
+    return (index // 12, index % 12 + 1)
+
+
+def month_series(totals, end):
+    """Dense list of monthly totals from the first month in `totals` up to
+    (excluding) `end`, with 0 for months without spending. Returns (start, values)."""
+    months = [month for month in totals if month < end]
+    if not months:
+        return None, []
+    start = min(months)
+    values = []
+    month = start
+    while month < end:
+        values.append(totals.get(month, 0.0))
+        month = month_add(month, 1)
+    return start, values
+
+
+def _holt_winters(values, alpha, beta, gamma, horizon):
+    season = SEASON
+    level = sum(values[:season]) / season
+    trend = (sum(values[season:2 * season]) - sum(values[:season])) / season ** 2
+    seasonals = [x - level for x in values[:season]]
+    sse = 0.0
+    for t, x in enumerate(values):
+        s = seasonals[t % season]
+        if t >= season:
+            error = x - (level + trend + s)
+            sse += error * error
+        new_level = alpha * (x - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonals[t % season] = gamma * (x - new_level) + (1 - gamma) * s
+        level = new_level
+    n = len(values)
+    return sse, [level + h * trend + seasonals[(n + h - 1) % season] for h in range(1, horizon + 1)]
+
+
+def _holt(values, alpha, beta, horizon):
+    level, trend = values[0], (values[1] - values[0] if len(values) > 1 else 0.0)
+    sse = 0.0
+    for x in values[1:]:
+        error = x - (level + trend)
+        sse += error * error
+        new_level = alpha * x + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+    return sse, [level + h * trend for h in range(1, horizon + 1)]
+
+
+def fit_forecast(values, horizon=3):
+    """Returns (method, params, forecast) for a dense monthly series."""
+    if not values:
+        return "none", {}, []
+    if len(values) < 3:
+        mean = sum(values) / len(values)
+        return "mean", {}, [mean] * horizon
+    best = None
+    if len(values) >= 2 * SEASON:
+        for alpha, beta, gamma in product(_GRID["alpha"], _GRID["beta"], _GRID["gamma"]):
+            sse, forecast = _holt_winters(values, alpha, beta, gamma, horizon)
+            if best is None or sse < best[0]:
+                best = (sse, "holt-winters", {"alpha": alpha, "beta": beta, "gamma": gamma}, forecast)
+    else:
+        for alpha, beta in product(_GRID["alpha"], _GRID["beta"]):
+            sse, forecast = _holt(values, alpha, beta, horizon)
+            if best is None or sse < best[0]:
+                best = (sse, "holt", {"alpha": alpha, "beta": beta}, forecast)
+    _, method, params, forecast = best
+    return method, params, [max(0.0, value) for value in forecast] # Spending can't go negative
+
+
+class Forecast:
+    __slots__ = ("category", "method", "params", "last_month", "last_value", "months", "values")
+
+    def __init__(self, category, method, params, last_month, last_value, months, values):
+        self.category = category # None for all categories together
+        self.method = method
+        self.params = params
+        self.last_month = last_month # Last complete month the fit saw
+        self.last_value = last_value
+        self.months = months # Forecast months, (year, month), starting with the month in progress
+        self.values = values
+
+
+class Forecaster:
+    def __init__(self, store, horizon=3):
+        self.store = store
+        self.horizon = horizon
+        self._cache = {} # category (None = overall) -> Forecast
+        self._cache_end = None # First month excluded from the fits the cache holds
+        self.refits = 0 # How many series were fitted (not served from the cache)
+        store.subscribe(self._on_change)
+
+    def _on_change(self, event, *args):
+        if event == "reset":
+            self._cache.clear()
+            return
+        end = self._cache_end
+        touched = False
+        for expense in args:
+            date = expense["date"]
+            if end is not None and (date.year, date.month) >= end:
+                continue # Not in any cached fit (a later month moves `end` and clears the cache anyway)
+            self._cache.pop(expense["category"], None)
+            touched = True
+        if touched:
+            self._cache.pop(None, None)
+
+    def forecast(self, category=None, end=None):
+        """Forecast for `category` (None = everything) fitted on the complete
+        months before `end` ((year, month), default the month of the latest
+        expense). The forecast months start at `end` itself."""
+        store = self.store
+        if end is None:
+            last_day = store.last_day
+            if last_day is None:
+                return None
+            end = (last_day.year, last_day.month)
+        if end != self._cache_end:
+            self._cache.clear() # A new month is complete: every fit moves on
+            self._cache_end = end
+        cached = self._cache.get(category)
+        if cached is not None:
+            return cached
+        with store.lock:
+            totals = store.period_series("month", category)
+        _, values = month_series(totals, end)
+        if not values:
+            return None
+        method, params, predicted = fit_forecast(values, self.horizon)
+        self.refits += 1
+        result = self._cache[category] = Forecast(
+            category, method, params, month_add(end, -1), values[-1],
+            [month_add(end, h) for h in range(self.horizon)], predicted,
+        )
+        return result
+
+    def forecast_all(self, end=None):
+        """{category: Forecast} for every category, plus None for the total."""
+        result = {}
+        for category in [None] + sorted(self.store.categories()):
+            forecast = self.forecast(category, end)
+            if forecast is not None:
+                result[category] = forecast
+        return result
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic expense ledgers for reproducing performance issues.
+
+The same seed and size always produce the same rows. Rows come out in date
+order and are generated lazily, so 10M-row ledgers stream without holding
+everything in memory.
+
+Usage:
+    python ledger_gen.py --rows 1000000 --seed 7 --out ledger.csv
+"""
+import argparse
+import csv
+import itertools
+import math
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Category -> (share of rows, median amount, spread of log-normal amounts)
+CATEGORY_MIX = {
+    "Food": (0.42, 250.0, 0.8),
+    "Transportation": (0.22, 180.0, 0.7),
+    "Entertainment": (0.12, 600.0, 0.9),
+    "Utilities": (0.09, 1500.0, 0.5),
+    "Others": (0.15, 400.0, 1.1),
+}
+
+# Month (1-12) -> multiplier on how much of a category is bought that month
+SEASONALITY = {
+    "Food": [1.0, 0.95, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.1, 1.15, 1.3],
+    "Transportation": [0.9, 0.9, 1.0, 1.1, 1.2, 1.2, 1.1, 1.0, 1.0, 1.0, 0.9, 1.1],
+    "Entertainment": [0.8, 0.9, 0.9, 1.0, 1.1, 1.0, 1.0, 1.0, 1.0, 1.2, 1.3, 1.6],
+    "Utilities": [1.3, 1.2, 1.0, 1.1, 1.4, 1.5, 1.3, 1.1, 0.9, 0.8, 0.9, 1.2],
+    "Others": [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.1, 1.2, 1.3, 1.4],
+}
+
+# Weekends see more spending overall
+WEEKDAY_WEIGHT = [0.9, 0.9, 0.95, 1.0, 1.15, 1.35, 1.25]
+
+VOCABULARY = {
+    "Food": (["Swiggy", "Zomato", "Cafe", "Bakery", "Supermarket", "Dhaba", "Canteen", "Restaurant"],
+             ["lunch", "dinner", "breakfast", "coffee", "groceries", "snacks", "biryani", "pizza", "tea"]),
+    "Transportation": (["Uber", "Ola", "Metro", "Rapido", "Petrol Pump", "Railways", "Bus"],
+                       ["ride", "fuel", "ticket", "pass", "parking", "toll"]),
+    "Entertainment": (["PVR", "Netflix", "Spotify", "BookMyShow", "Steam", "Concert Hall"],
+                      ["movie", "subscription", "game", "show", "tickets", "event"]),
+    "Utilities": (["Electricity Board", "Water Board", "Airtel", "Jio", "Gas Agency", "Broadband"],
+                  ["bill", "recharge", "refill", "connection", "dues"]),
+    "Others": (["Amazon", "Flipkart", "Pharmacy", "Salon", "Stationery", "Hardware Store", "Tailor"],
+               ["order", "medicine", "haircut", "supplies", "repair", "gift", "clothes"]),
+}
+
+
+def _day_weights(start, days):
+    """Relative number of expenses on each day (weekday pattern x overall seasonality)."""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        season = sum(share * SEASONALITY[category][day.month - 1] for category, (share, _, _) in CATEGORY_MIX.items())
+        weights.append(WEEKDAY_WEIGHT[day.weekday()] * season)
+    return weights
+
+
+def generate_expenses(rows, seed=0, start=datetime(2020, 1, 1), years=5):
+    """Yields `rows` expense dicts ({"name", "amount", "category", "date"}) in date order."""
+    rng = random.Random(seed)
+    days = max(1, int(round(365.25 * years)))
+    weights = _day_weights(start, days)
+    total_weight = sum(weights)
+    categories = list(CATEGORY_MIX)
+
+    produced = 0
+    expected = 0.0
+    for offset, weight in enumerate(weights):
+        # Cumulative rounding gives exactly `rows` rows in total
+        expected += rows * weight / total_weight
+        count = int(round(expected)) - produced if offset < days - 1 else rows - produced
+        if count <= 0:
+            continue
+        day = start + timedelta(days=offset)
+        month = day.month - 1
+        mix = list(itertools.accumulate(CATEGORY_MIX[c][0] * SEASONALITY[c][month] for c in categories))
+        times = sorted(rng.randrange(7 * 3600, 23 * 3600) for _ in range(count))
+        for seconds in times:
+            category = rng.choices(categories, cum_weights=mix)[0]
+            _, median, sigma = CATEGORY_MIX[category]
+            merchants, items = VOCABULARY[category]
+            amount = round(max(1.0, rng.lognormvariate(math.log(median), sigma)), 2)
+            yield {
+                "name": f"{rng.choice(merchants)} {rng.choice(items)}",
+                "amount": amount,
+                "category": category,
+                "date": day + timedelta(seconds=seconds),
+            }
+        produced += count
+
+
+def write_csv(expenses, out):
+    writer = csv.writer(out)
+    writer.writerow(["name", "amount", "category", "date"])
+    for expense in expenses:
+        writer.writerow([expense["name"], f"{expense['amount']:.2f}", expense["category"],
+                         expense["date"].strftime('%Y-%m-%d %H:%M:%S')])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic expense ledger (CSV).")
+    parser.add_argument("--rows", type=int, default=100000, help="number of expenses (up to 10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2020-01-01", help="first date, YYYY-MM-DD")
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--out", default="-", help="output file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    expenses = generate_expenses(args.rows, seed=args.seed,
+                                 start=datetime.strptime(args.start, '%Y-%m-%d'), years=args.years)
+    if args.out == "-":
+        write_csv(expenses, sys.stdout)
+    else:
+        with open(args.out, "w", newline="", encoding="utf-8") as out:
+            write_csv(expenses, out)
+
+
+if __name__ == "__main__":
+    main()
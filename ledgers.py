@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""Several named ledgers (personal, business, household...), each its own
+ExpenseStore with its own indexes, cold tier, undo history and lock.
+
+Cross-ledger reads fan out and merge the partial results: totals are added
+up, search results are k-way merged newest first. With `workers` > 0 the
+fan-out runs on a pool of shard processes, so the per-ledger searches run
+in parallel instead of taking turns under the GIL:
+
+- Each ledger is owned by one shard (least loaded first). The shard keeps
+  its own copy of the ledger's store, built once from the rows when the
+  pool starts (on the first cross-ledger read) or when the ledger is added.
+- The UI process keeps the stores it edits. A listener on each store queues
+  its row changes for the ledger's shard; they go over with the next read,
+  as one batch, ahead of the read itself, so every read sees every change
+  made before it. Clear / undo of clear send no rows: the shard parks the
+  old copy under a token kept in the store's generation stash (see
+  ExpenseStore.subscribe) and swaps it back.
+- A read sends each shard one small command (which reads, which ledgers)
+  all at once, then collects the replies. Only the results are pickled.
+
+The price is memory: every ledger is held twice, once here and once in its
+shard. With `workers` = 0 (the default) reads ask every ledger in turn in
+this process, under its own lock, and nothing is started.
+
+Standalone:
+    python ledgers.py --ledgers 24 --rows 50000 --workers 4
+"""
+import argparse
+from collections import deque
+from heapq import merge
+from itertools import count, islice, repeat
+import multiprocessing
+import threading
+import weakref
+
+from expense_store import ExpenseStore
+
+
+# --- Reads, run wherever the store lives (this process or its shard) ---
+def _summary(store):
+    return len(store), store.total
+
+
+def _category_totals(store):
+    return store.category_totals()
+
+
+def _tag_totals(store):
+    return store.tag_totals()
+
+
+def _period_series(store, period, category):
+    return store.period_series(period, category)
+
+
+def _search(store, text, limit):
+    from query import run_query # Not needed for the app's first frame
+    if text:
+        rows = run_query(store, text)
+        return rows[:limit] if limit is not None else rows
+    return store[:limit] if limit is not None else list(store)
+
+
+READS = {"summary": _summary, "category_totals": _category_totals, "tag_totals": _tag_totals,
+         "period_series": _period_series, "search": _search}
+
+
+# --- Shard processes ---
+def _apply_changes(stores, parked, options, changes):
+    """Replays queued changes (see _Mirror) on a shard's stores."""
+    inserts, target = [], None
+    for change in changes:
+        kind, name = change[0], change[1]
+        if inserts and (kind != "insert" or name != target): # A run of inserts is one bulk load
+            stores[target].load(inserts)
+            inserts = []
+        if kind == "insert":
+            inserts.append(change[2])
+            target = name
+        elif kind == "delete":
+            stores[name].discard(change[2])
+        elif kind == "replace":
+            stores[name].put(change[2])
+        elif kind == "add":
+            stores[name] = ExpenseStore(**options)
+            stores[name].load(change[2])
+        elif kind == "remove":
+            del stores[name]
+        elif kind == "reset":
+            out_token, in_token, rows = change[2:]
+            parked[out_token] = stores[name]
+            store = parked.pop(in_token, None)
+            if store is None:
+                store = ExpenseStore(**options)
+                store.load(rows)
+            stores[name] = store
+        elif kind == "drop": # ("drop", token): its generation is gone (undo history moved on)
+            parked.pop(change[1], None)
+    if inserts:
+        stores[target].load(inserts)
+
+
+def _shard_main(conn, store_options):
+    """Body of a shard process: applies change batches and answers reads on
+    the ledgers it owns until it gets None."""
+    options = dict(store_options, history_limit=0) # Edits are undone in the UI process, not here
+    stores, parked = {}, {} # name -> ExpenseStore; token -> swapped-out store
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        changes, names, reads = message
+        try:
+            _apply_changes(stores, parked, options, changes)
+            reply = ("ok", [{name: READS[read](stores[name], *args) for name in names} for read, args in reads])
+        except Exception as err:
+            reply = ("error", err)
+        conn.send(reply)
+    conn.close()
+
+
+class _Shard:
+    """This process's end of one shard process."""
+
+    def __init__(self, context, store_options):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_shard_main, args=(child, store_options), daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock() # One request/reply on the pipe at a time
+        self.pending = deque() # Queued changes; appended to by store listeners, so no lock
+        self.ledgers = 0
+
+    def send(self, names, reads):
+        changes = [self.pending.popleft() for _ in range(len(self.pending))]
+        self.conn.send((changes, names, reads))
+
+    def close(self):
+        with self.lock:
+            self.conn.send(None)
+            self.conn.close()
+        self.process.join(timeout=5)
+
+
+class _Token:
+    """Names a shard's parked copy of a swapped-out generation; when the
+    generation (and so its stash) is dropped, the shard is told to drop it too."""
+    __slots__ = ("id", "__weakref__")
+    _ids = count(1)
+
+    def __init__(self, shard):
+        self.id = next(self._ids)
+        weakref.finalize(self, shard.pending.append, ("drop", self.id))
+
+
+class _Mirror:
+    """Store listener queueing one ledger's row changes for its shard."""
+
+    def __init__(self, name, shard):
+        self.name = name
+        self.shard = shard
+
+    def __call__(self, event, *args):
+        pending = self.shard.pending
+        if event == "insert":
+            pending.append(("insert", self.name, args[0]))
+        elif event == "delete":
+            pending.append(("delete", self.name, args[0]["id"]))
+        elif event == "replace":
+            pending.append(("replace", self.name, args[1]))
+        elif event == "reset":
+            store, outgoing, incoming = args
+            token = outgoing[self] = _Token(self.shard)
+            back = incoming.pop(self, None) # Set if the shard parked this generation before
+            rows = None if back is not None else list(store)
+            pending.append(("reset", self.name, token.id, back.id if back is not None else None, rows))
+
+
+class Ledgers:
+    def __init__(self, names=("Personal",), workers=0, **store_options):
+        """`workers` shard processes answer cross-ledger reads (0: this process
+        does, one ledger after the other). `store_options` are passed to every
+        ExpenseStore (id_prefix, hot_years...)."""
+        self.store_options = store_options
+        self.workers = workers
+        self.stores = {} # name -> ExpenseStore, in creation order
+        self.lock = threading.Lock() # Guards `stores` and the shard maps; each store has its own lock for its rows
+        self.shards = [] # Started on the first cross-ledger read
+        self.mirrors = {} # name -> _Mirror, once its shard has a copy
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.stores)
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __contains__(self, name):
+        return name in self.stores
+
+    def __getitem__(self, name):
+        return self.stores[name]
+
+    def names(self):
+        with self.lock:
+            return list(self.stores)
+
+    def add(self, name):
+        """Creates an empty ledger. Returns its store."""
+        name = name.strip()
+        if not name:
+            raise ValueError("Ledger name can't be empty")
+        with self.lock:
+            if name in self.stores:
+                raise ValueError(f"Ledger '{name}' already exists")
+            store = self.stores[name] = ExpenseStore(**self.store_options)
+            if self.shards:
+                self._attach(name, store)
+        return store
+
+    def remove(self, name):
+        with self.lock:
+            if len(self.stores) == 1:
+                raise ValueError("Can't remove the last ledger")
+            store = self.stores.pop(name)
+            mirror = self.mirrors.pop(name, None)
+            if mirror is not None:
+                with store.lock:
+                    store.unsubscribe(mirror)
+                mirror.shard.ledgers -= 1
+                mirror.shard.pending.append(("remove", name))
+
+    # --- Shards ---
+    def _attach(self, name, store):
+        """Hands ledger `name` to the least loaded shard. Caller holds self.lock."""
+        shard = min(self.shards, key=lambda shard: shard.ledgers)
+        shard.ledgers += 1
+        mirror = self.mirrors[name] = _Mirror(name, shard)
+        with store.lock: # Nothing slips in between the copy and the listener
+            shard.pending.append(("add", name, list(store)))
+            store.subscribe(mirror)
+
+    def start(self):
+        """Starts the shard processes and has them build their copies of the
+        ledgers (that's a full load of every ledger, so the app calls this in
+        the background). Otherwise the first cross-ledger read does it; a
+        no-op without workers or once started."""
+        with self.lock:
+            if self.shards or not self.workers:
+                return
+            # Spawned, not forked: the app has other threads (API, sync) running
+            context = multiprocessing.get_context("spawn")
+            self.shards = [_Shard(context, self.store_options) for _ in range(min(self.workers, len(self.stores)))]
+            for name, store in self.stores.items():
+                self._attach(name, store)
+        self.gather([]) # Ships the copies; no reads
+
+    def close(self):
+        """Stops the shard processes; later reads run in this process."""
+        with self.lock:
+            shards, self.shards, self.workers = self.shards, [], 0
+            for name, mirror in self.mirrors.items():
+                store = self.stores[name]
+                with store.lock:
+                    store.unsubscribe(mirror)
+            self.mirrors = {}
+        for shard in shards:
+            shard.close()
+
+    # --- Fan-out ---
+    def gather(self, reads, names=None):
+        """Runs every (read, args) of `reads` (see READS) on the given ledgers
+        (default: all) and returns one {name: result} dict per read. On the
+        shards, each gets one request with all its ledgers, sent to all of
+        them before any reply is read."""
+        self.start()
+        with self.lock:
+            selected = list(names or self.stores)
+            owners = {name: self.mirrors[name].shard for name in selected} if self.shards else None
+            shards = list(self.shards)
+        if owners is None: # No workers: one ledger after the other, each under its lock
+            results = [{} for _ in reads]
+            for name in selected:
+                store = self.stores[name]
+                with store.lock:
+                    for result, (read, args) in zip(results, reads):
+                        result[name] = READS[read](store, *args)
+            return results
+
+        asked = [shard for shard in shards if shard in owners.values()] # Fixed order, so locks can't deadlock
+        for shard in asked:
+            shard.lock.acquire()
+        try:
+            for shard in asked:
+                shard.send([name for name in selected if owners[name] is shard], reads)
+            replies = [shard.conn.recv() for shard in asked] # Every reply, so no pipe is left out of step
+        finally:
+            for shard in asked:
+                shard.lock.release()
+        results = [{} for _ in reads]
+        for status, parts in replies:
+            if status == "error":
+                raise parts
+            for result, part in zip(results, parts):
+                result.update(part)
+        return [{name: result[name] for name in selected} for result in results]
+
+    def map(self, read, *args, names=None):
+        """{name: result} of one read (see READS) on the given ledgers."""
+        return self.gather([(read, args)], names)[0]
+
+    # --- Merged reads ---
+    def summary(self, names=None):
+        """{name: (expense count, total)}."""
+        return self.map("summary", names=names)
+
+    def total(self, names=None):
+        return sum(total for _, total in self.summary(names).values())
+
+    def category_totals(self, names=None):
+        result = {}
+        for totals in self.map("category_totals", names=names).values():
+            for category, total in totals.items():
+                result[category] = result.get(category, 0) + total
+        return result
+
+    def tag_totals(self, names=None):
+        result = {}
+        for totals in self.map("tag_totals", names=names).values():
+            for tag, (total, count) in totals.items():
+                old_total, old_count = result.get(tag, (0, 0))
+                result[tag] = (old_total + total, old_count + count)
+        return result
+
+    def period_series(self, period, category=None, names=None):
+        result = {}
+        for series in self.map("period_series", period, category, names=names).values():
+            for key, total in series.items():
+                result[key] = result.get(key, 0) + total
+        return result
+
+    def search(self, text, names=None, limit=None):
+        """(ledger name, expense) pairs matching the query `text` (everything
+        when empty), newest first. Raises QueryError before any ledger is searched."""
+        from query import parse_query # Not needed for the app's first frame
+        if text:
+            parse_query(text) # Bad queries fail here, not in every ledger
+        parts = self.map("search", text, limit, names=names)
+        # Each ledger's rows are already newest first: a k-way merge, no re-sort
+        merged = merge(*(zip(repeat(name), rows) for name, rows in parts.items()),
+                       key=lambda item: item[1]["date"], reverse=True)
+        return list(islice(merged, limit)) if limit is not None else list(merged)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time cross-ledger totals and searches on synthetic ledgers.")
+    parser.add_argument("--ledgers", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=50000, help="Expenses in the largest ledger (ledger_gen)")
+    parser.add_argument("--workers", type=int, default=4, help="Shard processes (0: search in this process)")
+    parser.add_argument("--query", default="category:food amount>500")
+    args = parser.parse_args(argv)
+
+    from ledger_gen import generate_expenses
+    from query import run_query
+    import time
+
+    ledgers = Ledgers([f"Ledger {i + 1}" for i in range(args.ledgers)], workers=args.workers)
+    for i, name in enumerate(ledgers):
+        ledgers[name].load(generate_expenses(max(1, args.rows * (i + 1) // args.ledgers), seed=i))
+    largest = ledgers.names()[-1]
+
+    def timed(label, fn):
+        started = time.perf_counter()
+        result = fn()
+        print(f"{label:<40} {(time.perf_counter() - started) * 1000:8.1f} ms")
+        return result
+
+    timed(f"start {args.workers} shards, copy ledgers", ledgers.start)
+    timed(f"search, largest ledger ({len(ledgers[largest])} rows)", lambda: run_query(ledgers[largest], args.query))
+    rows = timed(f"search, all {len(ledgers)} ledgers", lambda: ledgers.search(args.query))
+    timed("category totals, all ledgers", ledgers.category_totals)
+    total = timed("total, all ledgers", ledgers.total)
+    print(f"{len(rows)} matches, ₹{total:,.2f} across {sum(len(ledgers[name]) for name in ledgers)} expenses")
+    ledgers.close()
+
+
+if __name__ == "__main__":
+    main()
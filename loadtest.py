@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Scripted load harness for ExpenseTracker.
+
+Drives the real UI handlers (add_expense, filter_expenses, switch_tab, ...)
+against a FakePage that stands in for ft.Page, on top of a ledger from
+ledger_gen, and prints a latency histogram per operation.
+
+Usage:
+    python loadtest.py --rows 100000 --ops 2000 --seed 1
+"""
+import argparse
+import math
+import random
+import time
+from types import SimpleNamespace
+
+from ledger_gen import VOCABULARY, generate_expenses
+
+
+class FakePage:
+    """Just enough of ft.Page for ExpenseTracker: attributes, add/clean and a
+    no-op update. Controls never get attached, so nothing is sent to a client
+    and the numbers measure the app's own work."""
+
+    def __init__(self, width=1280, height=800):
+        self.width = width
+        self.height = height
+        self.controls = []
+        self.overlay = []
+        self.dialog = None
+        self.snack_bar = None
+        self.updates = 0
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+        self.update()
+
+    def clean(self):
+        self.controls.clear()
+
+    def update(self, *controls):
+        self.updates += 1
+
+    def run_thread(self, handler, *args):
+        handler(*args)
+
+
+class LatencyHistogram:
+    """Log-scale latency histogram (4 buckets per power of two of microseconds)."""
+
+    STEPS = 4
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        bucket = int(math.log2(micros) * self.STEPS)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Upper bound (seconds) of the bucket holding the p-th percentile."""
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / self.STEPS) / 1e6, self.max)
+        return self.max
+
+    def render(self, width=40):
+        peak = max(self.buckets.values())
+        lines = []
+        for bucket in range(min(self.buckets), max(self.buckets) + 1):
+            n = self.buckets.get(bucket, 0)
+            upper = 2 ** ((bucket + 1) / self.STEPS) / 1e3
+            lines.append(f"  <{upper:10.3f} ms | {'#' * math.ceil(n / peak * width):<{width}} {n}")
+        return "\n".join(lines)
+
+
+class LoadHarness:
+    def __init__(self, rows, seed=0):
+        from ex import ExpenseTracker # Imported here so ledger_gen users don't need flet
+
+        self.rng = random.Random(seed)
+        self.page = FakePage()
+        self.app = ExpenseTracker(self.page)
+        self.histograms = {}
+
+        started = time.perf_counter()
+        self.app.store.load(generate_expenses(rows, seed=seed))
+        self.load_seconds = time.perf_counter() - started
+        self.app.main()
+        self.samples = list(generate_expenses(1000, seed=seed + 1))
+
+    def timed(self, name, handler, *args):
+        started = time.perf_counter()
+        handler(*args)
+        self.histograms.setdefault(name, LatencyHistogram()).record(time.perf_counter() - started)
+
+    # --- Scripted operations ---
+    def op_add_expense(self):
+        expense = self.rng.choice(self.samples)
+        self.app.expense_name.value = expense["name"]
+        self.app.expense_amount.value = f"{expense['amount']:.2f}"
+        self.app.expense_category.value = expense["category"]
+        self.app.expense_date_picker.value = expense["date"]
+        self.timed("add_expense", self.app.add_expense, None)
+
+    def op_filter_expenses(self):
+        merchants, items = VOCABULARY[self.rng.choice(list(VOCABULARY))]
+        word = self.rng.choice(merchants + items).lower()
+        start = self.rng.randrange(len(word))
+        self.app.search_expense.value = word[start:start + self.rng.randint(2, 6)]
+        self.timed("filter_expenses", self.app.filter_expenses, None)
+        self.app.search_expense.value = ""
+
+    def op_switch_tab(self):
+        self.app.navbar.selected_index = self.rng.randrange(len(self.app.navbar.destinations))
+        self.timed("switch_tab", self.app.switch_tab, SimpleNamespace(control=self.app.navbar))
+
+    OPERATIONS = {
+        "add_expense": (op_add_expense, 5),
+        "filter_expenses": (op_filter_expenses, 4),
+        "switch_tab": (op_switch_tab, 1),
+    }
+
+    def run(self, ops):
+        names = list(self.OPERATIONS)
+        weights = [self.OPERATIONS[name][1] for name in names]
+        for _ in range(ops):
+            name = self.rng.choices(names, weights)[0]
+            self.OPERATIONS[name][0](self)
+
+    def report(self):
+        lines = [f"Loaded {len(self.app.store)} expenses in {self.load_seconds:.2f}s", ""]
+        lines.append(f"{'operation':<18}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, hist in sorted(self.histograms.items()):
+            lines.append(
+                f"{name:<18}{hist.count:>7}{hist.total / hist.count * 1e3:>10.3f}"
+                f"{hist.percentile(50) * 1e3:>10.3f}{hist.percentile(90) * 1e3:>10.3f}"
+                f"{hist.percentile(99) * 1e3:>10.3f}{hist.max * 1e3:>10.3f}"
+            )
+        for name, hist in sorted(self.histograms.items()):
+            lines.extend(["", f"{name}:", hist.render()])
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive ExpenseTracker handlers and report latency histograms.")
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic expenses to preload")
+    parser.add_argument("--ops", type=int, default=1000, help="scripted operations to run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    harness = LoadHarness(args.rows, seed=args.seed)
+    harness.run(args.ops)
+    print(harness.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+"""Small query language for the search box.
+
+    category:food amount>500 date:2024-03..2024-06 "coffee"
+
+Terms are ANDed. Supported terms:
+    word / "quoted phrase"       substring of name, category or date (like plain search)
+    name:word                    substring of the name only
+    category:food  (cat:)        category, case-insensitive; an exact name wins, else any category
+                                 starting with it (food -> Food, foo -> Food and Foodcourt)
+    amount>500, amount<=20, amount:100..500, amount:250
+    date:2024, date:2024-03, date:2024-03-05, date:2024-03..2024-06, date>=2024-01-01
+    tag:work, tag:work|travel    has the tag (any of them with |); repeat for AND
+    -term                        excludes matches of term
+
+A query is parsed once into an AST (cached by text). Running it compiles a
+plan against the store's indexes: the term with the smallest estimated
+result seeds the candidates, the other terms are intersected in order of
+selectivity (or checked per row when their index would be larger than the
+remaining candidates). All tag terms are first folded into one bitmap
+expression (AND of tags, OR within a term, AND NOT for negated ones).
+
+The indexes only cover the store's hot tier. Sealed segments (tiers.py)
+are checked against every term's zone-map test first; in segments that
+could hold a match the terms filter row positions on the decoded columns
+(dictionary columns test each distinct value once), and only the rows
+that survive are turned into expense dicts.
+"""
+from datetime import datetime
+from functools import lru_cache
+import re
+
+from expense_store import normalize_tags, text_matches, trigrams
+
+
+class QueryError(ValueError):
+    """Raised for queries that can't be parsed."""
+
+
+# --- AST ---
+class Term:
+    negated = False
+    exact = True # False when ids() may return a superset that must be re-checked per row
+
+    def estimate(self, store):
+        """Upper bound on the number of matching rows, from index statistics."""
+        return len(store)
+
+    def ids(self, store):
+        """Matching hot ids from the index (only called for the seed or cheap terms)."""
+        return {expense["id"] for expense in store.iter_hot() if self.matches(expense)}
+
+    def matches(self, expense):
+        raise NotImplementedError
+
+    def resolve(self, store):
+        """The term bound to `store`, for terms whose meaning depends on the
+        store's data (parsed terms are cached and shared between stores)."""
+        return self
+
+    def may_match(self, segment):
+        """False if the segment's zone maps rule out any match."""
+        return True
+
+    def filter_segment(self, segment, positions):
+        """The row positions of `segment` (among `positions`) that match."""
+        return [i for i in positions if self.matches(segment.row(i))]
+
+
+def _filter_codes(segment, column, positions, accept):
+    """Positions whose dictionary value passes accept(value), testing each distinct value once."""
+    dictionary, codes = segment.encoded(column)
+    ok = {code for code, value in enumerate(dictionary) if accept(value)}
+    if len(ok) == len(dictionary):
+        return positions if isinstance(positions, list) else list(positions)
+    return [i for i in positions if codes[i] in ok] if ok else []
+
+
+class Text(Term):
+    exact = False # Trigram candidates still need the substring check
+
+    def __init__(self, value, fields="all"):
+        self.value = value.lower()
+        self.fields = fields
+
+    def __repr__(self):
+        return f"Text({self.value!r}, {self.fields})"
+
+    def _grams(self):
+        return trigrams(self.value)
+
+    def estimate(self, store):
+        grams = self._grams()
+        if not grams:
+            return len(store)
+        return min(len(store.trigram_ids(gram)) for gram in grams)
+
+    def ids(self, store):
+        grams = self._grams()
+        if not grams:
+            return super().ids(store)
+        postings = sorted((store.trigram_ids(gram) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+        return candidates
+
+    def matches(self, expense):
+        if self.fields == "name":
+            return self.value in expense["name"].lower()
+        return text_matches(expense, self.value)
+
+    def may_match(self, segment):
+        return all(gram in segment.trigrams for gram in self._grams())
+
+    def filter_segment(self, segment, positions):
+        value = self.value
+        names, name_codes = segment.encoded("name")
+        ok_names = {code for code, name in enumerate(names) if value in name.lower()}
+        if self.fields == "name":
+            return [i for i in positions if name_codes[i] in ok_names]
+        categories, category_codes = segment.encoded("category")
+        ok_categories = {code for code, category in enumerate(categories) if value in category.lower()}
+        if value.strip("0123456789-"): # Can't be part of a date (see text_matches)
+            return [i for i in positions if name_codes[i] in ok_names or category_codes[i] in ok_categories]
+        days = {}
+        return [i for i in positions if name_codes[i] in ok_names or category_codes[i] in ok_categories
+                or value in segment.day_string(i, days)]
+
+
+class Category(Term):
+    def __init__(self, value, categories=None):
+        self.value = value.lower()
+        self.categories = categories # Category names this term stands for, once resolved
+
+    def __repr__(self):
+        return f"Category({self.value!r})"
+
+    def resolve(self, store):
+        categories = store.categories()
+        exact = {c for c in categories if c.lower() == self.value}
+        return Category(self.value, frozenset(exact or {c for c in categories if c.lower().startswith(self.value)}))
+
+    def _categories(self, store):
+        return self.categories if self.categories is not None else self.resolve(store).categories
+
+    def estimate(self, store):
+        return sum(len(store.category_ids(c)) for c in self._categories(store))
+
+    def ids(self, store):
+        result = set()
+        for category in self._categories(store):
+            result |= store.category_ids(category)
+        return result
+
+    def _accepts(self, category):
+        if self.categories is not None: # Resolved against every category in both tiers: hot and cold agree
+            return category in self.categories
+        return category.lower().startswith(self.value) # Unresolved: no store to look for an exact name
+
+    def matches(self, expense):
+        return self._accepts(expense["category"])
+
+    def may_match(self, segment):
+        return any(self._accepts(category) for category in segment.categories)
+
+    def filter_segment(self, segment, positions):
+        return _filter_codes(segment, "category", positions, self._accepts)
+
+
+class AmountRange(Term):
+    def __init__(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        self.low, self.high = low, high
+        self.low_inclusive, self.high_inclusive = low_inclusive, high_inclusive
+
+    def __repr__(self):
+        return f"AmountRange({self.low}, {self.high}, {self.low_inclusive}, {self.high_inclusive})"
+
+    def _bounds(self):
+        return self.low, self.high, self.low_inclusive, self.high_inclusive
+
+    def estimate(self, store):
+        return store.amount_range_count(*self._bounds())
+
+    def ids(self, store):
+        return set(store.amount_range_ids(*self._bounds()))
+
+    def matches(self, expense):
+        amount = expense["amount"]
+        if self.low is not None and (amount < self.low or (amount == self.low and not self.low_inclusive)):
+            return False
+        if self.high is not None and (amount > self.high or (amount == self.high and not self.high_inclusive)):
+            return False
+        return True
+
+    def may_match(self, segment):
+        return segment.overlaps_amounts(self.low, self.high)
+
+    def filter_segment(self, segment, positions):
+        amounts = segment.column("amount")
+        low, high = self.low, self.high
+        if low is not None:
+            positions = [i for i in positions if amounts[i] > low or (amounts[i] == low and self.low_inclusive)]
+        if high is not None:
+            positions = [i for i in positions if amounts[i] < high or (amounts[i] == high and self.high_inclusive)]
+        return positions
+
+
+class DateRange(Term):
+    """low <= date < high; either bound may be None."""
+
+    def __init__(self, low=None, high=None):
+        self.low, self.high = low, high
+
+    def __repr__(self):
+        return f"DateRange({self.low}, {self.high})"
+
+    def estimate(self, store):
+        return store.date_range_count(self.low, self.high)
+
+    def ids(self, store):
+        return set(store.date_range_ids(self.low, self.high))
+
+    def matches(self, expense):
+        date = expense["date"]
+        return (self.low is None or date >= self.low) and (self.high is None or date < self.high)
+
+    def may_match(self, segment):
+        return segment.overlaps_dates(self.low, self.high)
+
+    def filter_segment(self, segment, positions):
+        lo, hi = segment.date_slice(self.low, self.high) # Rows are in date order: a bisect, not a scan
+        if isinstance(positions, range):
+            return range(max(lo, positions.start), min(hi, positions.stop))
+        return [i for i in positions if lo <= i < hi]
+
+
+class Tag(Term):
+    """Has any of `tags`."""
+
+    def __init__(self, tags):
+        self.tags = tags
+
+    def __repr__(self):
+        return f"Tag({'|'.join(self.tags)})"
+
+    def bitmap(self, index):
+        bits = 0
+        for tag in self.tags:
+            bits |= index.bitmap(tag)
+        return bits
+
+    def matches(self, expense):
+        return any(tag in expense.get("tags", ()) for tag in self.tags)
+
+    def may_match(self, segment):
+        return any(tag in segment.tag_totals for tag in self.tags)
+
+    def filter_segment(self, segment, positions):
+        return _filter_codes(segment, "tags", positions, lambda tags: any(tag in tags for tag in self.tags))
+
+
+class TagFilter(Term):
+    """All tag terms of a query combined into a single bitmap expression."""
+
+    def __init__(self, terms):
+        self.terms = terms
+        self._bits = None
+
+    def __repr__(self):
+        return f"TagFilter({' & '.join(map(repr, self.terms))})"
+
+    def bitmap(self, store):
+        if self._bits is None:
+            index = store.tag_index
+            bits = index.live_bitmap()
+            for term in self.terms:
+                if term.negated:
+                    bits &= ~term.term.bitmap(index)
+                else:
+                    bits &= term.bitmap(index)
+            self._bits = bits
+        return self._bits
+
+    def estimate(self, store):
+        return bin(self.bitmap(store)).count("1")
+
+    def ids(self, store):
+        return store.tag_index.ids(self.bitmap(store))
+
+    def total(self, store):
+        return store.tag_index.total(self.bitmap(store))
+
+    def matches(self, expense):
+        return all(term.matches(expense) for term in self.terms)
+
+    def may_match(self, segment):
+        return all(term.may_match(segment) for term in self.terms)
+
+    def filter_segment(self, segment, positions):
+        for term in self.terms:
+            positions = term.filter_segment(segment, positions)
+        return positions
+
+
+class Not(Term):
+    negated = True
+
+    def __init__(self, term):
+        self.term = term
+
+    def __repr__(self):
+        return f"Not({self.term!r})"
+
+    def matches(self, expense):
+        return not self.term.matches(expense)
+
+    def resolve(self, store):
+        term = self.term.resolve(store)
+        return self if term is self.term else Not(term)
+
+    def filter_segment(self, segment, positions):
+        excluded = set(self.term.filter_segment(segment, positions))
+        return [i for i in positions if i not in excluded]
+
+
+# --- Parser ---
+_TOKEN = re.compile(r'(-?)(?:(\w+)(:|>=|<=|>|<|=)("[^"]*"?|\S+)|"([^"]*)"?|(\S+))')
+_FIELD_ALIASES = {"cat": "category", "category": "category", "amount": "amount", "amt": "amount",
+                  "date": "date", "name": "name", "tag": "tag", "tags": "tag"}
+
+
+def _parse_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        raise QueryError(f"Not a number: {text!r}")
+
+
+def _date_span(text):
+    """Returns [start, end) covering a YYYY, YYYY-MM or YYYY-MM-DD value."""
+    for fmt, unit in (('%Y-%m-%d', "day"), ('%Y-%m', "month"), ('%Y', "year")):
+        try:
+            start = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if unit == "day":
+            end = datetime.fromordinal(start.toordinal() + 1)
+        elif unit == "month":
+            end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        else:
+            end = datetime(start.year + 1, 1, 1)
+        return start, end
+    raise QueryError(f"Not a date (use YYYY, YYYY-MM or YYYY-MM-DD): {text!r}")
+
+
+def _split_range(value):
+    if ".." not in value:
+        return None
+    low, high = value.split("..", 1)
+    return low or None, high or None
+
+
+def _field_term(field, op, value):
+    field = _FIELD_ALIASES.get(field.lower())
+    if field is None:
+        return None
+    if value.startswith('"'):
+        value = value.strip('"')
+    if not value:
+        raise QueryError(f"Missing value for {field}")
+
+    if field == "name":
+        if op != ":":
+            raise QueryError("name only supports name:text")
+        return Text(value, fields="name")
+    if field == "tag":
+        tags = normalize_tags(value.split("|"))
+        if op != ":" or not tags:
+            raise QueryError("tag only supports tag:name or tag:a|b")
+        return Tag(tags)
+    if field == "category":
+        if op not in (":", "="):
+            raise QueryError("category only supports category:value")
+        return Category(value)
+    if field == "amount":
+        if op in (":", "="):
+            bounds = _split_range(value)
+            if bounds:
+                low, high = bounds
+                return AmountRange(_parse_number(low) if low else None, _parse_number(high) if high else None)
+            number = _parse_number(value)
+            return AmountRange(number, number)
+        number = _parse_number(value)
+        return {
+            ">": AmountRange(low=number, low_inclusive=False),
+            ">=": AmountRange(low=number),
+            "<": AmountRange(high=number, high_inclusive=False),
+            "<=": AmountRange(high=number),
+        }[op]
+    # date
+    if op in (":", "="):
+        bounds = _split_range(value)
+        if bounds:
+            low, high = bounds
+            return DateRange(_date_span(low)[0] if low else None, _date_span(high)[1] if high else None)
+        return DateRange(*_date_span(value))
+    start, end = _date_span(value)
+    return {
+        ">": DateRange(low=end),
+        ">=": DateRange(low=start),
+        "<": DateRange(high=start),
+        "<=": DateRange(high=end),
+    }[op]
+
+
+@lru_cache(maxsize=256)
+def parse_query(text):
+    """Parses query text into a tuple of terms (the AST). Raises QueryError."""
+    terms = []
+    for match in _TOKEN.finditer(text.strip()):
+        negate, field, op, value, phrase, word = match.groups()
+        term = None
+        if field is not None:
+            term = _field_term(field, op, value)
+            if term is None: # Unknown field, e.g. "re:invent" - treat as plain text
+                term = Text(match.group(0)[len(negate):])
+        elif phrase is not None:
+            if not phrase:
+                continue
+            term = Text(phrase)
+        elif word:
+            term = Text(word)
+        if term is None:
+            continue
+        terms.append(Not(term) if negate else term)
+    return tuple(terms)
+
+
+# --- Planning / execution ---
+class QueryPlan:
+    """Seed term + ordered intersect/filter steps for one query on one store."""
+
+    def __init__(self, store, terms):
+        self.store = store
+        terms = [term.resolve(store) for term in terms]
+        tag_terms = [term for term in terms if isinstance(term, Tag) or (term.negated and isinstance(term.term, Tag))]
+        if tag_terms:
+            terms = [term for term in terms if term not in tag_terms] + [TagFilter(tag_terms)]
+        self.terms = terms
+        positive = [term for term in terms if not term.negated]
+        self.filters = [term for term in terms if term.negated]
+        estimated = sorted(((term.estimate(store), i, term) for i, term in enumerate(positive)), key=lambda t: t[:2])
+        self.seed = estimated[0][2] if estimated else None
+        self.seed_estimate = estimated[0][0] if estimated else len(store)
+        self.rest = [(estimate, term) for estimate, _, term in estimated[1:]]
+
+    def explain(self):
+        steps = [f"seed {self.seed!r} (~{self.seed_estimate} rows)" if self.seed else f"scan all ({len(self.store)} rows)"]
+        steps += [f"intersect/filter {term!r} (~{estimate} rows)" for estimate, term in self.rest]
+        steps += [f"filter {term!r}" for term in self.filters]
+        cold = self.store.cold
+        if cold:
+            steps.append(f"cold: scan {len(self._segments())} of {len(cold.segments)} segments (zone maps)")
+        return "\n".join(steps)
+
+    def _segments(self):
+        return [segment for segment in self.store.cold.segments
+                if all(term.may_match(segment) for term in self.terms)]
+
+    def execute(self):
+        """Returns matching expenses, newest first."""
+        rows = self._execute_hot()
+        cold = self.store.cold
+        if not cold:
+            return rows
+        # Date terms first: on date-ordered segments they're a slice
+        terms = sorted(self.terms, key=lambda term: not isinstance(term, DateRange))
+        for segment in self._segments():
+            cold.touch(segment)
+            positions = range(segment.count)
+            for term in terms:
+                positions = term.filter_segment(segment, positions)
+                if not positions:
+                    break
+            rows.extend(segment.rows_at(positions))
+        rows.sort(key=lambda expense: (expense["date"], expense["id"]), reverse=True)
+        return rows
+
+    def _execute_hot(self):
+        store = self.store
+        row_filters = list(self.filters)
+        if self.seed is None:
+            candidates = None
+        else:
+            candidates = self.seed.ids(store)
+            if not self.seed.exact:
+                row_filters.append(self.seed)
+        for estimate, term in self.rest:
+            if candidates is not None and not candidates:
+                break
+            if candidates is None or estimate <= len(candidates):
+                ids = term.ids(store)
+                candidates = ids if candidates is None else candidates & ids
+                if not term.exact:
+                    row_filters.append(term)
+            else:
+                row_filters.append(term) # Cheaper to check the few remaining rows
+        if candidates is None:
+            rows = [expense for expense in store.iter_hot() if all(term.matches(expense) for term in row_filters)]
+            return rows # Already newest first
+        rows = [store.get(expense_id) for expense_id in candidates]
+        if row_filters:
+            rows = [expense for expense in rows if all(term.matches(expense) for term in row_filters)]
+        rows.sort(key=lambda expense: (expense["date"], expense["id"]), reverse=True)
+        return rows
+
+
+def run_query(store, text):
+    """Parses (cached), plans and runs `text` against `store`."""
+    return QueryPlan(store, parse_query(text)).execute()
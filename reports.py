@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""Monthly HTML / PDF statements, rendered in parallel and cached.
+
+Each month's rows are hashed (sha256 over the rows plus the renderer
+version). The output directory keeps a manifest of month -> hash, so
+regenerating a year only re-renders the months whose expenses changed;
+those are rendered on a process pool, one month per task.
+
+The PDF writer is a small stdlib one (Helvetica, text only), so no extra
+dependency is needed.
+
+Standalone:
+    python reports.py --out reports --year 2024 --rows 100000
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import html
+import json
+import os
+
+RENDERER_VERSION = "1" # Bump when the layout changes to invalidate every cached statement
+MANIFEST = "manifest.json"
+FORMATS = ("html", "pdf")
+
+
+def month_label(month):
+    year, month_number = month
+    return datetime(year, month_number, 1).strftime("%B %Y")
+
+
+def month_rows(store, month):
+    """The month's rows as plain tuples (name, amount, category, iso date, tags), in date order."""
+    year, month_number = month
+    start = datetime(year, month_number, 1)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+    return [(expense["name"], expense["amount"], expense["category"],
+             expense["date"].isoformat(timespec="seconds"), tuple(expense.get("tags", ())))
+            for expense in store.rows_between(start, end)]
+
+
+def content_hash(rows):
+    digest = hashlib.sha256(RENDERER_VERSION.encode("utf-8"))
+    for row in rows:
+        digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def summarize(rows):
+    """Returns (total, [(category, total, count)] biggest first, {category: rows})."""
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row[2], []).append(row)
+    summary = [(category, sum(row[1] for row in items), len(items)) for category, items in by_category.items()]
+    summary.sort(key=lambda item: item[1], reverse=True)
+    return sum(item[1] for item in summary), summary, by_category
+
+
+# --- Renderers (run in worker processes) ---
+def render_html(month, rows):
+    total, summary, by_category = summarize(rows)
+    title = f"Statement — {month_label(month)}"
+    out = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif;margin:2em;color:#222}table{border-collapse:collapse;width:100%;margin-bottom:1.5em}"
+        "th,td{padding:4px 8px;border-bottom:1px solid #ddd;text-align:left}td.num,th.num{text-align:right}"
+        "h1{color:#2196F3}h2{color:#4CAF50;margin-top:1.5em}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        f"<p><b>Total:</b> ₹{total:,.2f} across {len(rows)} expenses</p>",
+        "<h2>By category</h2><table><tr><th>Category</th><th class='num'>Expenses</th><th class='num'>Total</th><th class='num'>Share</th></tr>",
+    ]
+    for category, category_total, count in summary:
+        share = category_total / total * 100 if total else 0
+        out.append(f"<tr><td>{html.escape(category)}</td><td class='num'>{count}</td>"
+                   f"<td class='num'>₹{category_total:,.2f}</td><td class='num'>{share:.1f}%</td></tr>")
+    out.append("</table>")
+    for category, category_total, _ in summary:
+        out.append(f"<h2>{html.escape(category)} — ₹{category_total:,.2f}</h2>")
+        out.append("<table><tr><th>Date</th><th>Name</th><th>Tags</th><th class='num'>Amount</th></tr>")
+        for name, amount, _, date, tags in by_category[category]:
+            out.append(f"<tr><td>{date[:10]}</td><td>{html.escape(name)}</td><td>{html.escape(', '.join(tags))}</td>"
+                       f"<td class='num'>₹{amount:,.2f}</td></tr>")
+        out.append("</table>")
+    out.append("</body></html>")
+    return "\n".join(out).encode("utf-8")
+
+
+def _pdf_text(text):
+    text = text.replace("₹", "Rs. ").replace("—", "-")
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_document(pages):
+    """Builds a PDF from pages of (text, size, bold) lines (A4, top to bottom)."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None, # Pages, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        commands = ["BT", "50 800 Td"]
+        for text, size, bold in lines:
+            commands.append(f"/{'F2' if bold else 'F1'} {size} Tf 0 -{size + 4} Td ({_pdf_text(text)}) Tj")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_pdf(month, rows, lines_per_page=54):
+    total, summary, by_category = summarize(rows)
+    lines = [(f"Statement - {month_label(month)}", 16, True),
+             (f"Total: ₹{total:,.2f} across {len(rows)} expenses", 10, False), ("", 10, False),
+             ("By category", 12, True)]
+    for category, category_total, count in summary:
+        share = category_total / total * 100 if total else 0
+        lines.append((f"{category:<20} {count:>5} expenses   ₹{category_total:>12,.2f}   {share:5.1f}%", 10, False))
+    for category, category_total, _ in summary:
+        lines += [("", 10, False), (f"{category} - ₹{category_total:,.2f}", 12, True)]
+        for name, amount, _, date, tags in by_category[category]:
+            tag_text = f"  [{', '.join(tags)}]" if tags else ""
+            lines.append((f"{date[:10]}   {name[:48]:<48} ₹{amount:>10,.2f}{tag_text}", 9, False))
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    return pdf_document(pages)
+
+
+_RENDERERS = {"html": render_html, "pdf": render_pdf}
+
+
+def statement_path(out_dir, month, fmt):
+    return os.path.join(out_dir, f"statement-{month[0]}-{month[1]:02d}.{fmt}")
+
+
+def render_month(out_dir, month, rows, formats):
+    """Worker: renders one month in every format. Returns the written paths."""
+    paths = []
+    for fmt in formats:
+        path = statement_path(out_dir, month, fmt)
+        with open(path, "wb") as f:
+            f.write(_RENDERERS[fmt](month, rows))
+        paths.append(path)
+    return month, paths
+
+
+# --- Driver ---
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def generate_statements(store, out_dir, months=None, year=None, formats=FORMATS, max_workers=None):
+    """Writes statements for `months` ([(year, month)]; default: every month
+    with spending, optionally only those of `year`) into `out_dir`.
+
+    Returns {"rendered": [months], "cached": [months]}. Takes store.lock only
+    while the month buckets are copied out."""
+    unknown = set(formats) - set(_RENDERERS)
+    if unknown:
+        raise ValueError(f"Unknown report formats: {', '.join(sorted(unknown))}")
+    with store.lock:
+        if months is None:
+            months = sorted(store.period_series("month"))
+            if year is not None:
+                months = [month for month in months if month[0] == year]
+        buckets = {tuple(month): month_rows(store, tuple(month)) for month in months}
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _load_manifest(out_dir)
+    stale, cached = [], []
+    for month, rows in buckets.items():
+        key = f"{month[0]}-{month[1]:02d}"
+        digest = content_hash(rows)
+        entry = manifest.get(key, {})
+        up_to_date = all(entry.get(fmt) == digest and os.path.exists(statement_path(out_dir, month, fmt)) for fmt in formats)
+        (cached if up_to_date else stale).append((month, digest))
+
+    if len(stale) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for _ in pool.map(render_month, [out_dir] * len(stale), [month for month, _ in stale],
+                              [buckets[month] for month, _ in stale], [formats] * len(stale)):
+                pass
+    else: # Not worth starting a pool
+        for month, _ in stale:
+            render_month(out_dir, month, buckets[month], formats)
+
+    for month, digest in stale:
+        entry = manifest.setdefault(f"{month[0]}-{month[1]:02d}", {})
+        entry.update({fmt: digest for fmt in formats})
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return {"rendered": [month for month, _ in stale], "cached": [month for month, _ in cached]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render monthly expense statements (HTML/PDF).")
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--rows", type=int, default=100000, help="Synthetic expenses to render (ledger_gen)")
+    parser.add_argument("--format", action="append", choices=FORMATS, help="Repeat for several (default: all)")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    from expense_store import ExpenseStore
+    from ledger_gen import generate_expenses
+    import time
+
+    store = ExpenseStore()
+    store.load(generate_expenses(args.rows))
+    started = time.perf_counter()
+    result = generate_statements(store, args.out, year=args.year, formats=tuple(args.format or FORMATS),
+                                 max_workers=args.workers)
+    print(f"Rendered {len(result['rendered'])} months, {len(result['cached'])} unchanged "
+          f"in {time.perf_counter() - started:.2f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Delta sync of a ledger between devices.
+
+Each device wraps its ExpenseStore in a SyncReplica. The replica listens to
+the store's change events and keeps, per expense id, only the latest
+unpushed change. Changes are stamped with (Lamport clock, site) for
+last-writer-wins conflict resolution and with a per-site sequence number;
+a version vector ({site: highest sequence seen}) says what a device already
+has, so a sync only ships changes the other side is missing.
+
+Wire format (see sync_server.py): zlib-compressed JSON, one compact list
+per change:
+    [lamport, site, seq, op, id, fields]
+    op "u" (upsert, fields = [name, amount, category, date, tags]),
+       "d" (delete, fields = null), "c" (clear everything older, id = null)
+
+Nothing of a replica is saved between runs: sequence numbers, the clock and
+the store's id counter start at 1 again. So the site is one run of the app
+on a device (session_site), not the device itself; otherwise the server
+would take a restarted device's first changes for retries of old ones.
+"""
+from datetime import datetime
+import json
+import urllib.request
+import uuid
+import zlib
+
+_CLEAR = None # Key of a pending clear in SyncReplica.pending
+_NO_VERSION = (0, "")
+
+
+def session_site(device_id):
+    """A site id for this run of the app on `device_id`."""
+    return f"{device_id}.{uuid.uuid4().hex[:6]}"
+
+
+def encode(payload):
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _fields(expense):
+    return [expense["name"], expense["amount"], expense["category"],
+            expense["date"].isoformat(), list(expense.get("tags", ()))]
+
+
+def _expense(expense_id, fields):
+    name, amount, category, date, tags = fields
+    return {"id": expense_id, "name": name, "amount": amount, "category": category,
+            "date": datetime.fromisoformat(date), "tags": tags}
+
+
+class SyncReplica:
+    """Tracks local changes of `store` and merges remote ones (LWW per expense)."""
+
+    def __init__(self, store, site):
+        self.store = store
+        self.site = site
+        self.clock = 0  # Lamport clock
+        self.seq = 0    # Sequence number of this site's changes
+        self.vector = {}   # site -> highest seq applied from that site
+        self.versions = {} # expense id -> (lamport, site) of the winning change (deletes included)
+        self.clear_version = _NO_VERSION
+        self.pending = {}  # expense id (or _CLEAR) -> latest local change not yet pushed
+        self._applying = False
+        store.subscribe(self._on_change)
+
+    # --- Local changes ---
+    def _stamp(self, op, expense_id, fields):
+        self.clock += 1
+        self.seq += 1
+        self.vector[self.site] = self.seq
+        return [self.clock, self.site, self.seq, op, expense_id, fields]
+
+    def _on_change(self, event, *args):
+        if self._applying:
+            return # Remote change being applied; not ours to re-send
+        if event == "insert":
+            self._local_upsert(args[0])
+        elif event == "replace":
+            self._local_upsert(args[1])
+        elif event == "delete":
+            change = self._stamp("d", args[0]["id"], None)
+            self.versions[args[0]["id"]] = (change[0], self.site)
+            self.pending[args[0]["id"]] = change
+        elif event == "reset":
+            change = self._stamp("c", None, None)
+            self.clear_version = (change[0], self.site)
+            self.versions.clear()
+            self.pending = {_CLEAR: change} # Everything pending before is superseded
+            for expense in args[0]: # Undo of a clear brings rows back
+                self._local_upsert(expense)
+
+    def _local_upsert(self, expense):
+        change = self._stamp("u", expense["id"], _fields(expense))
+        self.versions[expense["id"]] = (change[0], self.site)
+        self.pending[expense["id"]] = change
+
+    def outgoing(self):
+        """Pending local changes in the order they were made."""
+        return sorted(self.pending.values(), key=lambda change: change[2])
+
+    def acknowledge(self, changes):
+        """Drops pushed changes from `pending` unless they were superseded meanwhile."""
+        for change in changes:
+            key = change[4] if change[3] != "c" else _CLEAR
+            if self.pending.get(key) is change:
+                del self.pending[key]
+
+    # --- Remote changes ---
+    def apply(self, changes, vector=None):
+        """Merges remote changes into the store. Returns how many changed it."""
+        applied = 0
+        self._applying = True
+        try:
+            for change in sorted(changes, key=lambda c: (c[0], c[1])):
+                lamport, site, seq, op, expense_id, fields = change
+                self.clock = max(self.clock, lamport)
+                self.vector[site] = max(self.vector.get(site, 0), seq)
+                version = (lamport, site)
+                if op == "c":
+                    if version > self.clear_version:
+                        self._apply_clear(version)
+                        applied += 1
+                    continue
+                if version <= self.clear_version or version <= self.versions.get(expense_id, _NO_VERSION):
+                    continue # Older than what we have (LWW)
+                self.versions[expense_id] = version
+                pending = self.pending.get(expense_id)
+                if pending is not None and (pending[0], pending[1]) < version:
+                    del self.pending[expense_id]
+                if op == "u":
+                    self.store.put(_expense(expense_id, fields))
+                else:
+                    self.store.discard(expense_id)
+                applied += 1
+            for site, seq in (vector or {}).items():
+                self.vector[site] = max(self.vector.get(site, 0), seq)
+        finally:
+            self._applying = False
+        if applied:
+            self.store.clear_history() # Local undo entries may no longer line up
+        return applied
+
+    def _apply_clear(self, version):
+        self.clear_version = version
+        stale = [expense_id for expense_id in self.store.ids()
+                 if self.versions.get(expense_id, _NO_VERSION) < version]
+        if len(stale) == len(self.store):
+            self.store.reset() # Nothing newer survives: O(1) generation switch
+        else:
+            for expense_id in stale:
+                self.store.discard(expense_id)
+        self.versions = {expense_id: v for expense_id, v in self.versions.items() if v > version}
+        self.pending = {key: change for key, change in self.pending.items() if (change[0], change[1]) > version}
+
+
+class SyncClient:
+    """Pushes/pulls a replica's changes to a sync server over HTTP."""
+
+    def __init__(self, replica, url, timeout=30):
+        self.replica = replica
+        self.url = url.rstrip("/") + "/sync"
+        self.timeout = timeout
+
+    def sync(self):
+        """One round trip. Returns {"pushed", "pulled", "sent_bytes", "received_bytes"}.
+        The store lock is only held while changes are read or merged, not
+        while waiting on the server."""
+        replica = self.replica
+        lock = replica.store.lock
+        with lock:
+            outgoing = replica.outgoing()
+            body = encode({"site": replica.site, "vector": replica.vector, "changes": outgoing})
+        request = urllib.request.Request(self.url, data=body, method="POST",
+                                         headers={"Content-Type": "application/octet-stream"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+        reply = decode(data)
+        with lock: # Changes made meanwhile stay pending (acknowledge() checks)
+            replica.acknowledge(outgoing)
+            pulled = replica.apply(reply["changes"], reply.get("vector"))
+        return {"pushed": len(outgoing), "pulled": pulled, "sent_bytes": len(body), "received_bytes": len(data)}
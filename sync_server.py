@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Reference sync server for local testing (see sync.py for the protocol).
+
+Keeps, per site, the changes it has received in sequence order. A change
+that is superseded (a newer write to the same expense, or a newer clear)
+is dropped, so the log stays proportional to the live ledger while the
+sequence numbers still let clients ask for "everything after seq N".
+
+Usage:
+    python sync_server.py --port 8765
+"""
+import argparse
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+from sync import decode, encode
+
+_NO_VERSION = (0, "")
+
+
+class SyncLog:
+    def __init__(self):
+        self.seqs = {}    # site -> ascending seqs received
+        self.changes = {} # site -> change per seq (None once superseded)
+        self.latest = {}  # expense id -> (version, site, seq) of its winning change
+        self.clears = []  # (version, site, seq) of clears still in the log
+        self.lock = threading.Lock()
+
+    def vector(self):
+        return {site: seqs[-1] for site, seqs in self.seqs.items() if seqs}
+
+    def _drop(self, site, seq):
+        index = bisect_right(self.seqs[site], seq) - 1
+        self.changes[site][index] = None
+
+    def push(self, changes):
+        for change in changes:
+            lamport, site, seq, op, expense_id, _ = change
+            seqs = self.seqs.setdefault(site, [])
+            if seqs and seq <= seqs[-1]:
+                continue # Already have it (client retried)
+            seqs.append(seq)
+            self.changes.setdefault(site, []).append(change)
+            version = (lamport, site)
+            newest_clear = self.clears[-1][0] if self.clears else _NO_VERSION
+            if op == "c":
+                if version <= newest_clear:
+                    self._drop(site, seq)
+                    continue
+                for entry_id, (entry_version, entry_site, entry_seq) in list(self.latest.items()):
+                    if entry_version < version:
+                        self._drop(entry_site, entry_seq)
+                        del self.latest[entry_id]
+                for _, clear_site, clear_seq in self.clears:
+                    self._drop(clear_site, clear_seq)
+                self.clears = [(version, site, seq)]
+                continue
+            current = self.latest.get(expense_id)
+            if version <= newest_clear or (current is not None and version <= current[0]):
+                self._drop(site, seq) # Lost to a newer write
+                continue
+            if current is not None:
+                self._drop(current[1], current[2])
+            self.latest[expense_id] = (version, site, seq)
+
+    def pull(self, vector, exclude_site=None):
+        """Changes from other sites after the sequence numbers in `vector`."""
+        result = []
+        for site, seqs in self.seqs.items():
+            if site == exclude_site:
+                continue
+            start = bisect_right(seqs, vector.get(site, 0))
+            result.extend(change for change in self.changes[site][start:] if change is not None)
+        return result
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    log = None # SyncLog shared by all requests, set in serve()
+
+    def do_POST(self):
+        if self.path != "/sync":
+            self.send_error(404)
+            return
+        try:
+            request = decode(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with self.log.lock:
+                self.log.push(request.get("changes", []))
+                reply = {"changes": self.log.pull(request.get("vector", {}), request.get("site")),
+                         "vector": self.log.vector()}
+        except (ValueError, KeyError, TypeError) as err:
+            self.send_error(400, str(err))
+            return
+        body = encode(reply)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_error(404)
+            return
+        with self.log.lock:
+            body = json.dumps({"vector": self.log.vector(), "live": len(self.log.latest)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Keep test output quiet
+
+
+def serve(host="127.0.0.1", port=8765, log=None):
+    """Creates (but doesn't start) a server; call serve_forever() on it."""
+    handler = type("BoundSyncHandler", (SyncHandler,), {"log": log or SyncLog()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local reference sync server for the expense tracker.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    server = serve(args.host, args.port)
+    print(f"Sync server listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
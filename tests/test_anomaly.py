@@ -0,0 +1,57 @@
+import copy
+import math
+import random
+
+import pytest
+
+from anomaly import AnomalyDetector, CategoryStats
+
+
+def amounts(n, seed, median=300.0, sigma=0.5):
+    rng = random.Random(seed)
+    return [round(rng.lognormvariate(math.log(median), sigma), 2) for _ in range(n)]
+
+
+@pytest.mark.parametrize("before, batch", [(0, 50), (0, 1000), (200, 50), (200, 1000)])
+def test_merge_matches_update(before, batch):
+    alpha = 0.05
+    one_by_one, merged = CategoryStats(), CategoryStats()
+    for amount in amounts(before, seed=1):
+        one_by_one.update(amount, alpha)
+        merged.update(amount, alpha)
+
+    rows = amounts(batch, seed=2)
+    for amount in rows:
+        one_by_one.update(amount, alpha)
+    merged.merge(rows, alpha)
+
+    assert merged.count == one_by_one.count
+    assert merged.mean == pytest.approx(one_by_one.mean, rel=1e-9)
+    assert merged.m2 == pytest.approx(one_by_one.m2, rel=1e-9)
+    assert merged.sketch == one_by_one.sketch
+    # The EWMA only keeps the batch's tail; anything older weighs < 1e-6
+    assert merged.ewma == pytest.approx(one_by_one.ewma, rel=1e-5)
+    assert merged.ewm_var == pytest.approx(one_by_one.ewm_var, rel=1e-3, abs=1e-9)
+
+
+def test_scan_flags_what_score_would_before_the_batch():
+    detector = AnomalyDetector()
+    for amount in amounts(500, seed=3):
+        detector.observe({"name": "Lunch", "amount": amount, "category": "Food"})
+    for amount in amounts(5, seed=4):
+        detector.observe({"name": "Gift", "amount": amount, "category": "Gifts"}) # Below min_count
+
+    rows = [{"name": "Lunch", "amount": amount, "category": "Food"} for amount in amounts(300, seed=5)]
+    rows += [{"name": "Banquet", "amount": 25000.0, "category": "Food"},
+             {"name": "Big lunch", "amount": 900.0, "category": "Food"}, # Unusual, but not that unusual
+             {"name": "Watch", "amount": 90000.0, "category": "Gifts"},
+             {"name": "New thing", "amount": 50000.0, "category": "Hobbies"}]
+    before = copy.deepcopy(detector)
+    expected = [i for i, row in enumerate(rows) if before.score(row) is not None]
+
+    flagged = detector.scan(rows)
+    assert [i for i, _ in flagged] == expected
+    names = {rows[i]["name"] for i in expected}
+    assert "Banquet" in names and names.isdisjoint({"Big lunch", "Watch", "New thing"})
+    assert detector.threshold("Food") < 25000.0 < detector.threshold("Gifts")
+    assert detector.stats["Food"].count == 500 + 302
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import json
+
+import pytest
+
+from api import ApiError, ExpenseAPI, expense_from_json
+from expense_store import ExpenseStore
+
+
+def valid(**changes):
+    row = {"name": "Lunch", "amount": 250, "category": "Food", "date": "2024-05-10", "tags": "work, Team"}
+    row.update(changes)
+    return row
+
+
+def test_valid_row():
+    expense = expense_from_json(valid(), 0)
+    assert expense == {"name": "Lunch", "amount": 250.0, "category": "Food",
+                       "date": datetime(2024, 5, 10), "tags": ("team", "work")}
+    assert expense_from_json(valid(tags=["a", "b"]), 0)["tags"] == ("a", "b")
+    assert expense_from_json(valid(tags=None), 0)["tags"] == ()
+
+
+@pytest.mark.parametrize("changes", [
+    {"amount": float("nan")}, {"amount": "inf"}, {"amount": float("-inf")}, {"amount": 0}, {"amount": "abc"},
+    {"name": "  "}, {"date": "10/05/2024"}, {"date": None},
+    {"tags": 5}, {"tags": [1, 2]}, {"tags": ["ok", None]}, {"tags": {"a": 1}},
+])
+def test_bad_rows_are_400(changes):
+    with pytest.raises(ApiError) as raised:
+        expense_from_json(valid(**changes), 3)
+    assert raised.value.status == 400
+    assert str(raised.value).startswith("Row 3")
+
+
+def test_aware_dates_become_naive_local_time():
+    date = expense_from_json(valid(date="2024-01-02T10:00:00+05:30"), 0)["date"]
+    assert date.tzinfo is None
+    assert date == datetime(2024, 1, 2, 10, tzinfo=timezone(timedelta(hours=5, minutes=30))).astimezone().replace(tzinfo=None)
+
+
+def test_failed_load_leaves_the_store_as_it_was():
+    store = ExpenseStore()
+    store.add("Coffee", 120.0, "Food", datetime(2024, 1, 1))
+    version, keys = store.version, list(store._keys)
+    bad_rows = [
+        [{"name": "Tea", "amount": 50.0, "category": "Food", "date": datetime(2024, 1, 2)},
+         {"name": "Aware", "amount": 60.0, "category": "Food", "date": datetime(2024, 1, 3, tzinfo=timezone.utc)}],
+        [{"name": "Tea", "amount": 50.0, "category": "Food", "date": datetime(2024, 1, 2)}, {"name": "No date"}],
+    ]
+    for rows in bad_rows:
+        with pytest.raises((KeyError, ValueError)):
+            store.load(rows)
+        assert store.version == version and store._keys == keys
+        assert len(store) == 1 and store.total == 120.0 and store.category_totals() == {"Food": 120.0}
+
+
+def test_missing_field_is_400():
+    row = valid()
+    del row["amount"]
+    with pytest.raises(ApiError) as raised:
+        expense_from_json(row, 0)
+    assert raised.value.status == 400
+
+
+def post(api, rows):
+    async def run():
+        server = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps(rows).encode("utf-8")
+        writer.write(b"POST /expenses HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_bulk_insert_rejects_the_whole_batch():
+    store = ExpenseStore()
+    api = ExpenseAPI(store)
+    status, body = post(api, [valid(), valid(tags=5)])
+    assert status == 400 and "Row 1" in body["error"]
+    assert len(store) == 0
+
+    status, body = post(api, [valid(), valid(name="Dinner", amount="99.5")])
+    assert status == 201 and body["inserted"] == 2
+    assert len(store) == 2 and store.total == 349.5
+
+    status, body = post(api, [valid(name="Call", date="2024-01-02T10:00:00+05:30"), valid(name="Late", date="2024-06-01")])
+    assert status == 201 and body["inserted"] == 2
+    assert [row["name"] for row in store] == ["Late", "Dinner", "Lunch", "Call"]
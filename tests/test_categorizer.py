@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from categorizer import Categorizer
+from expense_store import ExpenseStore
+
+
+def test_model_follows_store_changes():
+    store = ExpenseStore()
+    store.add("Uber ride", 250.0, "Transportation", datetime(2024, 1, 1))
+    model = Categorizer()
+    model.watch(store)
+    assert model.doc_counts == {"Transportation": 1}
+
+    expense = store.add("Pizza", 400.0, "Food", datetime(2024, 1, 2))
+    assert model.doc_counts == {"Transportation": 1, "Food": 1}
+
+    store.update(expense["id"], category="Entertainment")
+    assert model.doc_counts == {"Transportation": 1, "Entertainment": 1}
+
+    store.undo() # Back to Food
+    assert model.doc_counts == {"Transportation": 1, "Food": 1}
+    store.undo() # The add itself
+    assert model.doc_counts == {"Transportation": 1}
+
+    store.clear()
+    assert model.doc_counts == {}
+    store.undo()
+    assert model.doc_counts == {"Transportation": 1}
+
+
+def test_bulk_load_is_learned():
+    store = ExpenseStore()
+    model = Categorizer()
+    model.watch(store)
+    store.load([{"name": "Swiggy order", "amount": 300.0, "category": "Food", "date": datetime(2024, 2, d)}
+                for d in range(1, 11)])
+    assert model.suggest("swiggy order", 320.0) == "Food"
+    store.remove(store[0]["id"])
+    assert model.doc_counts == {"Food": 9}
+
+
+def test_undoing_a_clear_swaps_the_counts_back(monkeypatch):
+    store = ExpenseStore()
+    store.load([{"name": f"Shop {i}", "amount": 100.0 + i, "category": "Food" if i % 2 else "Utilities",
+                 "date": datetime(2024, 3, 1 + i % 28)} for i in range(200)])
+    model = Categorizer()
+    model.watch(store)
+    before = (dict(model.doc_counts), model.suggest("Shop 7", 107.0))
+
+    store.clear()
+    store.add("Metro card", 500.0, "Transportation", datetime(2024, 4, 1))
+    assert model.doc_counts == {"Transportation": 1}
+
+    def no_refit(expenses):
+        raise AssertionError("undo/redo of a clear must not refit")
+    monkeypatch.setattr(model, "fit", no_refit)
+    store.undo() # The add
+    store.undo() # The clear
+    assert (model.doc_counts, model.suggest("Shop 7", 107.0)) == before
+    store.redo()
+    assert model.doc_counts == {}
+    store.redo()
+    assert model.doc_counts == {"Transportation": 1}
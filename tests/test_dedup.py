@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from expense_store import ExpenseStore
+
+
+def row(name, amount, date, category="Food"):
+    return {"name": name, "amount": amount, "date": date, "category": category}
+
+
+def indexed_store():
+    store = ExpenseStore()
+    store.add("Starbucks Coffee", 350.0, "Food", datetime(2024, 5, 10, 9, 30))
+    store.add("Electricity bill", 1800.0, "Utilities", datetime(2024, 5, 12, 18, 0))
+    return store
+
+
+def test_identical_exact_and_near():
+    index = indexed_store().dedup_index()
+    assert index.check(row("Starbucks Coffee", 350.0, datetime(2024, 5, 10, 9, 30)))[0] == "identical"
+    # Same day, amount and name but another time (or category): worth a look, not identical
+    assert index.check(row("Starbucks Coffee", 350.0, datetime(2024, 5, 10, 18, 0)))[0] == "exact"
+    assert index.check(row("starbucks coffee", 350.0, datetime(2024, 5, 10, 9, 30), "Others"))[0] == "exact"
+    near = index.check(row("Starbucks Coffe", 350.0, datetime(2024, 5, 11, 8, 0)))
+    assert near is not None and near[0] == "near"
+    assert index.check(row("Starbucks Coffee", 351.0, datetime(2024, 5, 10, 9, 30))) is None
+    assert index.check(row("Starbucks Coffee", 350.0, datetime(2024, 6, 10, 9, 30))) is None
+
+
+def test_typed_entry_without_category_is_never_identical():
+    index = indexed_store().dedup_index()
+    match = index.check({"name": "Starbucks Coffee", "amount": 350.0, "date": datetime(2024, 5, 10, 9, 30)})
+    assert match[0] == "exact"
+
+
+def test_recurring_rows_are_batch_matches_not_identical():
+    index = ExpenseStore().dedup_index()
+    start = datetime(2024, 7, 1, 8, 15)
+    rows = [row("Metro ticket", 40.0, start + timedelta(days=i), "Transportation") for i in range(10)]
+    results = index.check_batch(rows)
+    assert results[0] is None
+    assert all(result is not None and result[0] == "batch" for result in results[1:])
+    assert not any(result and result[0] == "identical" for result in results)
+
+
+def test_index_follows_store_changes():
+    store = indexed_store()
+    index = store.dedup_index()
+    expense = store.add("Pizza Hut", 700.0, "Food", datetime(2024, 5, 20, 20, 0))
+    assert index.check(row("Pizza Hut", 700.0, datetime(2024, 5, 20, 20, 0)))[0] == "identical"
+    store.update(expense["id"], amount=750.0)
+    assert index.check(row("Pizza Hut", 700.0, datetime(2024, 5, 20, 20, 0))) is None
+    store.undo()
+    assert index.check(row("Pizza Hut", 700.0, datetime(2024, 5, 20, 20, 0)))[0] == "identical"
+    store.remove(expense["id"])
+    assert index.check(row("Pizza Hut", 700.0, datetime(2024, 5, 20, 20, 0))) is None
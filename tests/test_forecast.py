@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from expense_store import ExpenseStore
+from forecast import Forecaster
+
+
+def monthly_store():
+    store = ExpenseStore()
+    for month in range(1, 13):
+        store.add("Groceries", 1000.0 + month * 10, "Food", datetime(2023, month, 5))
+        store.add("Bus pass", 500.0, "Transport", datetime(2023, month, 6))
+    store.add("Groceries", 400.0, "Food", datetime(2024, 1, 3)) # Month in progress
+    return store
+
+
+def test_current_month_is_forecast_not_fitted():
+    forecaster = Forecaster(monthly_store())
+    forecast = forecaster.forecast("Food")
+    assert forecast.last_month == (2023, 12)
+    assert forecast.months == [(2024, 1), (2024, 2), (2024, 3)]
+
+
+def test_only_touched_fitted_months_refit():
+    store = monthly_store()
+    forecaster = Forecaster(store)
+    forecaster.forecast_all()
+    refits = forecaster.refits
+
+    store.add("Snacks", 80.0, "Food", datetime(2024, 1, 10)) # In progress: no cached fit saw it
+    forecaster.forecast_all()
+    assert forecaster.refits == refits
+
+    store.add("Taxi", 300.0, "Transport", datetime(2023, 11, 2)) # A fitted month: Transport and the total
+    forecaster.forecast_all()
+    assert forecaster.refits == refits + 2
+
+    store.add("Groceries", 900.0, "Food", datetime(2024, 2, 1)) # January is complete now: everything moves on
+    forecaster.forecast_all()
+    assert forecaster.refits == refits + 2 + 3
@@ -0,0 +1,86 @@
+from datetime import datetime
+import gc
+
+import pytest
+
+from ledger_gen import generate_expenses
+from ledgers import Ledgers
+from query import QueryError, run_query
+
+NAMES = ["Personal", "Business", "Household"]
+
+
+@pytest.fixture(params=[0, 2], ids=["in-process", "shards"])
+def ledgers(request):
+    ledgers = Ledgers(NAMES, workers=request.param, hot_years=2)
+    for i, name in enumerate(NAMES):
+        ledgers[name].load(generate_expenses(400 * (i + 1), seed=i, start=datetime(2020, 1, 1), years=5))
+    ledgers["Business"].add("Same minute", 10.0, "Food", datetime(2024, 6, 1, 12))
+    ledgers["Household"].add("Same minute", 20.0, "Food", datetime(2024, 6, 1, 12))
+    yield ledgers
+    ledgers.close()
+
+
+def expected_search(ledgers, text):
+    """Every ledger's matches, sorted newest first from scratch."""
+    rows = [(name, expense) for name in NAMES for expense in (run_query(ledgers[name], text) if text else ledgers[name])]
+    return sorted(rows, key=lambda item: item[1]["date"], reverse=True)
+
+
+def keys(rows):
+    return [(name, expense["id"], expense["date"]) for name, expense in rows]
+
+
+def assert_merged(ledgers):
+    for text in ["", "category:food amount>500", "date:2021 -category:food", "same minute"]:
+        found = ledgers.search(text)
+        expected = expected_search(ledgers, text)
+        assert sorted(keys(found), key=str) == sorted(keys(expected), key=str), text # Same rows, right ledger labels
+        assert [expense["date"] for _, expense in found] == [expense["date"] for _, expense in expected], text
+        for name, expense in found:
+            assert ledgers[name].get(expense["id"]) == expense
+        for limit in (1, 7, 500):
+            assert ledgers.search(text, limit=limit) == found[:limit], (text, limit)
+    assert ledgers.total() == pytest.approx(sum(ledgers[name].total for name in NAMES))
+    combined = ledgers.category_totals()
+    for category in combined:
+        assert combined[category] == pytest.approx(sum(ledgers[name].category_totals().get(category, 0) for name in NAMES))
+    assert ledgers.summary() == {name: (len(ledgers[name]), pytest.approx(ledgers[name].total)) for name in NAMES}
+    months = ledgers.period_series("month", "Food")
+    assert sum(months.values()) == pytest.approx(ledgers.category_totals()["Food"])
+
+
+def test_search_merges_ledgers_newest_first(ledgers):
+    assert_merged(ledgers)
+    assert len(ledgers.shards) == ledgers.workers # Started by the first read
+    assert [expense["name"] for _, expense in ledgers.search("same minute")] == ["Same minute", "Same minute"]
+    assert ledgers.search("", names=["Business"], limit=3) == [("Business", e) for e in ledgers["Business"][:3]]
+    with pytest.raises(QueryError):
+        ledgers.search("amount>>5")
+
+
+def test_reads_see_every_change(ledgers):
+    assert_merged(ledgers) # Shards have their copies now; what follows goes over as changes
+    business, household = ledgers["Business"], ledgers["Household"]
+    expense = business.add("Conference", 25000.0, "Others", datetime(2024, 7, 1), tags="work")
+    business.update(expense["id"], amount=26000.0)
+    business.remove(business[5]["id"])
+    business.update(business[-1]["id"], category="Food") # A sealed row
+    household.load(generate_expenses(50, seed=9, start=datetime(2023, 1, 1), years=1))
+    assert_merged(ledgers)
+
+    household.clear()
+    assert_merged(ledgers)
+    household.undo() # Swaps the old rows back, in the shard too
+    if ledgers.workers: # ...without sending them again
+        assert [change[4] for change in ledgers.mirrors["Household"].shard.pending if change[0] == "reset"] == [None]
+    business.undo()
+    assert_merged(ledgers)
+    household.redo()
+    gc.collect()
+    assert_merged(ledgers)
+
+    ledgers.add("Travel").add("Flight", 9000.0, "Transportation", datetime(2024, 8, 1))
+    ledgers.remove("Household")
+    assert [name for name, _ in ledgers.search("flight")] == ["Travel"]
+    assert ledgers.total() == pytest.approx(business.total + ledgers["Personal"].total + 9000.0)
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from expense_store import ExpenseStore
+from query import QueryError, run_query
+
+
+@pytest.fixture
+def store():
+    store = ExpenseStore()
+    rows = [
+        ("Coffee", 120.0, "Food", datetime(2024, 3, 1, 9), "work"),
+        ("Sandwich", 250.0, "Food", datetime(2024, 3, 2, 13), ""),
+        ("Coffee refill", 80.0, "Foodcourt", datetime(2024, 3, 3, 16), "work,cash"),
+        ("Metro", 40.0, "Transportation", datetime(2024, 3, 4, 8), "cash"),
+        ("Movie", 600.0, "Entertainment", datetime(2024, 4, 10, 20), ""),
+    ]
+    for name, amount, category, date, tags in rows:
+        store.add(name, amount, category, date, tags=tags)
+    return store
+
+
+def names(rows):
+    return [row["name"] for row in rows]
+
+
+def test_exact_category_wins_over_prefix(store):
+    assert names(run_query(store, "category:food")) == ["Sandwich", "Coffee"]
+    assert names(run_query(store, "cat:foo")) == ["Coffee refill", "Sandwich", "Coffee"]
+    assert names(run_query(store, "category:foodc")) == ["Coffee refill"]
+
+
+def test_negated_category_is_the_complement(store):
+    matched = set(names(run_query(store, "category:food")))
+    excluded = set(names(run_query(store, "-category:food")))
+    assert matched.isdisjoint(excluded)
+    assert matched | excluded == {row["name"] for row in store}
+    assert names(run_query(store, "coffee -category:food")) == ["Coffee refill"]
+
+
+def test_terms_combine(store):
+    assert names(run_query(store, "amount>100 date:2024-03")) == ["Sandwich", "Coffee"]
+    assert names(run_query(store, "tag:work -tag:cash")) == ["Coffee"]
+    assert names(run_query(store, "tag:cash|work amount<=80")) == ["Metro", "Coffee refill"]
+    assert names(run_query(store, '"coffee ref"')) == ["Coffee refill"]
+
+
+def test_bad_query_raises(store):
+    with pytest.raises(QueryError):
+        run_query(store, "amount>abc")
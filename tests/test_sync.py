@@ -0,0 +1,107 @@
+from datetime import datetime
+import threading
+
+from expense_store import ExpenseStore
+from sync import SyncClient, SyncReplica, session_site
+from sync_server import SyncLog, serve
+
+
+def replica(site):
+    return SyncReplica(ExpenseStore(id_prefix=f"{site}-"), site)
+
+
+def sync(replica, log):
+    """What SyncClient.sync and the server do, without the HTTP."""
+    outgoing = replica.outgoing()
+    log.push(outgoing)
+    changes, vector = log.pull(replica.vector, replica.site), log.vector()
+    replica.acknowledge(outgoing)
+    return replica.apply(changes, vector)
+
+
+def rows(replica):
+    return {expense["id"]: (expense["name"], expense["amount"], expense["date"]) for expense in replica.store}
+
+
+def test_changes_reach_the_other_device_with_full_timestamps():
+    log, phone, laptop = SyncLog(), replica("phone"), replica("laptop")
+    phone.store.add("Coffee", 120.0, "Food", datetime(2024, 5, 1, 9, 30, 12, 345678))
+    sync(phone, log)
+    assert sync(laptop, log) == 1
+    assert rows(laptop) == rows(phone)
+    assert rows(laptop)["phone-1"][2].microsecond == 345678
+    assert phone.outgoing() == [] and sync(phone, log) == 0
+
+
+def test_last_writer_wins():
+    log, phone, laptop = SyncLog(), replica("phone"), replica("laptop")
+    expense = phone.store.add("Taxi", 300.0, "Transportation", datetime(2024, 5, 2))
+    sync(phone, log)
+    sync(laptop, log)
+    phone.store.update(expense["id"], amount=310.0)
+    laptop.store.update(expense["id"], amount=350.0)
+    laptop.store.update(expense["id"], amount=360.0) # Later clock: this one wins
+    sync(phone, log)
+    sync(laptop, log)
+    sync(phone, log)
+    assert rows(phone) == rows(laptop)
+    assert phone.store.get(expense["id"])["amount"] == 360.0
+
+
+def test_clear_and_undoing_it():
+    log, phone, laptop = SyncLog(), replica("phone"), replica("laptop")
+    phone.store.add("Rent", 15000.0, "Utilities", datetime(2024, 5, 1))
+    laptop.store.add("Movie", 400.0, "Entertainment", datetime(2024, 5, 3))
+    for device in (phone, laptop, phone):
+        sync(device, log)
+    assert len(phone.store) == len(laptop.store) == 2
+
+    phone.store.clear()
+    sync(phone, log)
+    sync(laptop, log)
+    assert len(laptop.store) == 0
+
+    phone.store.undo() # Brings both rows back, as new writes
+    sync(phone, log)
+    sync(laptop, log)
+    assert rows(laptop) == rows(phone) and len(laptop.store) == 2
+
+
+def test_retried_push_is_not_applied_twice():
+    log, phone, laptop = SyncLog(), replica("phone"), replica("laptop")
+    phone.store.add("Lunch", 250.0, "Food", datetime(2024, 5, 4))
+    log.push(phone.outgoing()) # Reply lost: the client pushes the same changes again
+    sync(phone, log)
+    assert sync(laptop, log) == 1 and len(laptop.store) == 1
+
+
+def test_restarted_device_gets_a_new_site():
+    log, laptop = SyncLog(), replica("laptop")
+    first = replica(session_site("phone"))
+    first.store.add("Groceries", 900.0, "Food", datetime(2024, 5, 5))
+    sync(first, log)
+    sync(laptop, log)
+
+    # Same device after a restart: seq, clock and the id counter start over
+    second = replica(session_site("phone"))
+    assert second.site != first.site
+    sync(second, log)
+    second.store.add("Bus", 40.0, "Transportation", datetime(2024, 5, 6))
+    sync(second, log)
+    assert sync(laptop, log) == 1
+    assert rows(laptop) == rows(second) and len(laptop.store) == 2
+
+
+def test_client_round_trip_over_http():
+    server = serve(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        phone, laptop = replica("phone"), replica("laptop")
+        phone.store.add("Coffee", 120.0, "Food", datetime(2024, 5, 1, 9, 30))
+        assert SyncClient(phone, url).sync()["pushed"] == 1
+        assert SyncClient(laptop, url).sync()["pulled"] == 1
+        assert rows(laptop) == rows(phone)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,108 @@
+from datetime import datetime
+import random
+
+import pytest
+
+from expense_store import ExpenseStore
+from ledger_gen import generate_expenses
+from query import run_query
+
+QUERIES = ["category:food", "cat:foo", "category:foodc", "-category:food", "category:food amount<200",
+           "amount>500", "tag:work", "tag:work|cash -category:food", "date:2021", "date:2022-03",
+           "coffee", "date:2021 -tag:cash amount>=100"]
+
+
+def sample_rows(seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for row in generate_expenses(3000, seed=seed, start=datetime(2020, 1, 1), years=5):
+        # Foodcourt next to Food in some years, alone in 2021: a cold segment
+        # without "Food" must not fall back to the prefix match
+        if row["category"] == "Food" and (row["date"].year == 2021 or (row["date"].year == 2020 and rng.random() < 0.5)):
+            row["category"] = "Foodcourt"
+        row["tags"] = rng.choice(["", "work", "cash", "work,cash"])
+        rows.append(row)
+    rows.append({"name": "Typo", "amount": 99.0, "category": "Food", "date": datetime(2030, 1, 1)})
+    return rows
+
+
+@pytest.fixture
+def stores():
+    rows = sample_rows()
+    flat, tiered = ExpenseStore(), ExpenseStore(hot_years=2)
+    flat.load(dict(row) for row in rows)
+    tiered.load(dict(row) for row in rows)
+    return flat, tiered
+
+
+def assert_same(flat, tiered):
+    assert [row["id"] for row in flat] == [row["id"] for row in tiered]
+    assert len(flat) == len(tiered)
+    assert flat.total == pytest.approx(tiered.total)
+    assert flat.category_totals() == pytest.approx(tiered.category_totals())
+    assert flat.period_series("month", "Food") == pytest.approx(tiered.period_series("month", "Food"))
+    for query in QUERIES:
+        assert [row["id"] for row in run_query(flat, query)] == [row["id"] for row in run_query(tiered, query)], query
+
+
+def test_future_date_does_not_seal_the_current_years(stores):
+    _, tiered = stores
+    assert tiered.cold
+    assert max(segment.max_date for segment in tiered.cold.segments).year == 2022 # 2023 and 2024 stay hot
+
+
+def test_tiered_matches_untiered(stores):
+    flat, tiered = stores
+    assert_same(flat, tiered)
+
+    rng = random.Random(1)
+    cold_ids = sorted(tiered.cold.ids(), key=str)
+    for expense_id in rng.sample(cold_ids, 5):
+        for store in stores:
+            store.update(expense_id, category="Food", amount=150.0)
+    for expense_id in rng.sample(cold_ids, 5):
+        for store in stores:
+            if store.get(expense_id) is not None:
+                store.remove(expense_id)
+    for store in stores:
+        store.add("Foodcourt coffee", 80.0, "Foodcourt", datetime(2021, 6, 1, 10), tags="work")
+    assert_same(flat, tiered)
+
+    for store in stores:
+        store.undo()
+        store.undo()
+    assert_same(flat, tiered)
+
+
+def test_duplicates_in_sealed_years_are_found(stores):
+    _, tiered = stores
+    old = next(row for row in tiered.cold.rows_between(datetime(2021, 5, 1), datetime(2021, 6, 1)))
+    new = {"name": "Something new", "amount": 12345.0, "category": "Others", "date": datetime(2021, 5, 20)}
+    copy = {key: old[key] for key in ("name", "amount", "category", "date")}
+    results = tiered.check_duplicates([copy, new, dict(copy, date=old["date"].replace(hour=23, minute=59))])
+    assert results[0] == ("identical", old["id"], 1.0)
+    assert results[1] is None
+    assert results[2][0] == "exact" and results[2][1] == old["id"]
+
+
+def test_late_rows_and_edits_stay_in_their_year_segment(stores):
+    flat, tiered = stores
+    segments, hot = len(tiered.cold.segments), len(tiered._rows)
+    late = [{"name": f"Late {i}", "amount": 10.0 + i, "category": "Food", "date": datetime(2021, 3, 3 + i)} for i in range(3)]
+    for row in late: # Back-dated API posts / CSV rows, one at a time
+        for store in stores:
+            store.load([dict(row)])
+    cold_id = next(iter(tiered.cold.segments[0].column("id")))
+    for store in stores:
+        store.update(cold_id, name="Edited", amount=999.0)
+        store.add("Late typed entry", 55.0, "Food", datetime(2020, 7, 1))
+    assert len(tiered.cold.segments) == segments
+    assert len(tiered._rows) == hot # Nothing thawed stays hot
+    assert cold_id in tiered.cold.where and tiered.get(cold_id)["name"] == "Edited"
+    assert_same(flat, tiered)
+
+    for store in stores:
+        store.undo()
+        store.undo()
+    assert len(tiered._rows) == hot and tiered.get(cold_id)["amount"] != 999.0
+    assert_same(flat, tiered)
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from expense_store import ExpenseStore
+
+
+def snapshot(store):
+    return [(e["id"], e["name"], e["amount"], e["category"], e["date"], tuple(e["tags"])) for e in store]
+
+
+def make_store(**kwargs):
+    store = ExpenseStore(**kwargs)
+    store.add("Coffee", 120.0, "Food", datetime(2024, 3, 1, 9))
+    store.add("Metro", 40.0, "Transportation", datetime(2024, 3, 2, 8))
+    store.add("Power bill", 1800.0, "Utilities", datetime(2024, 3, 5, 18), tags="home")
+    return store
+
+
+def test_undo_redo_add_remove_update():
+    store = make_store()
+    start = snapshot(store)
+    total = store.total
+
+    expense = store.add("Dinner", 900.0, "Food", datetime(2024, 3, 6, 21))
+    store.remove(store[-1]["id"])
+    store.update(expense["id"], amount=950.0, tags="friends")
+    after = snapshot(store)
+
+    assert store.undo() == "update"
+    assert store.get(expense["id"])["amount"] == 900.0
+    assert store.undo() == "remove"
+    assert store.undo() == "add"
+    assert snapshot(store) == start
+    assert store.total == total
+
+    for op in ("add", "remove", "update"):
+        assert store.redo() == op
+    assert snapshot(store) == after
+    assert store.redo() is None
+
+
+def test_undo_clear_restores_everything():
+    store = make_store()
+    start, totals = snapshot(store), store.category_totals()
+    store.clear()
+    assert len(store) == 0 and store.total == 0
+    assert store.undo() == "clear"
+    assert snapshot(store) == start
+    assert store.category_totals() == totals
+    assert store.redo() == "clear"
+    assert len(store) == 0
+
+
+def test_new_operation_drops_redo():
+    store = make_store()
+    store.add("Snack", 50.0, "Food", datetime(2024, 3, 7))
+    store.undo()
+    assert store.can_redo
+    store.add("Tea", 30.0, "Food", datetime(2024, 3, 7))
+    assert not store.can_redo
+    assert store.redo() is None
+
+
+def test_history_limit_keeps_newest():
+    store = ExpenseStore(history_limit=3)
+    for i in range(10):
+        store.add(f"Item {i}", 10.0 + i, "Others", datetime(2024, 1, 1 + i))
+    undone = 0
+    while store.undo():
+        undone += 1
+    assert undone == 3
+    assert [e["name"] for e in store] == [f"Item {i}" for i in reversed(range(7))]
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""Cold tier for the expense store: sealed, compressed, columnar segments.
+
+A Segment holds an immutable block of expenses (one year when sealed by
+ExpenseStore.seal) as separately zlib-compressed columns: ids, dictionary
+encoded names / categories / tag sets, amounts and dates (microseconds
+since 1970). Next to the columns it keeps zone maps that are never
+compressed: row count, date and amount min/max, the set of categories and
+tags, per-tag totals, and the set of search trigrams. Queries use the zone
+maps to skip whole segments; a column is only decompressed when a query
+actually needs it, and only a few segments stay decoded at a time.
+
+Segments are never changed in place. A late row for a sealed year, or an
+edit of a sealed row, rebuilds just that year's segment from its decoded
+columns (no row dicts), so each year keeps exactly one segment.
+"""
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import json
+import zlib
+
+from expense_store import search_fields, trigrams
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_DAY_MICROS = 86400 * 10 ** 6
+
+
+def to_micros(date):
+    return (date - EPOCH) // _MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _pack(data):
+    return zlib.compress(data, 1) # ~4x faster than the default for ~6% more bytes; segments get rebuilt on edits
+
+
+def _pack_json(value):
+    return _pack(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def _merge_codes(encoded, new_values, order):
+    """A dictionary column (values, codes) with `new_values` added, rows in
+    `order` (see Segment._rebuilt)."""
+    values, codes = encoded
+    values = list(values)
+    lookup = {value: code for code, value in enumerate(values)}
+    new_codes = []
+    for value in new_values:
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(values)
+            values.append(value)
+        new_codes.append(code)
+    return values, array('I', (codes[i] if i >= 0 else new_codes[~i] for i in order))
+
+
+def _dictionary(values):
+    """Dictionary-encodes values: returns (distinct values, array of codes)."""
+    codes = {}
+    encoded = array('I', (codes.setdefault(value, len(codes)) for value in values))
+    return list(codes), encoded
+
+
+class Segment:
+    def __init__(self, rows):
+        """`rows`: expense dicts in ascending (date, id) order."""
+        grams = set()
+        for row in rows: # Distinct fields repeat a lot, trigrams() is cached
+            for field in search_fields(row):
+                grams |= trigrams(field)
+        self._set_columns(
+            [row["id"] for row in rows],
+            _dictionary(row["name"] for row in rows),
+            _dictionary(row["category"] for row in rows),
+            _dictionary(tuple(row.get("tags", ())) for row in rows),
+            array('d', (row["amount"] for row in rows)),
+            array('q', (to_micros(row["date"]) for row in rows)),
+            frozenset(grams),
+        )
+
+    def _set_columns(self, ids, names, categories, tags, amounts, micros, grams):
+        """Zone maps and compressed columns from decoded ones; dictionary
+        columns come as (distinct values, codes). Trigrams may be a superset."""
+        self.count = len(ids)
+        self.min_key = (from_micros(micros[0]), ids[0])
+        self.max_key = (from_micros(micros[-1]), ids[-1])
+        self.min_date, self.max_date = self.min_key[0], self.max_key[0]
+        self.min_amount, self.max_amount = min(amounts), max(amounts)
+        self.total = sum(amounts)
+
+        category_values, category_codes = categories
+        self.categories = frozenset(category_values[code] for code in set(category_codes))
+        tag_sets, tag_codes = tags
+        by_code = {} # Sum per distinct tag set first: far fewer sets than rows
+        for code, amount in zip(tag_codes, amounts):
+            total, count = by_code.get(code, (0, 0))
+            by_code[code] = (total + amount, count + 1)
+        self.tag_totals = {}
+        for code, (amount, count) in by_code.items():
+            for tag in tag_sets[code]:
+                old_total, old_count = self.tag_totals.get(tag, (0, 0))
+                self.tag_totals[tag] = (old_total + amount, old_count + count)
+        self.trigrams = grams
+
+        self._columns = {
+            "id": _pack_json(ids),
+            "name": (_pack_json(names[0]), _pack(names[1].tobytes())),
+            "category": (_pack_json(category_values), _pack(category_codes.tobytes())),
+            "tags": (_pack_json(tag_sets), _pack(tag_codes.tobytes())),
+            "amount": _pack(amounts.tobytes()),
+            "date": _pack(micros.tobytes()),
+        }
+        self._decoded = {} # column -> decoded values (dropped when the tier evicts this segment)
+
+    def _rebuilt(self, order, rows=(), grams=frozenset()):
+        """A new segment from this one's rows and `rows`, in `order`: a position
+        here (>= 0) or ~index into `rows`. Works on the columns, no row dicts
+        are built, so it costs a decompress and recompress of the segment."""
+        ids, amounts, micros = self.column("id"), self.column("amount"), self.micros()
+        new_ids = [row["id"] for row in rows]
+        new_amounts = [row["amount"] for row in rows]
+        new_micros = [to_micros(row["date"]) for row in rows]
+        segment = Segment.__new__(Segment)
+        segment._set_columns(
+            [ids[i] if i >= 0 else new_ids[~i] for i in order],
+            _merge_codes(self.encoded("name"), [row["name"] for row in rows], order),
+            _merge_codes(self.encoded("category"), [row["category"] for row in rows], order),
+            _merge_codes(self.encoded("tags"), [tuple(row.get("tags", ())) for row in rows], order),
+            array('d', (amounts[i] if i >= 0 else new_amounts[~i] for i in order)),
+            array('q', (micros[i] if i >= 0 else new_micros[~i] for i in order)),
+            self.trigrams | grams,
+        )
+        return segment
+
+    def merged(self, rows):
+        """A new segment holding this one's rows plus `rows` (ascending (date, id))."""
+        grams = set()
+        for row in rows:
+            for field in search_fields(row):
+                grams |= trigrams(field)
+        micros, ids = self.micros(), self.column("id")
+        order = []
+        start = 0
+        for j, row in enumerate(rows):
+            key = to_micros(row["date"])
+            position = bisect_left(micros, key, start)
+            while position < self.count and micros[position] == key and ids[position] < row["id"]:
+                position += 1
+            order.extend(range(start, position))
+            order.append(~j)
+            start = position
+        order.extend(range(start, self.count))
+        return self._rebuilt(order, rows, frozenset(grams))
+
+    def without(self, expense_id):
+        """(a new segment without row `expense_id`, or None if it was the only
+        one; the removed row)."""
+        position = self.positions()[expense_id]
+        row = self.row(position)
+        if self.count == 1:
+            return None, row
+        return self._rebuilt([i for i in range(self.count) if i != position]), row
+
+    def __repr__(self):
+        return f"Segment({self.count} rows, {self.min_date:%Y-%m-%d}..{self.max_date:%Y-%m-%d})"
+
+    @property
+    def compressed_bytes(self):
+        return sum(sum(map(len, data)) if isinstance(data, tuple) else len(data) for data in self._columns.values())
+
+    # --- Columns (decompressed on first use) ---
+    def column(self, name):
+        """Per-row values of a column."""
+        values = self._decoded.get(name)
+        if values is None:
+            if isinstance(self._columns[name], tuple):
+                dictionary, codes = self.encoded(name)
+                values = [dictionary[code] for code in codes]
+            else:
+                values = self._decode(name)
+            self._decoded[name] = values
+        return values
+
+    def encoded(self, name):
+        """(distinct values, per-row codes) of a dictionary-encoded column, so
+        filters can test each distinct value once."""
+        key = name + ":codes"
+        encoded = self._decoded.get(key)
+        if encoded is None:
+            dictionary_data, codes_data = self._columns[name]
+            dictionary = json.loads(zlib.decompress(dictionary_data))
+            if name == "tags":
+                dictionary = [tuple(tags) for tags in dictionary]
+            codes = array('I')
+            codes.frombytes(zlib.decompress(codes_data))
+            encoded = self._decoded[key] = (dictionary, codes)
+        return encoded
+
+    def _decode(self, name):
+        data = self._columns[name]
+        if name == "id":
+            return json.loads(zlib.decompress(data))
+        if name == "amount":
+            values = array('d')
+            values.frombytes(zlib.decompress(data))
+            return values
+        return [from_micros(us) for us in self.micros()] # date
+
+    def micros(self):
+        """The date column as raw microseconds; cheap to bisect and compare,
+        datetimes are only built for rows that are returned."""
+        micros = self._decoded.get("date:micros")
+        if micros is None:
+            micros = self._decoded["date:micros"] = array('q')
+            micros.frombytes(zlib.decompress(self._columns["date"]))
+        return micros
+
+    def day_string(self, i, cache):
+        """'YYYY-MM-DD' of row i; `cache` (day number -> string) is shared by the caller."""
+        day = self.micros()[i] // _DAY_MICROS
+        text = cache.get(day)
+        if text is None:
+            text = cache[day] = from_micros(day * _DAY_MICROS).strftime('%Y-%m-%d')
+        return text
+
+    def drop_decoded(self):
+        self._decoded.clear()
+
+    def rows(self):
+        """All rows as expense dicts, ascending by (date, id)."""
+        rows = self._decoded.get("rows")
+        if rows is None:
+            ids, names, amounts = self.column("id"), self.column("name"), self.column("amount")
+            categories, dates, tags = self.column("category"), self.column("date"), self.column("tags")
+            rows = self._decoded["rows"] = [
+                {"id": ids[i], "name": names[i], "amount": amounts[i], "category": categories[i],
+                 "date": dates[i], "tags": tags[i]}
+                for i in range(self.count)
+            ]
+        return rows
+
+    def row(self, i):
+        return {"id": self.column("id")[i], "name": self.column("name")[i], "amount": self.column("amount")[i],
+                "category": self.column("category")[i], "date": from_micros(self.micros()[i]), "tags": self.column("tags")[i]}
+
+    def rows_at(self, positions):
+        """Expense dicts for the given positions only."""
+        rows = self._decoded.get("rows")
+        if rows is not None:
+            return [rows[i] for i in positions]
+        ids, amounts, micros = self.column("id"), self.column("amount"), self.micros()
+        (names, name_codes), (categories, category_codes), (tag_sets, tag_codes) = (
+            self.encoded("name"), self.encoded("category"), self.encoded("tags"))
+        return [{"id": ids[i], "name": names[name_codes[i]], "amount": amounts[i],
+                 "category": categories[category_codes[i]], "date": from_micros(micros[i]),
+                 "tags": tag_sets[tag_codes[i]]} for i in positions]
+
+    def positions(self):
+        """id -> row position (built on first lookup)."""
+        positions = self._decoded.get("positions")
+        if positions is None:
+            positions = self._decoded["positions"] = {expense_id: i for i, expense_id in enumerate(self.column("id"))}
+        return positions
+
+    def date_slice(self, low, high):
+        """Row positions [lo, hi) with low <= date < high (None = open)."""
+        if (low is None or low <= self.min_date) and (high is None or self.max_date < high):
+            return 0, self.count # Zone map: whole segment, nothing to decode
+        micros = self.micros()
+        lo = bisect_left(micros, to_micros(low)) if low is not None else 0
+        hi = bisect_left(micros, to_micros(high)) if high is not None else self.count
+        return lo, max(lo, hi)
+
+    # --- Zone map checks ---
+    def overlaps_dates(self, low, high):
+        return (low is None or self.max_date >= low) and (high is None or self.min_date < high)
+
+    def overlaps_amounts(self, low, high):
+        return (low is None or self.max_amount >= low) and (high is None or self.min_amount <= high)
+
+
+class ColdTier:
+    """The sealed segments of a store plus an id -> segment map."""
+
+    def __init__(self, cache_segments=2):
+        self.segments = [] # Ascending by min_key
+        self.where = {} # expense id -> Segment
+        self.cache_segments = cache_segments # How many segments may stay decoded
+        self._recent = OrderedDict() # Decoded segments, least recently used first
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return bool(self.segments)
+
+    def add(self, segment):
+        self.segments.append(segment)
+        self.segments.sort(key=lambda s: s.min_key)
+        self.where.update(dict.fromkeys(segment.column("id"), segment))
+        self._count += segment.count
+        self.touch(segment)
+
+    def remove(self, segment):
+        self.segments.remove(segment)
+        for expense_id in segment.column("id"):
+            del self.where[expense_id]
+        self._count -= segment.count
+        self._recent.pop(id(segment), None)
+
+    def replace(self, old, new):
+        """Swaps segment `old` for `new` (None: just drop `old`)."""
+        self.remove(old)
+        if new is not None:
+            self.add(new)
+
+    def seal(self, rows):
+        """Seals `rows` (ascending, all in one year) into that year's segment,
+        or a new one if the year has none yet."""
+        year = rows[0]["date"].year
+        for segment in self.segments:
+            if segment.min_date.year == year:
+                self.replace(segment, segment.merged(rows))
+                return
+        self.add(Segment(rows))
+
+    def thaw(self, expense_id):
+        """Takes one row out of its segment (rebuilt without it) and returns it."""
+        segment = self.where[expense_id]
+        smaller, row = segment.without(expense_id)
+        self.replace(segment, smaller)
+        return row
+
+    def touch(self, segment):
+        """Marks `segment` as used; evicts the decoded columns of the least recently used ones."""
+        recent = self._recent
+        recent[id(segment)] = segment
+        recent.move_to_end(id(segment))
+        while len(recent) > self.cache_segments:
+            _, old = recent.popitem(last=False)
+            old.drop_decoded()
+
+    def rows(self, segment):
+        self.touch(segment)
+        return segment.rows()
+
+    def get(self, expense_id):
+        segment = self.where.get(expense_id)
+        if segment is None:
+            return None
+        self.touch(segment)
+        return segment.row(segment.positions()[expense_id])
+
+    def ids(self):
+        return iter(self.where)
+
+    def categories(self):
+        result = set()
+        for segment in self.segments:
+            result |= segment.categories
+        return result
+
+    def tag_totals(self):
+        result = {}
+        for segment in self.segments:
+            for tag, (total, count) in segment.tag_totals.items():
+                old_total, old_count = result.get(tag, (0, 0))
+                result[tag] = (old_total + total, old_count + count)
+        return result
+
+    def rows_between(self, low, high):
+        """Rows with low <= date < high from every overlapping segment, ascending."""
+        rows = []
+        for segment in self.segments:
+            if segment.overlaps_dates(low, high):
+                lo, hi = segment.date_slice(low, high)
+                if hi > lo:
+                    rows.extend(self.rows(segment)[lo:hi])
+        return rows
+
+    def iter_newest_first(self, segment):
+        rows = self.rows(segment)
+        for i in range(len(rows) - 1, -1, -1):
+            yield rows[i]
+
+    def amount_extreme(self, highest, beat=None):
+        """The highest (or lowest) amount row, only decoding segments whose
+        zone map can beat `beat` (an amount already found elsewhere)."""
+        best = None
+        order = sorted(self.segments, key=lambda s: s.max_amount if highest else s.min_amount, reverse=highest)
+        for segment in order:
+            bound = segment.max_amount if highest else segment.min_amount
+            if beat is not None and (bound <= beat if highest else bound >= beat):
+                break # Sorted by the bound: no later segment can win either
+            self.touch(segment)
+            amounts = segment.column("amount")
+            pick = max if highest else min
+            position = pick(range(segment.count), key=amounts.__getitem__)
+            row = segment.rows()[position]
+            if best is None or (row["amount"] > best["amount"] if highest else row["amount"] < best["amount"]):
+                best = row
+                beat = row["amount"]
+        return best